@@ -0,0 +1,121 @@
+"""
+Batch jobs crawling several seed papers and PapersWithCode methods as one combined crawl. The seeds and the papers of
+the methods start a single breadth-first crawl sharing its state, visited set, caches and writer, so a paper reached by
+several jobs is fetched, parsed and written once. Every paper and citation written records the sources that reached it
+in its sources property: the seed's arXiv id, or "method:<name>" for the papers of a method.
+"""
+
+
+import hashlib
+import logging
+import os
+from typing import Iterable, List, Optional
+from recursiveCrawler import RecursiveCrawler
+from citationGraph import CitationGraph
+from utils import strip_version
+from crawlConfig import get_config
+
+
+logger = logging.getLogger(__name__)
+
+METHOD_PREFIX = "method:"
+
+
+def method_source(method_name: str) -> str:
+    return f"{METHOD_PREFIX}{method_name}"
+
+
+def method_paper_ids(method_name: str) -> List[str]:
+    """
+    Version-less arXiv ids of the papers of a PapersWithCode method.
+    """
+    from papersWithCodeCrawler import scrape_paper_ids_from_method_page
+
+    return list(dict.fromkeys(strip_version(paper_id) for paper_id in scrape_paper_ids_from_method_page(method_name)))
+
+
+class BatchCrawler(RecursiveCrawler):
+    def __init__(
+        self,
+        seeds: Iterable[str] = (),
+        methods: Iterable[str] = (),
+        max_depth: int = 1,
+        state_path: Optional[str] = None,
+        **options,
+    ):
+        """
+        Crawls up to max_depth citations away from the seed papers and from the papers of the methods. The result is the
+        union of the crawls of each seed and method, every paper being crawled at its smallest distance to one of them.
+        state_path defaults to a file named after the seeds and methods, so rerunning the same batch resumes it.
+        options are those of RecursiveCrawler.
+        """
+        self.seeds = list(dict.fromkeys(strip_version(seed) for seed in seeds))
+        self.methods = list(dict.fromkeys(methods))
+        if not self.seeds and not self.methods:
+            raise ValueError("A batch needs at least one seed or method")
+        name = f"batch-{self.job_id()}"
+        if state_path is None and options.get("state") is None:
+            state_dir = get_config().crawl_state_dir
+            os.makedirs(state_dir, exist_ok=True)
+            state_path = os.path.join(state_dir, f"{name}.sqlite")
+        super().__init__(name, max_depth, state_path=state_path, **options)
+
+    def job_id(self) -> str:
+        """
+        Identifies the set of seeds and methods, whatever their order.
+        """
+        sources = sorted(self.seeds) + sorted(method_source(method) for method in self.methods)
+        return hashlib.blake2b("\n".join(sources).encode("utf-8"), digest_size=6).hexdigest()
+
+    def add_sources(self) -> None:
+        """
+        Adds the seeds and the papers of the methods to the frontier at depth 0.
+        """
+        for seed in self.seeds:
+            self.state.add_seeds(seed, [seed])
+        self.visited_ids.add(self.seeds, 0)
+        for method in self.methods:
+            paper_ids = method_paper_ids(method)
+            logger.info("%d papers for method %s", len(paper_ids), method)
+            self.state.add_seeds(method_source(method), paper_ids)
+            self.visited_ids.add(paper_ids, 0)
+        self.state.checkpoint()
+
+    def save_provenance(self) -> None:
+        """
+        Records on the written papers and citations the sources that reached them, within max_depth citations.
+        """
+        papers, relations = 0, 0
+        for arxiv_id, sources in self.state.provenance(self.max_depth):
+            self.writer.add_sources(arxiv_id, sources)
+            papers += 1
+        for source, target, sources in self.state.relation_provenance(self.max_depth):
+            self.writer.add_relation_sources(source, target, sources)
+            relations += 1
+        self.writer.flush()
+        logger.info("Recorded the sources of %d papers and %d citations", papers, relations)
+
+    def run(self) -> None:
+        """
+        Crawls the batch, then records the provenance of what was written.
+        """
+        logger.info("Batch of %d seeds and %d methods: %s", len(self.seeds), len(self.methods), self.initial_id)
+        self.add_sources()
+        self.crawl()
+        self.save_provenance()
+
+    def citation_graph(self) -> CitationGraph:
+        graph = CitationGraph()
+        for seed in self.seeds:
+            graph.add_node(seed)
+        for article_id, ref_id in self.state.relations():
+            graph.add_edge(article_id, ref_id)
+        return graph
+
+
+if __name__ == "__main__":
+    from crawlMetrics import configure_logging
+
+    configure_logging()
+    crawler = BatchCrawler(seeds=["1805.08355", "1706.03762"], methods=["rlaif"], max_depth=1)
+    crawler.run()
@@ -0,0 +1,379 @@
+"""
+End-to-end benchmark of the crawlers, fully offline: RecursiveCrawler and compute_method_graph run against the local
+stand-in services of benchmarkServer and write to an in-memory graph sink. Reports papers per second, the latency of
+each stage (see crawlMetrics) and the peak memory of the crawler and of its PDF parsing workers.
+Each scenario runs in a fresh process, so peak memory is measured per scenario. The refresh scenario revises a
+fraction of the papers after a full crawl and times the refresh crawl, comparing its traffic with the full crawl's.
+The batch scenario crawls --seeds seed papers and the method as one BatchCrawler job.
+
+Usage: python benchmarkCrawler.py [--scenario crawl|method|refresh|batch|all] [--papers N] [--depth N] [--workers N]
+                                  [--mode fast|fast-raw|full] [--latency-ms N] [--error-rate F] [--db-latency-ms N]
+                                  [--pages N] [--revised F] [--seeds N] [--log-level LEVEL]
+                                  [--json results.json] [--baseline results.json] [--tolerance F]
+--baseline compares the throughput with a previous --json file and exits with an error if a scenario is slower
+by more than the tolerance (default 0.2).
+"""
+
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple
+from benchmarkServer import METHOD_NAME, StandInServer, SyntheticCorpus
+from crawlMetrics import SUMMARY_STAGES, configure_logging, get_metrics
+from graphWriter import (
+    PAPER_SOURCES_QUERY, PAPERS_QUERY, RELATION_SOURCES_QUERY, RELATIONS_QUERY, REMOVE_RELATIONS_QUERY, GraphWriter,
+)
+
+
+SCENARIOS = ("crawl", "method", "refresh", "batch")
+
+QUERY_KINDS = {
+    PAPERS_QUERY: "papers",
+    RELATIONS_QUERY: "relations",
+    REMOVE_RELATIONS_QUERY: "removed_relations",
+    PAPER_SOURCES_QUERY: "paper_sources",
+    RELATION_SOURCES_QUERY: "relation_sources",
+}
+
+
+class RecordingSession:
+    def __init__(self, writer: "RecordingGraphWriter"):
+        """
+        Stands in for a Neo4j session and its transactions, see GraphWriter._write.
+        """
+        self.writer = writer
+
+    def execute_write(self, work):
+        return work(self)
+
+    def run(self, query: str, rows: List[dict]) -> "RecordingSession":
+        self.writer.record(query, rows)
+        return self
+
+    def consume(self) -> None:
+        pass
+
+    def __enter__(self) -> "RecordingSession":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+class RecordingGraphWriter(GraphWriter):
+    def __init__(self, batch_size: int = 1000, flush_interval: float = 5.0, latency: float = 0.0):
+        """
+        In-memory graph sink: buffers like a GraphWriter but records the write batches instead of sending them to Neo4j,
+        each batch taking latency seconds.
+        """
+        super().__init__(batch_size, flush_interval)
+        self.latency = latency
+        self.batches: List[Tuple[str, int]] = []
+        self.papers_written: Set[str] = set()
+        self.relations_written: Set[Tuple[str, str]] = set()
+        self.relations_removed: Set[Tuple[str, str]] = set()
+        self.recorded_paper_sources: Dict[str, Set[str]] = {}
+        self.recorded_relation_sources: Dict[Tuple[str, str], Set[str]] = {}
+
+    def _session(self) -> RecordingSession:
+        return RecordingSession(self)
+
+    def record(self, query: str, rows: List[dict]) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        kind = QUERY_KINDS[query]
+        self.batches.append((kind, len(rows)))
+        for row in rows:
+            if kind == "papers":
+                self.papers_written.add(row["key"])
+            elif kind == "relations":
+                self.relations_written.add((row["source"], row["target"]))
+            elif kind == "removed_relations":
+                self.relations_removed.add((row["source"], row["target"]))
+            elif kind == "paper_sources":
+                self.recorded_paper_sources.setdefault(row["key"], set()).update(row["sources"])
+            else:
+                self.recorded_relation_sources.setdefault((row["source"], row["target"]), set()).update(row["sources"])
+
+
+def expected_crawl(corpus: SyntheticCorpus, seed: str, max_depth: int) -> Set[str]:
+    """
+    Papers within max_depth citations of seed, i.e. the papers a complete crawl writes.
+    """
+    depths = {seed: 0}
+    queue = deque([seed])
+    while queue:
+        arxiv_id = queue.popleft()
+        if depths[arxiv_id] == max_depth:
+            continue
+        for ref_id in corpus.references[arxiv_id]:
+            if ref_id not in depths:
+                depths[ref_id] = depths[arxiv_id] + 1
+                queue.append(ref_id)
+    return set(depths)
+
+
+def run_crawl(
+    corpus: SyntheticCorpus, args: argparse.Namespace, workdir: str, writer: RecordingGraphWriter, refresh: bool = False
+) -> dict:
+    from recursiveCrawler import RecursiveCrawler
+    from pdfCache import PdfCache
+    from metadataIndex import MetadataIndex
+
+    seed, max_depth, workers = corpus.ids[0], args.depth, args.workers
+    crawler = RecursiveCrawler(
+        seed,
+        max_depth,
+        max_workers=workers,
+        host_limits={"127.0.0.1": workers},
+        cache=PdfCache(os.path.join(workdir, "pdfs")),
+        extraction_mode=args.mode,
+        writer=writer,
+        state_path=os.path.join(workdir, "state.sqlite"),
+        metadata_index=MetadataIndex(os.path.join(workdir, "metadata.sqlite")),
+        refresh=refresh,
+    )
+    crawler.crawl_article(seed, 0)
+    return {"papers": len(writer.papers_written), "expected_papers": len(expected_crawl(corpus, seed, max_depth))}
+
+
+def run_method(corpus: SyntheticCorpus, args: argparse.Namespace, workdir: str, writer: RecordingGraphWriter) -> dict:
+    from papersWithCodeCrawler import compute_method_citation_graph
+
+    graph = compute_method_citation_graph(METHOD_NAME, args.mode)
+    return {"papers": len(graph), "expected_papers": len(corpus.method_ids), "citations": graph.num_edges}
+
+
+def run_refresh(corpus: SyntheticCorpus, args: argparse.Namespace, workdir: str, writer: RecordingGraphWriter) -> dict:
+    """
+    A full crawl, then the revision of a fraction --revised (default 0.05) of the papers on the server and a refresh
+    crawl written to writer. The scenario is timed from the start of the refresh.
+    """
+    from httpClient import get_client
+
+    metrics = get_metrics()
+    seed, max_depth = corpus.ids[0], args.depth
+    expected = expected_crawl(corpus, seed, max_depth)
+    start = time.perf_counter()
+    full_writer = RecordingGraphWriter()
+    run_crawl(corpus, args, workdir, full_writer)
+    full_writer.close()
+    full_seconds = time.perf_counter() - start
+    full_requests, full_bytes = metrics.counter("http_requests"), metrics.counter("http_response_bytes")
+
+    count = max(1, int(args.revised * len(corpus.ids)))
+    # The local copy of the corpus is revised like the server's, from the same seed
+    response = get_client().get(f"{os.environ['PAPERSWITHCODE_URL']}/_bump", params={"count": count})
+    if response.json() != corpus.bump(count):
+        raise RuntimeError("The stand-in server revised other papers than the local corpus")
+
+    start = time.perf_counter()
+    run_crawl(corpus, args, workdir, writer, refresh=True)
+    return {
+        "papers": len(full_writer.papers_written | writer.papers_written),
+        "expected_papers": len(expected | expected_crawl(corpus, seed, max_depth)),
+        "start": start,
+        "revised": count,
+        "papers_rewritten": len(writer.papers_written),
+        "relations_added": len(writer.relations_written - full_writer.relations_written),
+        "relations_removed": len(writer.relations_removed),
+        "full_seconds": full_seconds,
+        "requests_ratio": (metrics.counter("http_requests") - full_requests) / full_requests,
+        "bytes_ratio": (metrics.counter("http_response_bytes") - full_bytes) / full_bytes,
+    }
+
+
+def run_batch(corpus: SyntheticCorpus, args: argparse.Namespace, workdir: str, writer: RecordingGraphWriter) -> dict:
+    """
+    One BatchCrawler job over the first --seeds (default 4) papers of the corpus and the method.
+    """
+    from batchCrawler import BatchCrawler
+    from pdfCache import PdfCache
+    from metadataIndex import MetadataIndex
+
+    seeds, max_depth, workers = corpus.ids[:args.seeds], args.depth, args.workers
+    crawler = BatchCrawler(
+        seeds,
+        [METHOD_NAME],
+        max_depth,
+        max_workers=workers,
+        host_limits={"127.0.0.1": workers},
+        cache=PdfCache(os.path.join(workdir, "pdfs")),
+        extraction_mode=args.mode,
+        writer=writer,
+        state_path=os.path.join(workdir, "state.sqlite"),
+        metadata_index=MetadataIndex(os.path.join(workdir, "metadata.sqlite")),
+    )
+    crawler.run()
+    crawls = [expected_crawl(corpus, seed, max_depth) for seed in seeds + corpus.method_ids]
+    method_papers = set().union(*crawls[len(seeds):])
+    return {
+        "papers": len(writer.papers_written),
+        "expected_papers": len(set().union(*crawls)),
+        "papers_summed_over_jobs": sum(len(crawl) for crawl in crawls[:len(seeds)]) + len(method_papers),
+        "papers_with_sources": len(writer.recorded_paper_sources),
+    }
+
+
+def run_scenario(scenario: str, args: argparse.Namespace, urls: Dict[str, str], results: multiprocessing.Queue) -> None:
+    """
+    Runs one scenario in this process, against the stand-in server at urls. Only the metrics of the crawl are recorded.
+    """
+    workdir = tempfile.mkdtemp(prefix="crawl-benchmark-")
+    # Read by the first get_config of this process, see crawlConfig
+    os.environ.update(urls)
+    os.environ["PDF_CACHE_DIR"] = os.path.join(workdir, "pdfs")
+    os.environ["PAPER_ID_CACHE"] = os.path.join(workdir, "paper_ids.sqlite")
+    os.environ["RESPONSE_CACHE"] = os.path.join(workdir, "responses.sqlite")
+    from httpClient import HttpClient, set_client
+
+    # The retries of injected errors would be logged as warnings
+    configure_logging(args.log_level)
+    # The stand-ins are not rate limited, unlike the real services
+    set_client(HttpClient(rate_limits={"127.0.0.1": (1000.0, 100)}, backoff=0.05))
+    corpus = corpus_from_args(args)
+    writer = RecordingGraphWriter(latency=args.db_latency_ms / 1000)
+    try:
+        start = time.perf_counter()
+        result = {"crawl": run_crawl, "method": run_method, "refresh": run_refresh, "batch": run_batch}[scenario](corpus, args, workdir, writer)
+        writer.close()
+        elapsed = time.perf_counter() - result.pop("start", start)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # Workers of pools shut down without waiting only count in RUSAGE_CHILDREN once they are reaped
+    deadline = time.monotonic() + 10
+    while multiprocessing.active_children() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    metrics = get_metrics()
+    stages = {}
+    for stage in SUMMARY_STAGES:
+        histogram = metrics.histogram(stage)
+        if histogram.count:
+            stages[stage] = {
+                "count": histogram.count,
+                "mean_ms": 1000 * histogram.sum / histogram.count,
+                "p95_ms": 1000 * histogram.quantile(0.95),
+            }
+    result.update({
+        "seconds": elapsed,
+        "papers_per_second": result["papers"] / elapsed,
+        "stages": stages,
+        "http_retries": metrics.counter("http_retries"),
+        "write_batches": len(writer.batches),
+        "rows_written": writer.rows_written,
+        # ru_maxrss is in kilobytes on Linux, the children are the PDF parsing workers
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_worker_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    })
+    results.put(result)
+
+
+def corpus_from_args(args: argparse.Namespace) -> SyntheticCorpus:
+    return SyntheticCorpus(args.papers, body_pages=args.pages)
+
+
+def print_result(scenario: str, result: dict) -> None:
+    print(
+        f"{scenario}: {result['papers']}/{result['expected_papers']} papers in {result['seconds']:.1f}s, "
+        f"{result['papers_per_second']:.1f} papers/s, peak memory {result['peak_rss_mb']:.0f} MB "
+        f"(parse workers {result['peak_worker_rss_mb']:.0f} MB), {result['write_batches']} write batches, "
+        f"{result['http_retries']:.0f} retries"
+    )
+    print(f"  {'stage':<16}{'count':>8}{'mean ms':>10}{'p95 ms <=':>11}")
+    for stage, latency in result["stages"].items():
+        print(f"  {stage:<16}{latency['count']:>8}{latency['mean_ms']:>10.1f}{latency['p95_ms']:>11.0f}")
+    if "full_seconds" in result:
+        print(
+            f"  refresh after {result['revised']} revisions: {result['seconds'] / result['full_seconds']:.0%} of the "
+            f"full crawl's time, {result['requests_ratio']:.0%} of its requests, {result['bytes_ratio']:.0%} of its "
+            f"bytes; {result['papers_rewritten']} papers rewritten, {result['relations_added']} citations added, "
+            f"{result['relations_removed']} removed"
+        )
+    if "papers_summed_over_jobs" in result:
+        print(
+            f"  {result['papers_summed_over_jobs']} papers summed over the separate jobs, "
+            f"{result['papers_with_sources']} papers written with their sources"
+        )
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> bool:
+    """
+    Prints the throughput change of each scenario. Returns False if one regressed by more than tolerance.
+    """
+    ok = True
+    for scenario, result in results.items():
+        if scenario not in baseline:
+            continue
+        change = result["papers_per_second"] / baseline[scenario]["papers_per_second"] - 1
+        regressed = change < -tolerance
+        ok = ok and not regressed
+        print(f"{scenario}: {change:+.1%} papers/s compared to the baseline{' (REGRESSION)' if regressed else ''}")
+    return ok
+
+
+def parser() -> argparse.ArgumentParser:
+    from processPdf import EXTRACTION_MODES
+
+    parser = argparse.ArgumentParser(
+        prog="benchmarkCrawler.py", description="Offline end-to-end benchmark of the crawlers against stand-in services."
+    )
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--papers", type=int, default=300, help="papers in the synthetic corpus")
+    parser.add_argument("--pages", type=int, default=6, help="body pages per PDF")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--mode", choices=EXTRACTION_MODES, default="fast")
+    parser.add_argument("--latency-ms", type=float, default=20, help="latency of the stand-in services")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="fraction of requests answered by a 503")
+    parser.add_argument("--db-latency-ms", type=float, default=0, help="latency of each graph write batch")
+    parser.add_argument("--revised", type=float, default=0.05, help="fraction of the papers revised by refresh")
+    parser.add_argument("--seeds", type=int, default=4, help="seed papers of the batch scenario")
+    parser.add_argument("--log-level", default="ERROR")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare the throughput with the results of a previous --json")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="largest slowdown accepted by --baseline")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parser().parse_args(argv)
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+
+    server = StandInServer(corpus_from_args(args), latency=args.latency_ms / 1000, error_rate=args.error_rate)
+    results: Dict[str, dict] = {}
+    # Spawned rather than forked, so the memory of this process (the server and its PDFs) is not counted
+    context = multiprocessing.get_context("spawn")
+    with server:
+        for name in scenarios:
+            queue = context.Queue()
+            process = context.Process(target=run_scenario, args=(name, args, server.urls(), queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                raise RuntimeError(f"The {name} scenario failed with exit code {process.exitcode}")
+            results[name] = queue.get()
+            print_result(name, results[name])
+    print(server)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
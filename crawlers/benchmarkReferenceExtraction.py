@@ -0,0 +1,91 @@
+"""
+Benchmark of the PDF extraction modes on a fixed local corpus of PDFs: seconds per paper and recall of the arXiv
+references compared to the full extraction.
+
+Usage: python benchmarkReferenceExtraction.py [corpus_dir] [--download]
+--download fetches the PDFs of CORPUS_IDS missing from corpus_dir once, later runs are fully offline.
+"""
+
+
+import argparse
+import os
+import time
+from typing import Dict, List, Optional, Set
+from processPdf import EXTRACTION_MODES, download_pdf, extract_text_from_pdf_bytes
+from getReferencesArticles import extract_arxiv_references_from_article
+
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "corpus")
+
+CORPUS_IDS = [
+    "1706.03762",
+    "1805.08355",
+    "1810.04805",
+    "2005.14165",
+    "1512.03385",
+    "2303.08774",
+    "2203.02155",
+    "1710.11431",
+    "1802.02840",
+    "2309.00267",
+]
+
+
+def download_corpus(corpus_dir: str) -> None:
+    os.makedirs(corpus_dir, exist_ok=True)
+    for arxiv_id in CORPUS_IDS:
+        path = os.path.join(corpus_dir, f"{arxiv_id}.pdf")
+        if not os.path.exists(path):
+            print(f"Downloading {arxiv_id}...")
+            with open(path, "wb") as f:
+                f.write(download_pdf(f"http://arxiv.org/pdf/{arxiv_id}"))
+
+
+def run_mode(corpus: Dict[str, bytes], mode: str) -> Dict[str, object]:
+    references: Dict[str, Set[str]] = {}
+    start = time.perf_counter()
+    for name, data in corpus.items():
+        text = extract_text_from_pdf_bytes(data, mode)
+        references[name] = set(extract_arxiv_references_from_article(text))
+    elapsed = time.perf_counter() - start
+    return {"seconds_per_paper": elapsed / len(corpus), "references": references}
+
+
+def recall(expected: Dict[str, Set[str]], found: Dict[str, Set[str]]) -> float:
+    total = sum(len(refs) for refs in expected.values())
+    matched = sum(len(refs & found[name]) for name, refs in expected.items())
+    return matched / total if total else 1.0
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compares the PDF extraction modes on a local corpus of PDFs.")
+    parser.add_argument("corpus_dir", nargs="?", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--download", action="store_true", help="fetch the PDFs of CORPUS_IDS missing from corpus_dir")
+    args = parser.parse_args(argv)
+    corpus_dir = args.corpus_dir
+    if args.download:
+        download_corpus(corpus_dir)
+
+    if not os.path.isdir(corpus_dir):
+        print(f"No corpus in {corpus_dir}, run with --download first")
+        return
+    corpus = {}
+    for filename in sorted(os.listdir(corpus_dir)):
+        if filename.endswith(".pdf"):
+            with open(os.path.join(corpus_dir, filename), "rb") as f:
+                corpus[filename] = f.read()
+    if not corpus:
+        print(f"No PDF in {corpus_dir}, run with --download first")
+        return
+
+    print(f"{len(corpus)} papers in {corpus_dir}")
+    results = {mode: run_mode(corpus, mode) for mode in EXTRACTION_MODES}
+    full = results["full"]
+    print(f"{'mode':<10}{'s/paper':>10}{'speedup':>10}{'recall':>10}")
+    for mode, result in results.items():
+        speedup = full["seconds_per_paper"] / result["seconds_per_paper"]
+        print(f"{mode:<10}{result['seconds_per_paper']:>10.3f}{speedup:>9.1f}x{recall(full['references'], result['references']):>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
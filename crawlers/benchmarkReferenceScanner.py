@@ -0,0 +1,120 @@
+"""
+Micro-benchmark of the arXiv reference scanner against the previous regex: recall and precision on a labelled corpus of
+reference lists, ids returned per paper (each one a relation write and a frontier lookup downstream) and throughput.
+
+Usage: python benchmarkReferenceScanner.py [corpus.jsonl] [--size-mb N]
+"""
+
+
+import argparse
+import json
+import os
+import random
+import re
+import time
+from typing import Callable, Dict, List, Optional
+from getReferencesArticles import ReferenceScanner, extract_arxiv_references_from_article
+
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "reference_corpus.jsonl")
+
+LEGACY_PATTERN = re.compile(r"(?:arXiv:|abs/)(\d{4}\.\d{4,5})")
+
+
+def legacy_extract(text: str) -> List[str]:
+    return LEGACY_PATTERN.findall(text)
+
+
+def scan_pages(text: str, page_chars: int = 4000) -> List[str]:
+    # Chunks of a page's worth of text stand in for the pages streamed by processPdf.iter_pdf_text
+    scanner = ReferenceScanner()
+    for start in range(0, len(text), page_chars):
+        scanner.feed(text[start:start + page_chars])
+    return scanner.close()
+
+
+EXTRACTORS: Dict[str, Callable[[str], List[str]]] = {
+    "legacy": legacy_extract,
+    "scanner": extract_arxiv_references_from_article,
+    "scanner-pages": scan_pages,
+}
+
+
+def load_corpus(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(corpus: List[dict], extract: Callable[[str], List[str]]) -> Dict[str, float]:
+    expected_total = found_total = true_positives = returned = 0
+    for document in corpus:
+        references = extract(document["text"])
+        expected, found = set(document["expected"]), set(references)
+        expected_total += len(expected)
+        found_total += len(found)
+        true_positives += len(expected & found)
+        returned += len(references)
+    return {
+        "recall": true_positives / expected_total if expected_total else 1.0,
+        "precision": true_positives / found_total if found_total else 1.0,
+        "returned": returned,
+        "expected": expected_total,
+    }
+
+
+def synthetic_paper(references: str, rng: random.Random, body_chars: int = 60000) -> str:
+    """
+    A paper-sized text: a body of prose with numbers, years and section numbers but no arXiv ids,
+    followed by a references section.
+    """
+    words = [
+        "the", "model", "we", "results", "of", "training", "in", "Table", "Figure", "Section", "data", "loss",
+        "and", "a", "is", "with", "for", "on", "2019", "3.2", "0.5", "1024", "accuracy", "baseline", "see", "[12]",
+        "et", "al.", "(2020)", "layers", "attention", "p.", "12.5%", "Eq.", "(4)", "proposed", "method", "dataset",
+    ]
+    lines, size = [], 0
+    while size < body_chars:
+        line = " ".join(rng.choice(words) for _ in range(14))
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines) + "\nReferences\n" + references + "\n"
+
+
+def throughput(text: str, extract: Callable[[str], List[str]], repeat: int = 7) -> float:
+    """
+    Best MB/s over repeat runs.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extract(text)
+        best = min(best, time.perf_counter() - start)
+    return len(text) / 2**20 / best
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compares the reference scanner with the previous regex.")
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS, help="labelled reference lists, JSON lines")
+    parser.add_argument("--size-mb", type=float, default=8, help="paper text the throughput is measured on")
+    args = parser.parse_args(argv)
+    size_mb = args.size_mb
+
+    corpus = load_corpus(args.corpus)
+    # Papers whose reference sections are the labelled documents, repeated to size_mb of text
+    rng = random.Random(0)
+    papers = [synthetic_paper(document["text"], rng) for document in corpus]
+    paper_text = "".join(papers)
+    big_text = paper_text * max(1, int(size_mb * 2**20 / len(paper_text)))
+    print(f"{len(corpus)} labelled documents, throughput measured on {len(big_text) / 2**20:.1f} MB of paper text")
+
+    print(f"{'extractor':<15}{'recall':>8}{'precision':>11}{'ids returned':>14}{'MB/s':>8}")
+    for name, extract in EXTRACTORS.items():
+        scores = evaluate(corpus, extract)
+        print(
+            f"{name:<15}{scores['recall']:>8.1%}{scores['precision']:>11.1%}"
+            f"{scores['returned']:>8} / {scores['expected']:<3}{throughput(big_text, extract):>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
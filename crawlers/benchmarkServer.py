@@ -0,0 +1,303 @@
+"""
+Local stand-in for the services the crawlers call, to run them offline: the arXiv API (Atom responses to id_list and
+id: queries), arXiv PDFs, and the PapersWithCode method pages, paginated papers API and paper pages.
+Responses are rendered from a seeded synthetic corpus of papers citing each other, with configurable latency and
+injected 503 errors. 200 responses carry an ETag and answer If-None-Match with a 304, and papers can be revised
+(new version, one reference replaced) with /_bump?count=N to exercise refresh crawls. Point the crawlers at it with ARXIV_API_URL, ARXIV_PDF_URL and PAPERSWITHCODE_URL, see urls().
+
+Usage: python benchmarkServer.py [--port N] [--papers N] [--latency-ms N] [--error-rate F]
+"""
+
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from xml.sax.saxutils import escape
+from utils import strip_version
+
+
+METHOD_NAME = "synthetic-method"
+METHOD_ID = 4242
+API_PAGE_SIZE = 50  # Page size of the PapersWithCode API
+
+FILLER_WORDS = [
+    "the", "model", "we", "results", "of", "training", "in", "Table", "Figure", "Section", "data", "loss", "and", "a",
+    "is", "with", "for", "on", "2019", "3.2", "accuracy", "baseline", "see", "et", "al.", "layers", "attention",
+]
+
+
+def pdf_string(text: str) -> str:
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def make_pdf(pages: List[List[str]]) -> bytes:
+    """
+    A minimal PDF with one Helvetica text line per entry of each page.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"", b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        text = " T* ".join(f"{pdf_string(line)} Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 40 760 Td {text} ET".encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+class SyntheticCorpus:
+    def __init__(self, papers: int = 300, references: int = 8, body_pages: int = 6, method_papers: int = 60, seed: int = 0):
+        """
+        papers arXiv papers, each citing up to references papers of the corpus, with body_pages pages of prose
+        before the references page. The first method_papers papers are the papers of METHOD_NAME.
+        """
+        rng = random.Random(seed)
+        self.ids = [f"21{month:02d}.{number:05d}" for month, number in zip(rng.choices(range(1, 13), k=papers), range(papers))]
+        self.references: Dict[str, List[str]] = {
+            arxiv_id: rng.sample(self.ids, min(references, papers)) for arxiv_id in self.ids
+        }
+        self.metadata = {
+            arxiv_id: {
+                "title": f"Synthetic paper {i}",
+                "authors": [f"Author {rng.randrange(1000)}" for _ in range(rng.randint(1, 5))],
+                "published": f"20{arxiv_id[:2]}-{arxiv_id[2:4]}-15T00:00:00Z",
+            }
+            for i, arxiv_id in enumerate(self.ids)
+        }
+        self.versions = {arxiv_id: 1 for arxiv_id in self.ids}
+        self.revisions = 0
+        self.method_ids = self.ids[:method_papers]
+        self.body_pages = body_pages
+        self.seed = seed
+        self._pdfs: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def pdf(self, arxiv_id: str) -> Optional[bytes]:
+        arxiv_id = strip_version(arxiv_id)
+        if arxiv_id not in self.references:
+            return None
+        with self._lock:
+            key = f"{arxiv_id}v{self.versions[arxiv_id]}"
+            if key not in self._pdfs:
+                rng = random.Random(f"{self.seed}-{arxiv_id}")
+                pages = [
+                    [" ".join(rng.choice(FILLER_WORDS) for _ in range(16)) for _ in range(60)]
+                    for _ in range(self.body_pages)
+                ]
+                references = ["References"] + [
+                    f"[{i}] {' '.join(self.metadata[ref_id]['authors'])}. {self.metadata[ref_id]['title']}. arXiv:{ref_id}, 2021."
+                    for i, ref_id in enumerate(self.references[arxiv_id], start=1)
+                ]
+                self._pdfs[key] = make_pdf(pages + [references])
+            return self._pdfs[key]
+
+    def bump(self, count: int) -> List[str]:
+        """
+        Publishes a new version of count random papers, citing one other paper instead of one of their references.
+        Every other revised paper gets a new title too.
+        """
+        with self._lock:
+            rng = random.Random(f"{self.seed}-revision-{self.revisions}")
+            revised = rng.sample(self.ids, min(count, len(self.ids)))
+            for i, arxiv_id in enumerate(revised):
+                self.revisions += 1
+                self.versions[arxiv_id] += 1
+                references = self.references[arxiv_id]
+                candidates = [ref_id for ref_id in self.ids if ref_id not in references]
+                if references and candidates:
+                    references[rng.randrange(len(references))] = rng.choice(candidates)
+                if i % 2 == 0:
+                    self.metadata[arxiv_id]["title"] += " (revised)"
+            return revised
+
+    def link(self, arxiv_id: str) -> str:
+        return f"{arxiv_id}v{self.versions[arxiv_id]}"
+
+    def atom_feed(self, ids: List[str]) -> str:
+        entries = []
+        for arxiv_id in ids:
+            arxiv_id = strip_version(arxiv_id)
+            metadata = self.metadata.get(arxiv_id)
+            if metadata is None:
+                continue
+            updated = metadata["published"] if self.versions[arxiv_id] == 1 else f"2024-01-{self.versions[arxiv_id]:02d}T00:00:00Z"
+            authors = "".join(f"<author><name>{escape(name)}</name></author>" for name in metadata["authors"])
+            entries.append(
+                f"<entry><id>http://arxiv.org/abs/{self.link(arxiv_id)}</id><published>{metadata['published']}</published>"
+                f"<updated>{updated}</updated>"
+                f"<title>{escape(metadata['title'])}</title>{authors}</entry>"
+            )
+        return f'<?xml version="1.0" encoding="UTF-8"?><feed xmlns="http://www.w3.org/2005/Atom">{"".join(entries)}</feed>'
+
+    def paper_slug(self, arxiv_id: str) -> str:
+        return f"/paper/synthetic-{arxiv_id.replace('.', '-')}"
+
+    def api_page(self, page: int, base_url: str) -> dict:
+        start = (page - 1) * API_PAGE_SIZE
+        results = []
+        for i, arxiv_id in enumerate(self.method_ids[start:start + API_PAGE_SIZE], start=start):
+            # A third of the papers lack the arXiv fields, so their page has to be fetched as for some real papers
+            fields = {} if i % 3 == 0 else {"arxiv_id": arxiv_id, "url_abs": f"https://arxiv.org/abs/{arxiv_id}"}
+            results.append({"url": self.paper_slug(arxiv_id), **fields})
+        has_next = start + API_PAGE_SIZE < len(self.method_ids)
+        return {
+            "count": len(self.method_ids),
+            "next": f"{base_url}/api/internal/papers/?page={page + 1}" if has_next else None,
+            "results": results,
+        }
+
+
+class StandInServer:
+    def __init__(
+        self, corpus: SyntheticCorpus, port: int = 0, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0
+    ):
+        """
+        Serves the corpus on localhost (port 0 picks a free port). Every response is delayed by latency seconds,
+        and a fraction error_rate of them is replaced by a 503 with Retry-After: 0.
+        """
+        self.corpus = corpus
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def urls(self) -> Dict[str, str]:
+        """
+        The environment variables pointing the crawlers at this server.
+        """
+        return {
+            "ARXIV_API_URL": f"{self.base_url}/api/query",
+            "ARXIV_PDF_URL": f"{self.base_url}/pdf",
+            "PAPERSWITHCODE_URL": self.base_url,
+        }
+
+    def _route(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, str, bytes]:
+        corpus = self.corpus
+        if path == "/_bump":
+            revised = corpus.bump(int(query.get("count", ["1"])[0]))
+            return 200, "application/json", json.dumps(revised).encode("utf-8")
+        if path == "/api/query":
+            if "id_list" in query:
+                ids = query["id_list"][0].split(",")
+            else:
+                ids = [query.get("search_query", [""])[0].removeprefix("id:")]
+            return 200, "application/atom+xml", corpus.atom_feed(ids).encode("utf-8")
+        if path.startswith("/pdf/"):
+            pdf = corpus.pdf(path[len("/pdf/"):].removesuffix(".pdf"))
+            return (200, "application/pdf", pdf) if pdf is not None else (404, "text/plain", b"Not found")
+        if path == f"/method/{METHOD_NAME}":
+            html = f"<html><script>var DATATABLE_PAPERS_FILTER_VALUE = '{METHOD_ID}';</script></html>"
+            return 200, "text/html", html.encode("utf-8")
+        if path == "/api/internal/papers/" and query.get("papermethod__method_id") == [str(METHOD_ID)]:
+            page = int(query.get("page", ["1"])[0])
+            return 200, "application/json", json.dumps(corpus.api_page(page, self.base_url)).encode("utf-8")
+        if path.startswith("/paper/synthetic-"):
+            arxiv_id = path[len("/paper/synthetic-"):].replace("-", ".")
+            html = f'<html><a href="https://arxiv.org/pdf/{corpus.link(arxiv_id)}.pdf">PDF</a></html>'
+            return 200, "text/html", html.encode("utf-8")
+        return 404, "text/plain", b"Not found"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, as the real services
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                route = url.path.split("/")[1] or "/"
+                with server._lock:
+                    server.requests[route] = server.requests.get(route, 0) + 1
+                    fail = server._rng.random() < server.error_rate
+                    if fail:
+                        server.errors += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if fail:
+                    status, content_type, body = 503, "text/plain", b"Injected error"
+                else:
+                    status, content_type, body = server._route(url.path, parse_qs(url.query))
+                etag = f'"{hashlib.sha1(body).hexdigest()}"' if status == 200 else None
+                if etag is not None and self.headers.get("If-None-Match") == etag:
+                    status, body = 304, b""
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                if fail:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stand-in-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def __str__(self) -> str:
+        with self._lock:
+            requests = ", ".join(f"{route} {count}" for route, count in sorted(self.requests.items()))
+        return f"stand-in server: {requests}, {self.errors} injected errors"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves a synthetic corpus as stand-ins of arXiv and PapersWithCode.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--papers", type=int, default=300, help="papers in the synthetic corpus")
+    parser.add_argument("--latency-ms", type=float, default=0, help="latency added to every response")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered by a 503")
+    args = parser.parse_args()
+    corpus = SyntheticCorpus(args.papers)
+    server = StandInServer(corpus, args.port, args.latency_ms / 1000, args.error_rate)
+    for name, url in server.urls().items():
+        print(f"export {name}={url}")
+    print(f"Seed paper {corpus.ids[0]}, method {METHOD_NAME}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,143 @@
+"""
+Compact citation graph: arXiv ids are interned to integer node ids and edges are stored in flat integer arrays,
+compressed to CSR (offsets + targets) on demand. Membership is a dict lookup and memory stays a few bytes per edge.
+"""
+
+
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from utils import strip_version
+
+
+class CitationGraph:
+    def __init__(self, normalize_versions: bool = True):
+        """
+        normalize_versions keys papers by their arXiv id without version, so 2405.18952v2 and 2405.18952 are one node.
+        """
+        self.normalize_versions = normalize_versions
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        # Edges in insertion order, as parallel arrays of node ids
+        self.sources = array("i")
+        self.targets = array("i")
+        self._csr: Optional[Tuple[array, array]] = None
+
+    def _key(self, arxiv_id: str) -> str:
+        return strip_version(arxiv_id) if self.normalize_versions else arxiv_id
+
+    def add_node(self, arxiv_id: str) -> int:
+        """
+        Returns the node id of a paper, adding it if needed.
+        """
+        key = self._key(arxiv_id)
+        node = self.index.get(key)
+        if node is None:
+            node = len(self.ids)
+            key = sys.intern(key)
+            self.ids.append(key)
+            self.index[key] = node
+            self._csr = None
+        return node
+
+    def node_id(self, arxiv_id: str) -> Optional[int]:
+        return self.index.get(self._key(arxiv_id))
+
+    def __contains__(self, arxiv_id: str) -> bool:
+        return self._key(arxiv_id) in self.index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.sources)
+
+    def add_edge(self, source: str, target: str) -> None:
+        """
+        Adds a citation from source to target, adding the papers if needed.
+        """
+        self.sources.append(self.add_node(source))
+        self.targets.append(self.add_node(target))
+        self._csr = None
+
+    def add_references(self, source: str, references: Iterable[str], known_only: bool = False) -> None:
+        """
+        Adds the citations of a paper. With known_only, references to papers not in the graph are dropped.
+        Duplicate references of a paper are added once.
+        """
+        source_node = self.add_node(source)
+        seen = set()
+        for reference in references:
+            target_node = self.node_id(reference) if known_only else self.add_node(reference)
+            if target_node is None or target_node in seen:
+                continue
+            seen.add(target_node)
+            self.sources.append(source_node)
+            self.targets.append(target_node)
+        self._csr = None
+
+    def csr(self) -> Tuple[array, array]:
+        """
+        Returns (offsets, targets): the successors of node n are targets[offsets[n]:offsets[n + 1]].
+        Built with a counting sort in O(nodes + edges) and cached until the graph changes.
+        """
+        if self._csr is None:
+            offsets = array("q", bytes(8 * (len(self.ids) + 1)))
+            for source in self.sources:
+                offsets[source + 1] += 1
+            for node in range(len(self.ids)):
+                offsets[node + 1] += offsets[node]
+            position = array("q", offsets[:-1])
+            targets = array("i", bytes(4 * len(self.targets)))
+            for source, target in zip(self.sources, self.targets):
+                targets[position[source]] = target
+                position[source] += 1
+            self._csr = (offsets, targets)
+        return self._csr
+
+    def successors(self, arxiv_id: str) -> List[str]:
+        node = self.node_id(arxiv_id)
+        if node is None:
+            return []
+        offsets, targets = self.csr()
+        return [self.ids[target] for target in targets[offsets[node]:offsets[node + 1]]]
+
+    def edges(self) -> Iterator[Tuple[str, str]]:
+        for source, target in zip(self.sources, self.targets):
+            yield self.ids[source], self.ids[target]
+
+    def keys(self) -> List[str]:
+        return list(self.ids)
+
+    def items(self) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Yields (paper, references) like Dict[str, List[str]].items(), so the graph can be given to add_graph_to_db.
+        """
+        offsets, targets = self.csr()
+        for node, arxiv_id in enumerate(self.ids):
+            yield arxiv_id, [self.ids[target] for target in targets[offsets[node]:offsets[node + 1]]]
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        return dict(self.items())
+
+    @classmethod
+    def from_dict(cls, graph: Dict[str, List[str]], normalize_versions: bool = True) -> "CitationGraph":
+        citation_graph = cls(normalize_versions)
+        for arxiv_id in graph:
+            citation_graph.add_node(arxiv_id)
+        for arxiv_id, references in graph.items():
+            citation_graph.add_references(arxiv_id, references)
+        return citation_graph
+
+    def __str__(self) -> str:
+        return f"{len(self.ids)} papers, {self.num_edges} citations"
+
+
+if __name__ == "__main__":
+    graph = CitationGraph.from_dict({
+        '2405.18952v2': ['2403.17710v3', '2406.20060v1'],
+        '2403.17710v3': ['2408.17072v1'],
+        '2408.17072v1': ['2403.17710', '2405.18952v1'],
+    })
+    print(graph, graph.to_dict())
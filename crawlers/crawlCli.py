@@ -0,0 +1,208 @@
+"""
+Single entry point of the crawlers. Each subcommand imports the modules it needs when it runs, so `--help` and
+quick jobs such as stats start without loading the PDF, HTTP and Neo4j libraries.
+
+Usage: python crawlCli.py crawl <arxiv id> [--max-depth N] [--workers N] [--mode fast|fast-raw|full]
+                                           [--priority citations|recent|distance] [--max-papers N] [--max-seconds S]
+                                           [--state FILE] [--refresh] [--postgres]
+       python crawlCli.py batch [--seed ID ...] [--method NAME ...] [--max-depth N] [crawl options]
+       python crawlCli.py method-graph <method> [--mode fast|fast-raw|full] [--refresh] [--save] [--output FILE]
+       python crawlCli.py export <directory> [--format csv|parquet] [--page-size N]
+       python crawlCli.py stats <state .sqlite or edge file> [--top N] [--seed ID] [--hops N]
+       python crawlCli.py load-articles <state .sqlite> [--batch-size N]
+Crawls shared by several processes or machines are run with crawlCoordinator.py.
+"""
+
+
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+
+def article_sink(args: argparse.Namespace):
+    if not args.postgres:
+        return None
+    from postgresSink import PostgresSink
+
+    return PostgresSink()
+
+
+def crawl(args: argparse.Namespace) -> None:
+    from crawlConcurrency import CrawlBudget
+    from recursiveCrawler import RecursiveCrawler
+
+    crawler = RecursiveCrawler(
+        args.arxiv_id,
+        args.max_depth,
+        max_workers=args.workers,
+        parse_workers=args.parse_workers,
+        extraction_mode=args.mode,
+        state_path=args.state,
+        priority=args.priority,
+        budget=CrawlBudget(max_papers=args.max_papers, max_seconds=args.max_seconds),
+        refresh=args.refresh,
+        article_sink=article_sink(args),
+    )
+    crawler.crawl_article(args.arxiv_id, 0)
+    print(crawler.state.summary(args.max_depth))
+
+
+def batch(args: argparse.Namespace) -> None:
+    from crawlConcurrency import CrawlBudget
+    from batchCrawler import BatchCrawler
+
+    crawler = BatchCrawler(
+        args.seed,
+        args.method,
+        args.max_depth,
+        max_workers=args.workers,
+        parse_workers=args.parse_workers,
+        extraction_mode=args.mode,
+        state_path=args.state,
+        priority=args.priority,
+        budget=CrawlBudget(max_papers=args.max_papers, max_seconds=args.max_seconds),
+        refresh=args.refresh,
+        article_sink=article_sink(args),
+    )
+    crawler.run()
+    print(crawler.state.summary(args.max_depth))
+
+
+def method_graph(args: argparse.Namespace) -> None:
+    from papersWithCodeCrawler import compute_method_citation_graph
+
+    graph = compute_method_citation_graph(args.method, args.mode, args.refresh)
+    print(graph)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(graph.to_dict(), f)
+    if args.save:
+        from saveIdToGraphDb import add_graph_to_db
+
+        add_graph_to_db(graph)
+
+
+def export(args: argparse.Namespace) -> None:
+    from graphExport import export_graph
+
+    papers, citations = export_graph(args.directory, args.format, args.page_size)
+    print(f"Exported {papers} papers and {citations} citations to {args.directory}")
+
+
+def require_file(path: str) -> None:
+    # Opening a missing state file would create an empty one
+    if not os.path.exists(path):
+        sys.exit(f"{path} does not exist")
+
+
+def stats(args: argparse.Namespace) -> None:
+    require_file(args.path)
+    if args.path.endswith(".sqlite"):
+        from crawlState import CrawlState
+
+        state = CrawlState(args.path)
+        try:
+            print(state.summary())
+            failures = state.failures()
+            if failures:
+                print(f"{len(failures)} failed papers, most attempted: {failures[0][0]} ({failures[0][2]})")
+        finally:
+            state.close()
+        if args.top is None:
+            return
+
+    # The graph statistics need numpy and scipy
+    import graphAnalytics
+
+    options = [args.path, "--top", str(args.top or 20), "--hops", str(args.hops)]
+    if args.seed:
+        options += ["--seed", args.seed]
+    graphAnalytics.main(options)
+
+
+def load_articles(args: argparse.Namespace) -> None:
+    from crawlState import CrawlState
+    from postgresSink import load_crawl_state
+
+    require_file(args.state)
+    state = CrawlState(args.state)
+    try:
+        print(f"Loaded {load_crawl_state(state, args.batch_size)} articles into PostgreSQL")
+    finally:
+        state.close()
+
+
+def parser() -> argparse.ArgumentParser:
+    from processPdf import EXTRACTION_MODES
+    from crawlState import PRIORITIES
+
+    parser = argparse.ArgumentParser(prog="crawlCli.py", description="Crawls arXiv citation graphs into Neo4j.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_crawl_options(command: argparse.ArgumentParser) -> None:
+        command.add_argument("--max-depth", type=int, default=2)
+        command.add_argument("--workers", type=int, default=8, help="download and metadata threads")
+        command.add_argument("--parse-workers", type=int, help="PDF parsing processes (default: one per core)")
+        command.add_argument("--mode", choices=EXTRACTION_MODES, default="fast")
+        command.add_argument("--priority", choices=tuple(PRIORITIES), help="crawl best-first")
+        command.add_argument("--max-papers", type=int)
+        command.add_argument("--max-seconds", type=float)
+        command.add_argument("--state", help="state file (default: one per seed or batch in CRAWL_STATE_DIR)")
+        command.add_argument("--refresh", action="store_true", help="only recrawl papers with a new arXiv version")
+        command.add_argument(
+            "--postgres", action="store_true", help="also load the metadata of the papers into the articles table"
+        )
+
+    command = commands.add_parser("crawl", help="crawl the references of a paper recursively")
+    command.add_argument("arxiv_id")
+    add_crawl_options(command)
+    command.set_defaults(run=crawl)
+
+    command = commands.add_parser(
+        "batch", help="crawl several seed papers and PapersWithCode methods as one job, recording their provenance"
+    )
+    command.add_argument("--seed", action="append", default=[], help="seed paper, repeatable")
+    command.add_argument("--method", action="append", default=[], help="PapersWithCode method, repeatable")
+    add_crawl_options(command)
+    command.set_defaults(run=batch)
+
+    command = commands.add_parser("method-graph", help="citation graph of the papers of a PapersWithCode method")
+    command.add_argument("method")
+    command.add_argument("--mode", choices=EXTRACTION_MODES, default="fast")
+    command.add_argument("--refresh", action="store_true", help="only extract new papers and new versions")
+    command.add_argument("--save", action="store_true", help="write the graph to Neo4j")
+    command.add_argument("--output", help="write the graph to this JSON file")
+    command.set_defaults(run=method_graph)
+
+    command = commands.add_parser("export", help="export the Neo4j graph to CSV or Parquet files")
+    command.add_argument("directory")
+    command.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    command.add_argument("--page-size", type=int, default=10000)
+    command.set_defaults(run=export)
+
+    command = commands.add_parser("stats", help="progress of a crawl state file, or statistics of a citation graph")
+    command.add_argument("path")
+    command.add_argument("--top", type=int, help="also rank the papers by PageRank and citations")
+    command.add_argument("--seed", help="count the papers within --hops citations of this paper")
+    command.add_argument("--hops", type=int, default=2)
+    command.set_defaults(run=stats)
+
+    command = commands.add_parser("load-articles", help="load the metadata of a crawl into the PostgreSQL articles table")
+    command.add_argument("state")
+    command.add_argument("--batch-size", type=int, default=10000)
+    command.set_defaults(run=load_articles)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parser().parse_args(argv)
+    from crawlMetrics import configure_logging
+
+    configure_logging()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
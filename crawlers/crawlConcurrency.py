@@ -0,0 +1,108 @@
+"""
+Concurrency helpers shared by the crawlers: per-host concurrency caps, a throughput counter and crawl budgets.
+"""
+
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+
+# The arXiv API asks clients not to hammer export.arxiv.org, PDFs are served by a CDN
+DEFAULT_HOST_LIMITS: Dict[str, int] = {
+    "export.arxiv.org": 1,
+    "arxiv.org": 4,
+    "paperswithcode.com": 4,
+}
+
+
+class HostLimiter:
+    def __init__(self, limits: Optional[Dict[str, int]] = None, default_limit: int = 4):
+        """
+        Caps the number of requests in flight per host.
+        """
+        self.limits = dict(DEFAULT_HOST_LIMITS if limits is None else limits)
+        self.default_limit = default_limit
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limits.get(host, self.default_limit))
+            return self._semaphores[host]
+
+    @contextmanager
+    def limit(self, url: str) -> Iterator[None]:
+        """
+        Blocks until a slot is free for the host of the given url.
+        """
+        semaphore = self._semaphore(urlparse(url).hostname or "")
+        with semaphore:
+            yield
+
+
+class ThroughputCounter:
+    def __init__(self):
+        """
+        Counts processed papers since creation to report the crawl rate.
+        """
+        self.start_time = time.monotonic()
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, n: int = 1) -> None:
+        with self._lock:
+            self.count += n
+
+    def papers_per_minute(self) -> float:
+        elapsed = time.monotonic() - self.start_time
+        return 60 * self.count / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.count} papers, {self.papers_per_minute():.1f} papers/min"
+
+
+class CrawlBudget:
+    def __init__(self, max_papers: Optional[int] = None, max_bytes: Optional[int] = None, max_seconds: Optional[float] = None):
+        """
+        Stops a crawl after max_papers written papers, max_bytes downloaded or max_seconds of wall-clock time.
+        None means unbounded. Budgets count from creation, so a resumed crawl gets a fresh budget.
+        """
+        self.max_papers = max_papers
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.start_time = time.monotonic()
+        self.papers = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def record_papers(self, n: int) -> None:
+        with self._lock:
+            self.papers += n
+
+    def record_bytes(self, n: int) -> None:
+        with self._lock:
+            self.bytes += n
+
+    def remaining_papers(self) -> Optional[int]:
+        return None if self.max_papers is None else max(self.max_papers - self.papers, 0)
+
+    def exhausted(self, count_papers: bool = True) -> Optional[str]:
+        """
+        Returns the reason the budget is spent, or None while the crawl may go on.
+        Without count_papers, only the bytes and time budgets are checked, e.g. to finish the papers already written.
+        """
+        if count_papers and self.max_papers is not None and self.papers >= self.max_papers:
+            return f"{self.papers} papers written"
+        if self.max_bytes is not None and self.bytes >= self.max_bytes:
+            return f"{self.bytes / 2**20:.1f} MB downloaded"
+        if self.max_seconds is not None and time.monotonic() - self.start_time >= self.max_seconds:
+            return f"{self.max_seconds:.0f}s elapsed"
+        return None
+
+    def __str__(self) -> str:
+        elapsed = time.monotonic() - self.start_time
+        return f"budget used: {self.papers} papers, {self.bytes / 2**20:.1f} MB, {elapsed:.0f}s"
@@ -0,0 +1,147 @@
+"""
+Settings of the crawlers (connections, service URLs, cache paths, limits and metrics), read from the environment and
+the .env file on first use rather than at import, so that importing a crawler module neither reads .env nor opens a
+connection, and a script run directly still honours .env.
+"""
+
+
+import os
+import threading
+from typing import Optional
+
+
+class CrawlConfig:
+    def __init__(
+        self,
+        neo4j_uri: str = "bolt://localhost:7687",
+        neo4j_user: str = "neo4j",
+        neo4j_password: str = "password",
+        neo4j_database: str = "",
+        neo4j_max_connections: int = 50,
+        postgres_dsn: str = "",
+        postgres_max_connections: int = 4,
+        arxiv_api_url: str = "http://export.arxiv.org/api/query",
+        arxiv_pdf_url: str = "http://arxiv.org/pdf",
+        paperswithcode_url: str = "https://paperswithcode.com",
+        crawl_state_dir: str = os.path.join(".cache", "crawls"),
+        pdf_cache_dir: str = os.path.join(".cache", "pdfs"),
+        pdf_cache_max_mb: int = 2048,
+        pdf_max_mb: int = 100,
+        pdf_max_pages: int = 500,
+        metadata_index_path: str = os.path.join(".cache", "arxiv_metadata.sqlite"),
+        paper_id_cache_path: str = os.path.join(".cache", "paper_ids.sqlite"),
+        response_cache_path: str = os.path.join(".cache", "responses.sqlite"),
+        log_level: str = "INFO",
+        metrics_file: str = "",
+        metrics_interval: float = 30.0,
+    ):
+        """
+        neo4j_database is the database the graph is written to, the server's default one if empty.
+        neo4j_max_connections bounds the connection pool of the driver shared by the process, see graphWriter.
+        postgres_dsn is the libpq connection string of the articles database, the PG* variables apply if empty.
+        postgres_max_connections bounds the connection pool shared by the process, see postgresSink.
+        The service URLs can point the crawlers at stand-ins, see benchmarkServer.
+        crawl_state_dir holds the state files of the crawls not given one, see recursiveCrawler and batchCrawler.
+        pdf_cache_dir and pdf_cache_max_mb locate and bound the PDF cache, see pdfCache; PDFs larger than pdf_max_mb
+        or with more than pdf_max_pages pages are skipped, see processPdf.
+        metadata_index_path, paper_id_cache_path and response_cache_path are the default files of metadataIndex,
+        paperIdCache and responseCache. log_level, metrics_file and metrics_interval configure crawlMetrics.
+        """
+        self.neo4j_uri = neo4j_uri
+        self.neo4j_user = neo4j_user
+        self.neo4j_password = neo4j_password
+        self.neo4j_database = neo4j_database
+        self.neo4j_max_connections = neo4j_max_connections
+        self.postgres_dsn = postgres_dsn
+        self.postgres_max_connections = postgres_max_connections
+        self.arxiv_api_url = arxiv_api_url
+        self.arxiv_pdf_url = arxiv_pdf_url
+        self.paperswithcode_url = paperswithcode_url
+        self.crawl_state_dir = crawl_state_dir
+        self.pdf_cache_dir = pdf_cache_dir
+        self.pdf_cache_max_mb = pdf_cache_max_mb
+        self.pdf_max_mb = pdf_max_mb
+        self.pdf_max_pages = pdf_max_pages
+        self.metadata_index_path = metadata_index_path
+        self.paper_id_cache_path = paper_id_cache_path
+        self.response_cache_path = response_cache_path
+        self.log_level = log_level
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+
+    @classmethod
+    def from_env(cls) -> "CrawlConfig":
+        """
+        Reads the variables below, after loading .env into the environment. Unset ones keep their default.
+        """
+        load_env()
+        default = cls()
+        return cls(
+            neo4j_uri=os.getenv("NEO4J_URI", default.neo4j_uri),
+            neo4j_user=os.getenv("NEO4J_USER", default.neo4j_user),
+            neo4j_password=os.getenv("NEO4J_PASSWORD", default.neo4j_password),
+            neo4j_database=os.getenv("NEO4J_DATABASE", default.neo4j_database),
+            neo4j_max_connections=int(os.getenv("NEO4J_MAX_CONNECTIONS", default.neo4j_max_connections)),
+            postgres_dsn=os.getenv("POSTGRES_DSN", default.postgres_dsn),
+            postgres_max_connections=int(os.getenv("POSTGRES_MAX_CONNECTIONS", default.postgres_max_connections)),
+            arxiv_api_url=os.getenv("ARXIV_API_URL", default.arxiv_api_url),
+            arxiv_pdf_url=os.getenv("ARXIV_PDF_URL", default.arxiv_pdf_url),
+            paperswithcode_url=os.getenv("PAPERSWITHCODE_URL", default.paperswithcode_url),
+            crawl_state_dir=os.getenv("CRAWL_STATE_DIR", default.crawl_state_dir),
+            pdf_cache_dir=os.getenv("PDF_CACHE_DIR", default.pdf_cache_dir),
+            pdf_cache_max_mb=int(os.getenv("PDF_CACHE_MAX_MB", default.pdf_cache_max_mb)),
+            pdf_max_mb=int(os.getenv("PDF_MAX_MB", default.pdf_max_mb)),
+            pdf_max_pages=int(os.getenv("PDF_MAX_PAGES", default.pdf_max_pages)),
+            metadata_index_path=os.getenv("ARXIV_METADATA_INDEX", default.metadata_index_path),
+            paper_id_cache_path=os.getenv("PAPER_ID_CACHE", default.paper_id_cache_path),
+            response_cache_path=os.getenv("RESPONSE_CACHE", default.response_cache_path),
+            log_level=os.getenv("CRAWL_LOG_LEVEL", default.log_level),
+            metrics_file=os.getenv("CRAWL_METRICS_FILE", default.metrics_file),
+            metrics_interval=float(os.getenv("CRAWL_METRICS_INTERVAL", default.metrics_interval)),
+        )
+
+    def __repr__(self) -> str:
+        # The passwords are left out (the DSN may hold one), the config ends up in logs
+        return (
+            f"CrawlConfig(neo4j_uri={self.neo4j_uri!r}, neo4j_user={self.neo4j_user!r}, "
+            f"neo4j_database={self.neo4j_database!r}, neo4j_max_connections={self.neo4j_max_connections}, "
+            f"postgres_max_connections={self.postgres_max_connections})"
+        )
+
+
+_env_loaded = False
+_config: Optional[CrawlConfig] = None
+_config_lock = threading.Lock()
+
+
+def load_env() -> None:
+    """
+    Loads the .env file into the environment, once per process, on the first get_config.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_config() -> CrawlConfig:
+    """
+    Returns the configuration of the process, read from the environment on first use.
+    """
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = CrawlConfig.from_env()
+        return _config
+
+
+def set_config(config: CrawlConfig) -> None:
+    """
+    Replaces the configuration of the process, e.g. to point a job at another database. Call close_driver first
+    if the shared driver was already created with the previous settings.
+    """
+    global _config
+    with _config_lock:
+        _config = config
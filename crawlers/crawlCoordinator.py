@@ -0,0 +1,369 @@
+"""
+Coordination of a crawl split across several worker processes, on one machine or on several sharing the state file.
+The frontier lives in one shared crawl state: papers are assigned to the live workers by hashing their arXiv id,
+a worker leases the papers it claims and renews its leases with heartbeats, and the papers leased by a worker that
+stopped heartbeating are claimed again once their lease expires. All workers write to the same Neo4j database.
+
+Usage: python crawlCoordinator.py worker <state file> <initial id> --max-depth N [--processes K] [--worker-id ID]
+       python crawlCoordinator.py status <state file>
+       python crawlCoordinator.py retry-failed <state file>
+"""
+
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Iterator, List, Optional, Set, Tuple
+from crawlState import CrawlState, INCOMPLETE, PENDING_RELATIONS, PRIORITIES, REMOVED_RELATIONS
+from crawlMetrics import get_metrics
+from httpClient import get_client
+
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 300.0
+HEARTBEAT_INTERVAL = 30.0
+# A worker whose heartbeat is older than this is considered dead and its papers are reassigned
+WORKER_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+MAX_ATTEMPTS = 3
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS papers_owner ON papers (owner);
+"""
+
+# Papers this worker may claim: unfinished, not leased (or leased by a dead worker) and in one of its shards
+CLAIMABLE = (
+    f"{INCOMPLETE} AND attempts < :max_attempts AND (lease_expires IS NULL OR lease_expires <= :now) "
+    "AND shard_of(arxiv_id, :workers) = :rank"
+)
+# Papers some worker will still claim
+OUTSTANDING = f"{INCOMPLETE} AND attempts < :max_attempts"
+
+
+def shard_of(arxiv_id: str, shards: int) -> int:
+    """
+    Stable shard of a paper, the same in every process and on every machine (unlike hash()).
+    """
+    digest = hashlib.blake2b(arxiv_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class SharedCrawlState(CrawlState):
+    def __init__(
+        self,
+        path: str,
+        worker_id: Optional[str] = None,
+        lease_seconds: float = LEASE_SECONDS,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+        worker_timeout: float = WORKER_TIMEOUT,
+        max_attempts: int = MAX_ATTEMPTS,
+        retry_delay: float = 60.0,
+        claim_size: int = 100,
+        poll_interval: float = 5.0,
+        expected_workers: int = 1,
+    ):
+        """
+        Crawl state shared by several workers, to give to RecursiveCrawler as its state.
+        Every change is committed at once so the other workers see it. Paper i belongs to the worker of rank
+        shard_of(i, live workers) among the live workers sorted by id, so the assignment follows workers joining
+        and leaving. next_level and next_batch lease at most claim_size papers of the worker's shards for
+        lease_seconds, renewed every heartbeat_interval by a background thread, and wait while other workers
+        may still add papers. A failed paper is released and retried by its owner after retry_delay seconds,
+        up to max_attempts attempts (see retry_failed), so the exclude arguments are ignored.
+        The workers split the rate limits of every host: each heartbeat sets the share of the process's HTTP client
+        to one over the number of live workers, counting at least expected_workers, e.g. the processes started
+        together by run_workers before they all registered.
+        This SQLite backend serves processes on one machine or on a filesystem with working locks; another backend
+        only has to provide the same methods.
+        """
+        super().__init__(path, checkpoint_interval=0)
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_timeout = worker_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.claim_size = claim_size
+        self.poll_interval = poll_interval
+        self.expected_workers = expected_workers
+
+        # Other processes hold the write lock for the duration of a statement, wait for it instead of failing
+        self.connection.execute("PRAGMA busy_timeout = 60000")
+        with self._lock:
+            self._add_columns({"owner": "TEXT", "lease_expires": "REAL"})
+            self.connection.executescript(SHARED_SCHEMA)
+            self.connection.commit()
+        self.connection.create_function("shard_of", 2, shard_of, deterministic=True)
+
+        self._stop = threading.Event()
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run_heartbeats, name="crawl-heartbeat", daemon=True)
+        self._thread.start()
+
+    def heartbeat(self) -> None:
+        """
+        Records that this worker is alive and extends the leases of the papers it is processing.
+        """
+        now = time.time()
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, heartbeat) VALUES (?, ?)", (self.worker_id, now)
+            )
+            self.connection.execute(
+                "UPDATE papers SET lease_expires = ? WHERE owner = ?", (now + self.lease_seconds, self.worker_id)
+            )
+            self.connection.commit()
+        get_client().set_share(1 / max(len(self.live_workers()), self.expected_workers))
+
+    def _run_heartbeats(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                # A missed heartbeat is only fatal after worker_timeout, keep trying
+                logger.warning("Heartbeat of worker %s failed: %s", self.worker_id, e)
+
+    def live_workers(self) -> List[str]:
+        return live_workers(self, self.worker_timeout)
+
+    def _assignment(self) -> Tuple[int, int]:
+        """
+        Number of live workers and rank of this worker among them.
+        """
+        workers = self.live_workers()
+        if self.worker_id not in workers:
+            # Heartbeats were delayed past the timeout, e.g. by a suspended process
+            self.heartbeat()
+            workers = self.live_workers()
+        return len(workers), workers.index(self.worker_id)
+
+    def _release(self) -> None:
+        # Papers of the previous claim are processed by now, the unfinished ones are claimable again
+        self._execute("UPDATE papers SET owner = NULL, lease_expires = NULL WHERE owner = ?", (self.worker_id,))
+
+    def _claim(self, order_by: str, limit: Optional[int], max_depth: int, condition: str = "1") -> List[Tuple[str, int]]:
+        """
+        Leases up to limit claimable papers matching condition in order, then returns them with their depth.
+        Waits until some paper is claimable or the crawl is complete, in which case it returns [].
+        """
+        self._release()
+        limit = self.claim_size if limit is None else min(limit, self.claim_size)
+        metrics = get_metrics()
+        while True:
+            self.heartbeat()
+            workers, rank = self._assignment()
+            params = {
+                "max_depth": max_depth, "max_attempts": self.max_attempts, "now": time.time(),
+                "workers": workers, "rank": rank, "limit": limit, "expires": time.time() + self.lease_seconds,
+            }
+            metrics.set_gauge("crawl_workers", workers)
+            with self._lock:
+                # The write lock is taken before reading, so two workers never lease the same paper
+                self.connection.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = self.connection.execute(
+                        f"""
+                        SELECT arxiv_id, depth FROM (
+                            SELECT arxiv_id, depth, paper_year(arxiv_id, metadata) AS year,
+                                   (SELECT count(*) FROM relations r WHERE r.target = papers.arxiv_id) AS citations
+                            FROM papers WHERE {CLAIMABLE} AND {condition}
+                        ) ORDER BY {order_by} LIMIT :limit
+                        """,
+                        params,
+                    ).fetchall()
+                    self.connection.executemany(
+                        "UPDATE papers SET owner = ?, lease_expires = ? WHERE arxiv_id = ?",
+                        ((self.worker_id, params["expires"], arxiv_id) for arxiv_id, _ in rows),
+                    )
+                    self.connection.commit()
+                except Exception:
+                    self.connection.rollback()
+                    raise
+            if rows:
+                metrics.increment("papers_leased", len(rows))
+                return rows
+            outstanding = self._execute(f"SELECT count(*) FROM papers WHERE {OUTSTANDING}", params).fetchone()[0]
+            if not outstanding:
+                return []
+            logger.debug("Worker %s waiting for %d papers leased by other workers", self.worker_id, outstanding)
+            time.sleep(self.poll_interval)
+
+    def next_level(self, max_depth: int, exclude: Set[str], limit: Optional[int] = None) -> Tuple[int, List[str]]:
+        """
+        Leases claimable papers of this worker at the smallest depth with unfinished papers across all workers,
+        so levels are crawled in order as by a single crawler and papers get their shortest distance to the seed.
+        Returns (-1, []) once the whole crawl is complete.
+        """
+        rows = self._claim("depth", limit, max_depth, f"depth = (SELECT min(depth) FROM papers WHERE {OUTSTANDING})")
+        if not rows:
+            return -1, []
+        return rows[0][1], [arxiv_id for arxiv_id, _ in rows]
+
+    def next_batch(self, priority: str, size: int, max_depth: int, exclude: Set[str]) -> List[str]:
+        """
+        Leases the best claimable papers of this worker by priority, one of PRIORITIES.
+        Citations are counted over the papers crawled by every worker.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority}, expected one of {tuple(PRIORITIES)}")
+        return [arxiv_id for arxiv_id, _ in self._claim(PRIORITIES[priority], size, max_depth)]
+
+    def record_failure(self, arxiv_id: str, error: Exception) -> None:
+        super().record_failure(arxiv_id, error)
+        # Released with a delay before the next attempt, which other workers wait for
+        self._execute(
+            "UPDATE papers SET owner = NULL, lease_expires = ? WHERE arxiv_id = ?", (time.time() + self.retry_delay, arxiv_id)
+        )
+
+    def _own_relation_pages(self, query: str, page_size: int) -> Iterator[List[Tuple[str, str]]]:
+        # The shards are those of the worker when the pages start, a page is never split between two workers
+        workers, rank = self._assignment()
+        return self._relation_pages(
+            f"{query} AND shard_of(r.source, :workers) = :rank", page_size, {"workers": workers, "rank": rank}
+        )
+
+    def pending_relations(self, page_size: int = 10000) -> Iterator[List[Tuple[str, str]]]:
+        """
+        Relations not written yet whose two papers are in the database, among those citing a paper of this worker,
+        so each relation is written by one worker. In pages of page_size.
+        """
+        return self._own_relation_pages(PENDING_RELATIONS, page_size)
+
+    def removed_relations(self, page_size: int = 10000) -> Iterator[List[Tuple[str, str]]]:
+        """
+        Relations to delete from the database among those citing a paper of this worker, see pending_relations.
+        """
+        return self._own_relation_pages(REMOVED_RELATIONS, page_size)
+
+    def close(self) -> None:
+        """
+        Stops the heartbeats and leaves the crawl, so the other workers take over this worker's shards at once.
+        """
+        self._stop.set()
+        self._thread.join()
+        self._release()
+        self._execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+        super().close()
+
+    def __str__(self) -> str:
+        return f"worker {self.worker_id} of {len(self.live_workers())}"
+
+
+def live_workers(state: CrawlState, worker_timeout: float = WORKER_TIMEOUT) -> List[str]:
+    """
+    Ids of the workers of a shared state that heartbeated within worker_timeout seconds, sorted.
+    """
+    rows = state._execute(
+        "SELECT worker_id FROM workers WHERE heartbeat >= ? ORDER BY worker_id", (time.time() - worker_timeout,)
+    )
+    return [worker_id for worker_id, in rows]
+
+
+def is_shared(state: CrawlState) -> bool:
+    """
+    Whether workers ever joined the crawl of the state, i.e. it has the tables of SharedCrawlState.
+    """
+    rows = state._execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'workers'")
+    return rows.fetchone() is not None
+
+
+def retry_failed(state: CrawlState, max_attempts: int = MAX_ATTEMPTS) -> int:
+    """
+    Makes the papers of a shared state that ran out of attempts claimable again. Returns their number.
+    Works on a plain CrawlState, which does not join the crawl as a worker.
+    """
+    count = state._execute("UPDATE papers SET attempts = 0 WHERE attempts >= ?", (max_attempts,)).rowcount
+    state.checkpoint()
+    return count
+
+
+def run_worker(
+    path: str,
+    initial_id: str,
+    max_depth: int,
+    worker_id: Optional[str] = None,
+    parse_workers: Optional[int] = None,
+    expected_workers: int = 1,
+) -> None:
+    """
+    Crawls from initial_id with the other workers sharing the state file at path, until the crawl is complete.
+    """
+    from recursiveCrawler import RecursiveCrawler
+    from crawlMetrics import configure_logging, set_worker
+
+    configure_logging()
+    state = SharedCrawlState(path, worker_id, expected_workers=expected_workers)
+    set_worker(state.worker_id)
+    try:
+        crawler = RecursiveCrawler(initial_id, max_depth, state=state, parse_workers=parse_workers)
+        crawler.crawl_article(initial_id, 0)
+    finally:
+        state.close()
+
+
+def run_workers(path: str, initial_id: str, max_depth: int, processes: int, worker_id: Optional[str] = None) -> None:
+    """
+    Runs processes workers on this machine, sharing its cores for PDF parsing and the rate limits of every host.
+    """
+    worker_id = worker_id or default_worker_id()
+    parse_workers = max(1, (os.cpu_count() or 1) // processes)
+    workers = [
+        multiprocessing.Process(
+            target=run_worker, args=(path, initial_id, max_depth, f"{worker_id}-{i}", parse_workers, processes),
+            name=f"crawl-{i}",
+        )
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    import argparse
+    from crawlMetrics import configure_logging
+
+    parser = argparse.ArgumentParser(description="Crawls with several worker processes sharing one state file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("worker", help="run workers on this machine until the crawl is complete")
+    command.add_argument("state")
+    command.add_argument("initial_id")
+    command.add_argument("--max-depth", type=int, required=True)
+    command.add_argument("--processes", type=int, default=1)
+    command.add_argument("--worker-id", help="prefix of the worker ids (default: host and pid)")
+    for name, description in (
+        ("status", "show the progress and the live workers"),
+        ("retry-failed", f"requeue the papers that failed {MAX_ATTEMPTS} times"),
+    ):
+        commands.add_parser(name, help=description).add_argument("state")
+    args = parser.parse_args()
+    configure_logging()
+    if args.command == "worker":
+        run_workers(args.state, args.initial_id, args.max_depth, args.processes, args.worker_id)
+    else:
+        if not os.path.exists(args.state):
+            sys.exit(f"{args.state} does not exist")
+        state = CrawlState(args.state)
+        try:
+            if not is_shared(state):
+                sys.exit(f"{args.state} is not the state of a coordinated crawl, no worker ever joined it")
+            if args.command == "retry-failed":
+                print(f"{retry_failed(state)} failed papers will be retried")
+            print(state.summary())
+            print(f"Live workers: {', '.join(live_workers(state))}")
+        finally:
+            state.close()
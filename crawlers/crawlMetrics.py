@@ -0,0 +1,287 @@
+"""
+Lightweight instrumentation of the crawlers: counters, gauges and latency histograms per stage (HTTP fetch, PDF parse,
+reference scan, metadata parse, database write), a periodic one-line summary in the log and a machine-readable metrics
+file in JSON lines or Prometheus text format. Also configures the leveled logging used instead of prints.
+"""
+
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from crawlConfig import get_config
+
+
+# Upper bounds in seconds, from a cache hit to a throttled arXiv API call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+# Stages reported in the periodic summary, in pipeline order
+# http_wait is the time spent waiting on the rate limits, pdf_download includes reading the body
+SUMMARY_STAGES = ("http_wait", "http_fetch", "pdf_download", "metadata_parse", "pdf_parse", "reference_scan", "db_write")
+
+# (metric name, sorted label items)
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """
+    Logs to stderr at the given level (CRAWL_LOG_LEVEL, default INFO). DEBUG shows per-paper progress.
+    """
+    level = level or get_config().log_level
+    logging.basicConfig(level=level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def escape_label_value(value: str) -> str:
+    """
+    Escapes a label value for the Prometheus text format: backslash, double quote and line feed.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _key(name: str, labels: Dict[str, str]) -> MetricKey:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile.
+        """
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Thread-safe registry of counters, gauges and histograms, each identified by a name and optional labels.
+        """
+        self.counters: Dict[MetricKey, float] = {}
+        self.gauges: Dict[MetricKey, float] = {}
+        self.histograms: Dict[MetricKey, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """
+        Records the duration of the block in the histogram name, also when it raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[str, List[dict]]:
+        with self._lock:
+            return {
+                "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self.counters.items()],
+                "gauges": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self.gauges.items()],
+                "histograms": [
+                    {
+                        "name": n, "labels": dict(l), "count": h.count, "sum": h.sum,
+                        "buckets": {str(bound): count for bound, count in zip(h.buckets, h.counts)},
+                    }
+                    for (n, l), h in self.histograms.items()
+                ],
+            }
+
+    def to_prometheus(self, common_labels: Optional[Dict[str, str]] = None) -> str:
+        """
+        The metrics in the Prometheus text exposition format, common_labels being added to every sample.
+        """
+        common = tuple(sorted((common_labels or {}).items()))
+
+        def labels_text(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+            items = [f'{label}="{escape_label_value(value)}"' for label, value in common + labels]
+            items += [extra] if extra else []
+            return "{" + ",".join(items) + "}" if items else ""
+
+        lines = []
+        typed = set()
+
+        def add_type(family: str, kind: str) -> None:
+            # One TYPE line per metric family, before its first sample
+            if family not in typed:
+                typed.add(family)
+                lines.append(f"# TYPE {family} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                add_type(f"crawler_{name}_total", "counter")
+                lines.append(f"crawler_{name}_total{labels_text(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                add_type(f"crawler_{name}", "gauge")
+                lines.append(f"crawler_{name}{labels_text(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                add_type(f"crawler_{name}_seconds", "histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    bucket_label = f'le="{le}"'
+                    lines.append(f"crawler_{name}_seconds_bucket{labels_text(labels, bucket_label)} {cumulative}")
+                lines.append(f"crawler_{name}_seconds_sum{labels_text(labels)} {histogram.sum}")
+                lines.append(f"crawler_{name}_seconds_count{labels_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def histogram(self, name: str) -> Histogram:
+        """
+        The histogram name merged over every label.
+        """
+        merged = Histogram()
+        with self._lock:
+            for (histogram_name, _), histogram in self.histograms.items():
+                if histogram_name == name:
+                    merged.count += histogram.count
+                    merged.sum += histogram.sum
+                    merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+        return merged
+
+    def counter(self, name: str) -> float:
+        """
+        The counter name summed over every label.
+        """
+        with self._lock:
+            return sum(value for (counter_name, _), value in self.counters.items() if counter_name == name)
+
+    def summary(self) -> str:
+        """
+        One line per stage: count, mean and p95 latency, over every label.
+        """
+        stages = []
+        for stage in SUMMARY_STAGES:
+            merged = self.histogram(stage)
+            if merged.count:
+                stages.append(f"{stage} {merged.count}x mean {merged.sum / merged.count:.3f}s p95<={merged.quantile(0.95)}s")
+        return ", ".join(stages + [f"{self.counter('http_response_bytes') / 2**20:.1f} MB downloaded"])
+
+
+def worker_path(path: str, worker: str) -> str:
+    """
+    The metrics file of a worker, e.g. metrics.host-42-0.prom for metrics.prom.
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.{worker}{extension}"
+
+
+class MetricsReporter:
+    def __init__(
+        self,
+        metrics: Optional[Metrics] = None,
+        path: Optional[str] = None,
+        interval: Optional[float] = None,
+        worker: Optional[str] = None,
+    ):
+        """
+        Every interval seconds, logs the summary and writes the metrics to path: a JSON line appended per snapshot,
+        or the whole file rewritten in Prometheus text format if path ends with .prom. No file if path is empty.
+        path and interval default to CRAWL_METRICS_FILE and CRAWL_METRICS_INTERVAL, see crawlConfig.
+        Each JSON line holds the pid of the process. The workers of a coordinated crawl (worker, by default the one
+        of set_worker) write to files of their own, see worker_path, and label their samples with their id.
+        """
+        config = get_config()
+        path = path if path is not None else config.metrics_file
+        self.metrics = metrics or get_metrics()
+        self.worker = worker if worker is not None else _worker
+        self.path = worker_path(path, self.worker) if path and self.worker else path
+        self.interval = interval if interval is not None else config.metrics_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def report(self) -> None:
+        logging.getLogger(__name__).info("Metrics: %s", self.metrics.summary())
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self.path.endswith(".prom"):
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.metrics.to_prometheus({"worker": self.worker} if self.worker else None))
+            os.replace(tmp_path, self.path)  # Scrapers never see a half-written file
+        else:
+            with open(self.path, "a") as f:
+                source = {"pid": os.getpid(), **({"worker": self.worker} if self.worker else {})}
+                f.write(json.dumps({"time": time.time(), **source, **self.metrics.snapshot()}) + "\n")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def start(self) -> "MetricsReporter":
+        self._thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops the periodic reports and writes a final one.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.report()
+
+    def __enter__(self) -> "MetricsReporter":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+_metrics = Metrics()
+_worker: Optional[str] = None
+
+
+def get_metrics() -> Metrics:
+    """
+    Returns the registry shared by the whole process.
+    """
+    return _metrics
+
+
+def set_worker(worker_id: Optional[str]) -> None:
+    """
+    Names the coordinator worker run by this process, for the metrics reporters created afterwards.
+    """
+    global _worker
+    _worker = worker_id
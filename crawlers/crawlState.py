@@ -0,0 +1,470 @@
+"""
+SQLite store of the state of a crawl: frontier, visited papers, per-paper progress, failures and pending citation
+relations. A crawler restarted on the same file resumes where it stopped and only retries the unfinished papers.
+"""
+
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from utils import arxiv_id_year
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    arxiv_id TEXT PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    metadata TEXT,
+    refs TEXT,
+    previous_refs TEXT,
+    written INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS papers_depth ON papers (depth);
+CREATE TABLE IF NOT EXISTS relations (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    written INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (source, target)
+);
+CREATE INDEX IF NOT EXISTS relations_pending ON relations (written);
+CREATE INDEX IF NOT EXISTS relations_target ON relations (target);
+CREATE TABLE IF NOT EXISTS seeds (
+    arxiv_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (arxiv_id, source)
+);
+"""
+
+# Relations are pending (written = 0), in the database (1) or found removed by a refresh and to be deleted (-1)
+PENDING_RELATIONS = """
+SELECT r.rowid, r.source, r.target FROM relations r
+JOIN papers s ON s.arxiv_id = r.source AND s.written = 1
+JOIN papers t ON t.arxiv_id = r.target AND t.written = 1
+WHERE r.written = 0
+"""
+REMOVED_RELATIONS = "SELECT r.rowid, r.source, r.target FROM relations r WHERE r.written = -1"
+CURRENT_RELATIONS = "SELECT r.rowid, r.source, r.target FROM relations r WHERE r.written >= 0"
+
+# A paper is done once its metadata is known, its node is written and, above the maximum depth, its references are known
+INCOMPLETE = "(metadata IS NULL OR written = 0 OR (refs IS NULL AND depth < :max_depth)) AND depth <= :max_depth"
+
+# Seeds and the papers within max_depth citations of them, with the seed's source and the distance to the seed
+REACHED = """
+WITH RECURSIVE reach(arxiv_id, source, hops) AS (
+    SELECT arxiv_id, source, 0 FROM seeds
+    UNION
+    SELECT r.target, reach.source, reach.hops + 1 FROM reach JOIN relations r ON r.source = reach.arxiv_id
+    WHERE reach.hops < :max_depth AND r.written >= 0
+)
+SELECT arxiv_id, source, min(hops) AS hops FROM reach GROUP BY arxiv_id, source
+"""
+
+# Papers of temp.found (see add_papers) reached by a shorter path, and the papers they cite, with their new depth.
+# Stops at papers whose depth is already small enough, so citation cycles end.
+LOWERED = """
+WITH RECURSIVE lowered(arxiv_id, depth) AS (
+    SELECT f.arxiv_id, :depth FROM temp.found f JOIN papers p ON p.arxiv_id = f.arxiv_id WHERE p.depth > :depth
+    UNION
+    SELECT r.target, lowered.depth + 1 FROM lowered
+    JOIN relations r ON r.source = lowered.arxiv_id AND r.written >= 0
+    JOIN papers p ON p.arxiv_id = r.target
+    WHERE p.depth > lowered.depth + 1
+)
+SELECT arxiv_id, min(depth) FROM lowered GROUP BY arxiv_id
+"""
+
+# Frontier orderings of next_batch. citations counts the crawled papers citing a paper, year is the publication year
+# when the metadata is known and the year of the arXiv id otherwise
+PRIORITIES = {
+    "citations": "citations DESC, depth, year DESC",
+    "recent": "year DESC, citations DESC, depth",
+    "distance": "depth, citations DESC, year DESC",
+}
+
+
+def _paper_year(arxiv_id: str, metadata: Optional[str]) -> int:
+    if metadata is not None:
+        published = json.loads(metadata).get("published", "")
+        if published[:4].isdigit() and published[:4] != "0000":
+            return int(published[:4])
+    return arxiv_id_year(arxiv_id) or 0
+
+
+class CrawlState:
+    def __init__(self, path: str, checkpoint_interval: float = 10.0):
+        """
+        Opens (or creates) the state file. Changes are committed at least every checkpoint_interval seconds
+        and on every explicit checkpoint.
+        """
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        # Added after the first release, state files of older crawls get it on open
+        self._add_columns({"previous_refs": "TEXT"})
+        self.connection.create_function("paper_year", 2, _paper_year, deterministic=True)
+        # Papers skipped by next_level and next_batch, kept in SQLite rather than passed as query parameters
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS excluded (arxiv_id TEXT PRIMARY KEY)")
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS found (arxiv_id TEXT PRIMARY KEY)")
+        self.last_checkpoint = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _add_columns(self, columns: Dict[str, str]) -> None:
+        """
+        Adds the missing columns, given with their definition, to the papers table.
+        """
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(papers)")}
+        for column, definition in columns.items():
+            if column not in existing:
+                try:
+                    self.connection.execute(f"ALTER TABLE papers ADD COLUMN {column} {definition}")
+                except sqlite3.OperationalError as e:
+                    # Processes opening the same file together race to add the columns
+                    if "duplicate column" not in str(e):
+                        raise
+        self.connection.commit()
+
+    def _execute(self, query: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            cursor = self.connection.execute(query, params)
+            self._maybe_checkpoint()
+            return cursor
+
+    def _executemany(self, query: str, rows: Iterable) -> None:
+        with self._lock:
+            self.connection.executemany(query, rows)
+            self._maybe_checkpoint()
+
+    def _maybe_checkpoint(self) -> None:
+        if time.monotonic() - self.last_checkpoint >= self.checkpoint_interval:
+            self.connection.commit()
+            self.last_checkpoint = time.monotonic()
+
+    def checkpoint(self) -> None:
+        with self._lock:
+            self.connection.commit()
+            self.last_checkpoint = time.monotonic()
+
+    def close(self) -> None:
+        self.checkpoint()
+        self.connection.close()
+
+    def add_papers(self, arxiv_ids: Iterable[str], depth: int) -> None:
+        """
+        Adds papers to the frontier. Papers already known keep their progress, and move to depth if it is smaller,
+        i.e. a shorter path to them was found (best-first crawls), together with the papers they cite.
+        """
+        arxiv_ids = list(arxiv_ids)
+        self._executemany(
+            "INSERT OR IGNORE INTO papers (arxiv_id, depth) VALUES (?, ?)",
+            ((arxiv_id, depth) for arxiv_id in arxiv_ids),
+        )
+        with self._lock:
+            self.connection.execute("DELETE FROM temp.found")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO temp.found VALUES (?)", ((arxiv_id,) for arxiv_id in arxiv_ids)
+            )
+            lowered = self.connection.execute(LOWERED, {"depth": depth}).fetchall()
+            self.connection.executemany("UPDATE papers SET depth = ? WHERE arxiv_id = ?", ((d, a) for a, d in lowered))
+            self._maybe_checkpoint()
+
+    def add_seeds(self, source: str, arxiv_ids: Iterable[str]) -> None:
+        """
+        Records that the papers are seeds of source, e.g. a seed paper or a PapersWithCode method, see provenance.
+        The papers are not added to the frontier, see VisitedSet.add.
+        """
+        self._executemany(
+            "INSERT OR IGNORE INTO seeds (arxiv_id, source) VALUES (?, ?)", ((arxiv_id, source) for arxiv_id in arxiv_ids)
+        )
+
+    def provenance(self, max_depth: int, page_size: int = 10000) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Yields the written papers with the sources of the seeds they are within max_depth citations of.
+        """
+        self._execute("DROP TABLE IF EXISTS temp.reached")
+        self._execute(f"CREATE TEMP TABLE reached AS {REACHED}", {"max_depth": max_depth})
+        yield from self._paged("""
+            SELECT r.arxiv_id, json_group_array(r.source) FROM reached r
+            JOIN papers p ON p.arxiv_id = r.arxiv_id AND p.written = 1
+            GROUP BY r.arxiv_id
+        """, page_size)
+
+    def relation_provenance(self, max_depth: int, page_size: int = 10000) -> Iterator[Tuple[str, str, List[str]]]:
+        """
+        Yields the written relations with the sources of the seeds whose crawl found them, i.e. that their citing paper
+        is within max_depth - 1 citations of. Reads the table filled by the last call to provenance.
+        """
+        yield from self._paged("""
+            SELECT r.source, r.target, json_group_array(p.source) FROM relations r
+            JOIN reached p ON p.arxiv_id = r.source AND p.hops < :max_depth
+            WHERE r.written = 1
+            GROUP BY r.source, r.target
+        """, page_size, {"max_depth": max_depth})
+
+    def _paged(self, query: str, page_size: int, params=()) -> Iterator[tuple]:
+        # Results are read in pages, the sources are a JSON array in the last column
+        cursor = self._execute(query, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(page_size)
+            if not rows:
+                return
+            for row in rows:
+                yield (*row[:-1], json.loads(row[-1]))
+
+    def visited_ids(self) -> Set[str]:
+        return {row[0] for row in self._execute("SELECT arxiv_id FROM papers")}
+
+    def count_papers(self) -> int:
+        return self._execute("SELECT count(*) FROM papers").fetchone()[0]
+
+    def count_unfinished(self, max_depth: int) -> int:
+        """
+        Number of papers still to be written or to have their references extracted, i.e. the size of the frontier.
+        """
+        return self._execute(f"SELECT count(*) FROM papers WHERE {INCOMPLETE}", {"max_depth": max_depth}).fetchone()[0]
+
+    def iter_ids(self, page_size: int = 10000) -> Iterator[str]:
+        """
+        Yields every known paper, reading page_size rows at a time.
+        """
+        last_rowid = 0
+        while True:
+            rows = self._execute(
+                "SELECT rowid, arxiv_id FROM papers WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, page_size)
+            ).fetchall()
+            if not rows:
+                return
+            for _, arxiv_id in rows:
+                yield arxiv_id
+            last_rowid = rows[-1][0]
+
+    def iter_written(self, page_size: int = 1000) -> Iterator[Tuple[str, dict]]:
+        """
+        Yields the papers in the database with their stored metadata, reading page_size rows at a time.
+        """
+        last_rowid = 0
+        while True:
+            rows = self._execute(
+                """
+                SELECT rowid, arxiv_id, metadata FROM papers
+                WHERE rowid > ? AND written = 1 AND metadata IS NOT NULL ORDER BY rowid LIMIT ?
+                """,
+                (last_rowid, page_size),
+            ).fetchall()
+            if not rows:
+                return
+            for _, arxiv_id, metadata in rows:
+                yield arxiv_id, json.loads(metadata)
+            last_rowid = rows[-1][0]
+
+    def known_ids(self, arxiv_ids: List[str]) -> Set[str]:
+        """
+        Returns the given papers that are already in the frontier or crawled.
+        """
+        known = set()
+        for start in range(0, len(arxiv_ids), 500):
+            batch = arxiv_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            known.update(
+                row[0] for row in self._execute(f"SELECT arxiv_id FROM papers WHERE arxiv_id IN ({placeholders})", batch)
+            )
+        return known
+
+    def _exclude(self, arxiv_ids: Set[str]) -> None:
+        self._executemany("INSERT OR IGNORE INTO excluded (arxiv_id) VALUES (?)", ((arxiv_id,) for arxiv_id in arxiv_ids))
+
+    def next_level(self, max_depth: int, exclude: Set[str], limit: Optional[int] = None) -> Tuple[int, List[str]]:
+        """
+        Returns the smallest depth with unfinished papers and those papers, skipping the excluded ones.
+        With limit, at most limit papers of that depth are returned, so a huge level is crawled in chunks.
+        Returns (-1, []) once the crawl is complete.
+        """
+        self._exclude(exclude)
+        pending = f"{INCOMPLETE} AND arxiv_id NOT IN (SELECT arxiv_id FROM excluded)"
+        row = self._execute(f"SELECT min(depth) FROM papers WHERE {pending}", {"max_depth": max_depth}).fetchone()
+        if row[0] is None:
+            return -1, []
+        rows = self._execute(
+            f"SELECT arxiv_id FROM papers WHERE {pending} AND depth = :depth LIMIT :limit",
+            {"max_depth": max_depth, "depth": row[0], "limit": -1 if limit is None else limit},
+        )
+        return row[0], [arxiv_id for arxiv_id, in rows]
+
+    def next_batch(self, priority: str, size: int, max_depth: int, exclude: Set[str]) -> List[str]:
+        """
+        Returns the size best unfinished papers by priority, one of PRIORITIES, skipping the excluded ones.
+        Scores are recomputed on every call, so papers found citing a queued paper move it up.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority}, expected one of {tuple(PRIORITIES)}")
+        self._exclude(exclude)
+        rows = self._execute(
+            f"""
+            SELECT arxiv_id FROM (
+                SELECT arxiv_id, depth, paper_year(arxiv_id, metadata) AS year,
+                       (SELECT count(*) FROM relations r WHERE r.target = papers.arxiv_id) AS citations
+                FROM papers WHERE {INCOMPLETE} AND arxiv_id NOT IN (SELECT arxiv_id FROM excluded)
+            ) ORDER BY {PRIORITIES[priority]} LIMIT :limit
+            """,
+            {"max_depth": max_depth, "limit": size},
+        ).fetchall()
+        return [arxiv_id for arxiv_id, in rows]
+
+    def get_progress(self, arxiv_ids: List[str]) -> Dict[str, dict]:
+        """
+        Returns the stored depth, metadata, references and written flag of the given papers.
+        """
+        progress = {}
+        for start in range(0, len(arxiv_ids), 500):
+            batch = arxiv_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._execute(
+                f"SELECT arxiv_id, depth, metadata, refs, written FROM papers WHERE arxiv_id IN ({placeholders})", batch
+            )
+            for arxiv_id, depth, metadata, refs, written in rows:
+                progress[arxiv_id] = {
+                    "depth": depth,
+                    "metadata": json.loads(metadata) if metadata is not None else None,
+                    "references": json.loads(refs) if refs is not None else None,
+                    "written": bool(written),
+                }
+        return progress
+
+    def set_metadata(self, metadata: Dict[str, dict]) -> None:
+        self._executemany(
+            "UPDATE papers SET metadata = ? WHERE arxiv_id = ?",
+            ((json.dumps(paper_metadata), arxiv_id) for arxiv_id, paper_metadata in metadata.items()),
+        )
+
+    def requeue_changed(self, metadata: Dict[str, dict], rewrite: Set[str]) -> None:
+        """
+        Stores the metadata of papers with a new version and queues their references for extraction again.
+        The papers in rewrite, whose node properties changed, are queued to be written again too.
+        Their previous references are kept until the new ones are known, see set_references.
+        """
+        self._executemany(
+            """
+            UPDATE papers SET metadata = ?, written = written * ?, previous_refs = coalesce(refs, previous_refs),
+                              refs = NULL, attempts = 0, error = NULL
+            WHERE arxiv_id = ?
+            """,
+            (
+                (json.dumps(paper_metadata), 0 if arxiv_id in rewrite else 1, arxiv_id)
+                for arxiv_id, paper_metadata in metadata.items()
+            ),
+        )
+
+    def set_references(self, arxiv_id: str, references: List[str]) -> None:
+        """
+        Stores the references of a paper and its new relations. References of a previous version that are gone
+        mark their relations to be deleted from the database, see removed_relations.
+        """
+        row = self._execute("SELECT previous_refs FROM papers WHERE arxiv_id = ?", (arxiv_id,)).fetchone()
+        if row is not None and row[0] is not None:
+            removed = set(json.loads(row[0])) - set(references)
+            self._executemany(
+                "DELETE FROM relations WHERE source = ? AND target = ? AND written = 0",
+                ((arxiv_id, ref_id) for ref_id in removed),
+            )
+            self._executemany(
+                "UPDATE relations SET written = -1 WHERE source = ? AND target = ?",
+                ((arxiv_id, ref_id) for ref_id in removed),
+            )
+            # Cited again before the deletion was applied: the relation is still in the database
+            self._executemany(
+                "UPDATE relations SET written = 1 WHERE source = ? AND target = ? AND written = -1",
+                ((arxiv_id, ref_id) for ref_id in references),
+            )
+        self._execute(
+            "UPDATE papers SET refs = ?, previous_refs = NULL, error = NULL WHERE arxiv_id = ?",
+            (json.dumps(references), arxiv_id),
+        )
+        self._executemany(
+            "INSERT OR IGNORE INTO relations (source, target) VALUES (?, ?)",
+            ((arxiv_id, ref_id) for ref_id in references),
+        )
+
+    def mark_written(self, arxiv_ids: Iterable[str]) -> None:
+        self._executemany(
+            "UPDATE papers SET written = 1, error = NULL WHERE arxiv_id = ?", ((arxiv_id,) for arxiv_id in arxiv_ids)
+        )
+
+    def record_failure(self, arxiv_id: str, error: Exception) -> None:
+        self._execute(
+            "UPDATE papers SET attempts = attempts + 1, error = ? WHERE arxiv_id = ?",
+            (f"{type(error).__name__}: {error}", arxiv_id),
+        )
+
+    def _relation_pages(
+        self, query: str, page_size: int, params: Optional[dict] = None
+    ) -> Iterator[List[Tuple[str, str]]]:
+        """
+        Yields the (source, target) relations selected by query, a SELECT of r.rowid, r.source and r.target ending
+        with its WHERE clause, in pages of page_size read by rowid. The caller may update or delete the relations of
+        a page before reading the next one.
+        """
+        last_rowid = 0
+        while True:
+            rows = self._execute(
+                f"{query} AND r.rowid > :last_rowid ORDER BY r.rowid LIMIT :page_size",
+                {**(params or {}), "last_rowid": last_rowid, "page_size": page_size},
+            ).fetchall()
+            if not rows:
+                return
+            yield [(source, target) for _, source, target in rows]
+            last_rowid = rows[-1][0]
+
+    def pending_relations(self, page_size: int = 10000) -> Iterator[List[Tuple[str, str]]]:
+        """
+        Relations not written yet whose two papers are already in the database, in pages of page_size.
+        """
+        return self._relation_pages(PENDING_RELATIONS, page_size)
+
+    def mark_relations_written(self, relations: Iterable[Tuple[str, str]]) -> None:
+        self._executemany("UPDATE relations SET written = 1 WHERE source = ? AND target = ?", relations)
+
+    def removed_relations(self, page_size: int = 10000) -> Iterator[List[Tuple[str, str]]]:
+        """
+        Relations in the database that the latest version of their citing paper no longer has, in pages of page_size.
+        """
+        return self._relation_pages(REMOVED_RELATIONS, page_size)
+
+    def delete_relations(self, relations: Iterable[Tuple[str, str]]) -> None:
+        self._executemany("DELETE FROM relations WHERE source = ? AND target = ?", relations)
+
+    def relations(self, page_size: int = 10000) -> Iterator[Tuple[str, str]]:
+        """
+        Yields every current citation found so far, written or not, reading page_size rows at a time.
+        """
+        for page in self._relation_pages(CURRENT_RELATIONS, page_size):
+            yield from page
+
+    def failures(self) -> List[Tuple[str, int, str]]:
+        return self._execute(
+            "SELECT arxiv_id, attempts, error FROM papers WHERE error IS NOT NULL ORDER BY attempts DESC"
+        ).fetchall()
+
+    def summary(self, max_depth: Optional[int] = None) -> str:
+        total, written, with_refs, failed = self._execute(
+            "SELECT count(*), sum(written), count(refs), count(error) FROM papers"
+        ).fetchone()
+        summary = f"{total} papers known, {written or 0} written, {with_refs} with references, {failed} failed"
+        if max_depth is not None:
+            summary += f", {self.count_unfinished(max_depth)} unfinished"
+        return summary
+
+
+if __name__ == "__main__":
+    import sys
+
+    state = CrawlState(sys.argv[1])
+    print(state.summary())
+    for arxiv_id, attempts, error in state.failures():
+        print(f"{arxiv_id} ({attempts} attempts): {error}")
@@ -0,0 +1,155 @@
+"""
+Pipeline that extracts the arXiv references of many papers: a thread pool downloads the PDFs while a process pool
+parses them on every core, and the results are streamed back as soon as each paper is done.
+PDFs are streamed to files of the cache directory and parsed from there page by page, never held in memory whole.
+"""
+
+
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from processPdf import download_pdf_to_file, iter_pdf_text
+from getReferencesArticles import ReferenceScanner, extract_arxiv_references_from_article
+from pdfCache import PdfCache, fetch_pdf_file, get_default_cache
+from crawlMetrics import get_metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+# (paper id, references or None, error or None)
+PipelineResult = Tuple[str, Optional[List[str]], Optional[Exception]]
+
+
+def parse_pdf(path: str, mode: str = "full") -> Tuple[Optional[str], List[str], Dict[str, float]]:
+    """
+    Extracts the arXiv references of a PDF file, and its text in "full" mode. Runs in a worker process,
+    so the time spent parsing the PDF and scanning its text is returned to be recorded by the parent.
+    """
+    pages: List[str] = []
+    scanner = ReferenceScanner()
+    timings = {"pdf_parse": 0.0, "reference_scan": 0.0}
+    page_texts = iter_pdf_text(path, mode)
+    while True:
+        start = time.perf_counter()
+        text = next(page_texts, None)
+        timings["pdf_parse"] += time.perf_counter() - start
+        if text is None:
+            break
+        start = time.perf_counter()
+        scanner.feed(text + "\n")
+        timings["reference_scan"] += time.perf_counter() - start
+        if mode == "full":
+            pages.append(text)
+    references = scanner.close()
+    return ("\n".join(pages) + "\n" if mode == "full" else None), references, timings
+
+
+def stream_article_references(
+    paper_ids: Iterable[str],
+    cache: Optional[PdfCache] = None,
+    download_workers: int = 8,
+    parse_workers: Optional[int] = None,
+    download: Callable[[str, BinaryIO], int] = download_pdf_to_file,
+    parse_executor: Optional[Executor] = None,
+    mode: str = "fast",
+) -> Iterator[PipelineResult]:
+    """
+    Yields (paper_id, references, error) for each paper in completion order.
+    A failing paper is reported with its error and does not stop the others.
+    paper_ids may be a lazy iterator: papers are pulled only when there is room in the pipeline,
+    which also bounds the number of downloaded PDFs waiting on disk.
+    download streams a PDF url to a binary file, see processPdf.download_pdf_to_file.
+    mode is the PDF extraction mode of processPdf, only the text of "full" extractions is cached.
+    """
+    cache = cache or get_default_cache()
+    metrics = get_metrics()
+    parse_workers = parse_workers or os.cpu_count() or 1
+    max_in_flight = download_workers + 2 * parse_workers
+    remaining_ids = iter(paper_ids)
+
+    download_pool = ThreadPoolExecutor(max_workers=download_workers)
+    parse_pool = parse_executor or ProcessPoolExecutor(max_workers=parse_workers)
+    # future -> (stage, paper id)
+    in_flight: Dict[Future, Tuple[str, str]] = {}
+    # paper id -> downloaded file being parsed, added to the cache once parsed
+    downloads: Dict[str, str] = {}
+
+    try:
+        exhausted = False
+        while True:
+            # Refill the pipeline, answering cached papers straight away
+            while not exhausted and len(in_flight) < max_in_flight:
+                paper_id = next(remaining_ids, None)
+                if paper_id is None:
+                    exhausted = True
+                    break
+                try:
+                    references = cache.get_references(paper_id)
+                    if references is None:
+                        text = cache.get_text(paper_id)
+                        if text is not None:
+                            references = extract_arxiv_references_from_article(text)
+                            cache.put_references(paper_id, references)
+                except Exception as e:
+                    yield paper_id, None, e
+                    continue
+                if references is not None:
+                    metrics.increment("papers_extracted", result="cached")
+                    yield paper_id, references, None
+                else:
+                    in_flight[download_pool.submit(fetch_pdf_file, paper_id, cache, download)] = ("download", paper_id)
+
+            if not in_flight:
+                break
+            stages = [stage for stage, _ in in_flight.values()]
+            metrics.set_gauge("pipeline_in_flight", stages.count("download"), stage="download")
+            metrics.set_gauge("pipeline_in_flight", stages.count("parse"), stage="parse")
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, paper_id = in_flight.pop(future)
+                if stage == "parse" and paper_id in downloads:
+                    cache.put_pdf_file(paper_id, downloads.pop(paper_id))
+                try:
+                    result = future.result()
+                except Exception as e:
+                    metrics.increment("papers_extracted", result="error")
+                    yield paper_id, None, e
+                    continue
+
+                if stage == "download":
+                    path, downloaded = result
+                    if downloaded:
+                        downloads[paper_id] = path
+                    in_flight[parse_pool.submit(parse_pdf, path, mode)] = ("parse", paper_id)
+                    continue
+
+                text, references, timings = result
+                for stage_name, seconds in timings.items():
+                    metrics.observe(stage_name, seconds)
+                metrics.increment("papers_extracted", result="parsed")
+                try:
+                    if mode == "full":
+                        cache.put_text(paper_id, text)
+                    cache.put_references(paper_id, references)
+                except OSError as e:
+                    logger.warning("Failed to cache %s: %s", paper_id, e)
+                yield paper_id, references, None
+    finally:
+        download_pool.shutdown(wait=False, cancel_futures=True)
+        if parse_executor is None:
+            parse_pool.shutdown(wait=False, cancel_futures=True)
+        # Files of papers whose parsing was abandoned are still complete downloads
+        for paper_id, path in downloads.items():
+            try:
+                cache.put_pdf_file(paper_id, path)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    for paper_id, references, error in stream_article_references(["1706.03762", "1805.08355"]):
+        print(paper_id, references if error is None else f"failed: {error}")
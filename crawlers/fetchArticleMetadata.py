@@ -3,88 +3,203 @@ Function that retrieves arXiv article metadata.
 """
 
 
-import requests
+import logging
 import xml.etree.ElementTree as ET
-import time
+from typing import Dict, Iterable, List, Optional
+from utils import arxiv_version, strip_version
+from httpClient import get_client
+from crawlConfig import get_config
+from metadataIndex import MetadataIndex, get_default_index
+from crawlMetrics import get_metrics
 
 
-def fetch_arxiv_metadata(arxiv_query: str) -> dict:
+logger = logging.getLogger(__name__)
+
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+MAX_BATCH_SIZE = 200  # The arXiv API serves a few hundred ids per id_list query comfortably
+
+def unknown_metadata() -> dict:
     """
-    Fetches metadata from the ArXiv API.
+    Placeholder metadata of a paper unknown to arXiv.
     """
-    base_url = "http://export.arxiv.org/api/query"
-    retries = 3  # Number of retries for failed requests
-    for attempt in range(retries):
-        try:
-            # Make the API request
-            response = requests.get(base_url, params={"search_query": arxiv_query, "max_results": 1}, timeout=10)
-            
-            # Check for HTTP errors
-            if response.status_code != 200:
-                print(f"ArXiv API request failed with status {response.status_code}, retrying...")
-                time.sleep(2 ** attempt)  # Exponential backoff
-                continue
-            
-            # Parse the XML response
-            root = ET.fromstring(response.text)
-            entry = root.find("{http://www.w3.org/2005/Atom}entry")
-
-            if entry is None:
-                print(f"No entry found in the ArXiv response for query {arxiv_query}")
-                return {
-                    "title": "Unknown Title",
-                    "authors": [],
-                    "published": "0000-00-00T00:00:00Z",
-                    "link": ""
-                }
-
-            # Extract metadata with proper fallbacks
-            title = entry.find("{http://www.w3.org/2005/Atom}title")
-            title = title.text.strip() if title is not None else "Unknown Title"
-
-            authors = [
-                author.find("{http://www.w3.org/2005/Atom}name").text
-                for author in entry.findall("{http://www.w3.org/2005/Atom}author")
-                if author.find("{http://www.w3.org/2005/Atom}name") is not None
-            ]
-
-            published = entry.find("{http://www.w3.org/2005/Atom}published")
-            published = published.text.strip() if published is not None else "0000-00-00T00:00:00Z"
-
-            link = entry.find("{http://www.w3.org/2005/Atom}id")
-            link = link.text.strip() if link is not None else ""
-
-            return {
-                "title": title,
-                "authors": authors,
-                "published": published,
-                "link": link
-            }
-
-        except ET.ParseError as e:
-            print(f"Failed to parse XML from ArXiv API for query {arxiv_query}: {e}")
-            return {
-                "title": "Unknown Title",
-                "authors": [],
-                "published": "0000-00-00T00:00:00Z",
-                "link": ""
-            }
-
-        except requests.exceptions.RequestException as e:
-            print(f"Network or API error for query {arxiv_query}: {e}, retrying...")
-            time.sleep(2 ** attempt)  
-            continue
-
-    # If all retries fail
-    print(f"Failed to fetch metadata for {arxiv_query} after {retries} attempts.")
     return {
         "title": "Unknown Title",
         "authors": [],
         "published": "0000-00-00T00:00:00Z",
+        "updated": "",
         "link": ""
     }
 
+
+def parse_entry(entry: ET.Element) -> dict:
+    """
+    Extracts the metadata of one Atom entry of an arXiv API response.
+    """
+    # Extract metadata with proper fallbacks
+    title = entry.find(f"{ATOM}title")
+    title = title.text.strip() if title is not None else "Unknown Title"
+
+    authors = [
+        author.find(f"{ATOM}name").text
+        for author in entry.findall(f"{ATOM}author")
+        if author.find(f"{ATOM}name") is not None
+    ]
+
+    published = entry.find(f"{ATOM}published")
+    published = published.text.strip() if published is not None else "0000-00-00T00:00:00Z"
+
+    # Date of the latest version, the link ends with its version
+    updated = entry.find(f"{ATOM}updated")
+    updated = updated.text.strip() if updated is not None else ""
+
+    link = entry.find(f"{ATOM}id")
+    link = link.text.strip() if link is not None else ""
+
+    return {
+        "title": title,
+        "authors": authors,
+        "published": published,
+        "updated": updated,
+        "link": link
+    }
+
+
+def is_newer_version(old: dict, new: dict) -> bool:
+    """
+    Whether new metadata describes a later version of a paper than old, by the version of their link and, for the
+    same version, their updated date. Metadata without a version, e.g. unknown_metadata(), is never newer.
+    """
+    new_version = arxiv_version(new.get("link", ""))
+    if new_version is None:
+        return False
+    old_version = arxiv_version(old.get("link", ""))
+    if old_version != new_version:
+        return old_version is None or int(new_version[1:]) > int(old_version[1:])
+    return bool(old.get("updated")) and bool(new.get("updated")) and new["updated"] > old["updated"]
+
+
+def fetch_arxiv_metadata(arxiv_query: str, index: Optional[MetadataIndex] = None) -> dict:
+    """
+    Fetches metadata from the ArXiv API.
+    Queries of a single id ("id:1706.03762") are answered by the local metadata index when it has the paper.
+    Retries and backoff on throttling or network errors are handled by the shared HTTP client.
+    """
+    index = index if index is not None else get_default_index()
+    if index is not None and arxiv_query.startswith("id:"):
+        metadata = index.get(arxiv_query[len("id:"):])
+        if metadata is not None:
+            get_metrics().increment("metadata_lookups", source="index")
+            return metadata
+    get_metrics().increment("metadata_lookups", source="api")
+    import requests
+
+    try:
+        # Make the API request
+        response = get_client().get(get_config().arxiv_api_url, params={"search_query": arxiv_query, "max_results": 1})
+
+        # Check for HTTP errors
+        if response.status_code != 200:
+            logger.warning("ArXiv API request failed with status %s for query %s", response.status_code, arxiv_query)
+            return unknown_metadata()
+
+        # Parse the XML response
+        with get_metrics().timer("metadata_parse"):
+            root = ET.fromstring(response.text)
+            entry = root.find(f"{ATOM}entry")
+
+            if entry is None:
+                logger.warning("No entry found in the ArXiv response for query %s", arxiv_query)
+                return unknown_metadata()
+
+            return parse_entry(entry)
+
+    except ET.ParseError as e:
+        logger.warning("Failed to parse XML from ArXiv API for query %s: %s", arxiv_query, e)
+        return unknown_metadata()
+
+    except requests.exceptions.RequestException as e:
+        logger.warning("Network or API error for query %s: %s", arxiv_query, e)
+        return unknown_metadata()
+
+
+def _fetch_batch(ids: List[str]) -> Dict[str, dict]:
+    """
+    Fetches one id_list batch, keyed by the ids as they were requested. Ids arXiv does not know get unknown_metadata(),
+    ids whose request failed (network, HTTP or parse errors) are left out so the caller can retry them.
+    """
+    import requests
+
+    try:
+        response = get_client().get(
+            get_config().arxiv_api_url, params={"id_list": ",".join(ids), "max_results": len(ids)}
+        )
+
+        # A malformed id makes arXiv reject the whole batch: split it to isolate the culprit
+        if response.status_code == 400 and len(ids) > 1:
+            middle = len(ids) // 2
+            return {**_fetch_batch(ids[:middle]), **_fetch_batch(ids[middle:])}
+
+        if response.status_code == 400:
+            logger.warning("ArXiv API rejected the id %s", ids[0])
+            return {ids[0]: unknown_metadata()}
+
+        if response.status_code != 200:
+            logger.warning("ArXiv API batch request failed with status %s for %d ids", response.status_code, len(ids))
+            return {}
+
+        found: Dict[str, dict] = {}
+        with get_metrics().timer("metadata_parse"):
+            root = ET.fromstring(response.text)
+            for entry in root.findall(f"{ATOM}entry"):
+                metadata = parse_entry(entry)
+                if "/abs/" in metadata["link"]:
+                    entry_id = metadata["link"].split("/abs/")[-1]
+                    found[entry_id] = metadata
+                    found.setdefault(strip_version(entry_id), metadata)
+
+        results = {}
+        for arxiv_id in ids:
+            metadata = found.get(arxiv_id) or found.get(strip_version(arxiv_id))
+            if metadata is None:
+                logger.warning("No entry found in the ArXiv response for id %s", arxiv_id)
+            results[arxiv_id] = metadata or unknown_metadata()
+        return results
+
+    except ET.ParseError as e:
+        logger.warning("Failed to parse XML from ArXiv API for batch of %d ids: %s", len(ids), e)
+
+    except requests.exceptions.RequestException as e:
+        logger.warning("Network or API error for batch of %d ids: %s", len(ids), e)
+
+    return {}
+
+
+def fetch_arxiv_metadata_batch(
+    ids: Iterable[str], batch_size: int = MAX_BATCH_SIZE, index: Optional[MetadataIndex] = None, use_index: bool = True
+) -> Dict[str, dict]:
+    """
+    Fetches metadata for many papers, from the local metadata index (the default one if index is None) and
+    with the id_list parameter of the ArXiv API for the papers missing from it.
+    Without use_index every paper is asked to the API, e.g. to find versions newer than the index snapshot.
+    Returns a dict mapping each requested id to the same dict fetch_arxiv_metadata returns. The ids whose batch
+    failed are missing from it, unlike the ids arXiv does not know, see _fetch_batch.
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    index = (index if index is not None else get_default_index()) if use_index else None
+    results: Dict[str, dict] = index.get_many(unique_ids) if index is not None else {}
+    missing_ids = [arxiv_id for arxiv_id in unique_ids if arxiv_id not in results]
+    get_metrics().increment("metadata_lookups", len(results), source="index")
+    get_metrics().increment("metadata_lookups", len(missing_ids), source="api")
+    for start in range(0, len(missing_ids), batch_size):
+        results.update(_fetch_batch(missing_ids[start:start + batch_size]))
+    return results
+
+
 if __name__ == "__main__":
+    from crawlMetrics import configure_logging
+
+    configure_logging()
     # Example queries for testing the function
     test_queries = [
         "id:1706.03762",  
@@ -95,4 +210,6 @@ if __name__ == "__main__":
         metadata = fetch_arxiv_metadata(query)
         print("Metadata retrieved:")
         print(metadata)
-        print("-" * 50)  # Separator for readability
\ No newline at end of file
+        print("-" * 50)  # Separator for readability
+
+    print(fetch_arxiv_metadata_batch(["1706.03762", "1805.08355v1", "hep-th/9901001"]))
\ No newline at end of file
@@ -4,21 +4,134 @@ Helper function to extract the ArXiv references codes from an article
 
 
 import re
-from typing import List
+from typing import Dict, Iterable, List
+
+
+# Archives of the old-style ids (hep-th/9901001), used until March 2007
+OLD_STYLE_ARCHIVES = (
+    "acc-phys", "adap-org", "alg-geom", "ao-sci", "astro-ph", "atom-ph", "bayes-an", "chao-dyn", "chem-ph", "cmp-lg",
+    "comp-gas", "cond-mat", "cs", "dg-ga", "funct-an", "gr-qc", "hep-ex", "hep-lat", "hep-ph", "hep-th", "math",
+    "math-ph", "mtrl-th", "nlin", "nucl-ex", "nucl-th", "patt-sol", "physics", "plasm-ph", "q-alg", "q-bio", "q-fin",
+    "quant-ph", "solv-int", "stat", "supr-con",
+)
+YYMM = r"\d{2}(?:0[1-9]|1[0-2])"
+# Candidates are found by two searches starting with a literal, which the regex engine skips to directly, as
+# alternatives or case-insensitive patterns would make it try every position:
+# - "xiv" in the lowercased text, for arXiv:2001.08361, arXiv 2001.08361, the arXiv DOI 10.48550/arXiv.2001.08361
+#   and arxiv.org/abs/2001.08361 or arxiv.org/pdf/2001.08361 (the "ar" before it is checked afterwards);
+# - "/" for CoRR abs/2001.08361 and old-style ids (hep-th/9901001), whose prefix is then checked in a short window.
+# Bare new-style ids are too ambiguous to be matched without a prefix. Matches never span a newline,
+# which is what lets ReferenceScanner scan line by line.
+ARXIV_CANDIDATE = re.compile(rf"xiv(?:[ \t]*:[ \t]*|[ \t]+|\.(?:org/(?:abs|pdf)/)?)(?P<id>{YYMM}\.\d{{4,5}})(?!\d)")
+# For the rare texts whose length changes when lowercased (e.g. with a dotted capital I), so offsets would not match
+ARXIV_CANDIDATE_IGNORECASE = re.compile(ARXIV_CANDIDATE.pattern, re.IGNORECASE)
+SLASH_CANDIDATE = re.compile(rf"/(?:(?P<number>{YYMM}\d{{3}})|(?P<id>{YYMM}\.\d{{4,5}}))(?!\d)")
+CORR_PREFIX = re.compile(r"(?<!\w)abs\Z", re.IGNORECASE)
+# hep-th/9901001, math.GT/0309136 (with subject class)
+OLD_STYLE_PREFIX = re.compile(
+    rf"(?<![\w.-])(?P<archive>{'|'.join(re.escape(archive) for archive in OLD_STYLE_ARCHIVES)})(?:\.[A-Za-z]{{2}})?/\Z",
+    re.IGNORECASE,
+)
+PREFIX_WINDOW = 32
+# Pages are scanned in blocks of at least this many characters, each scan has a fixed cost
+SCAN_BLOCK = 1 << 16
+
+
+class ReferenceScanner:
+    def __init__(self):
+        """
+        Single-pass scanner of the arXiv references of a text fed in chunks of any size, e.g. page by page.
+        Ids are normalized without version (and without subject class for old-style ids) and deduplicated,
+        positions holds the offsets of every occurrence of each id in the concatenated text.
+        """
+        self.positions: Dict[str, List[int]] = {}
+        self._pending: List[str] = []
+        self._pending_size = 0
+        self._offset = 0
+
+    def _scan(self, text: str) -> None:
+        # Keyed by offset: arxiv.org/abs/ ids are found by both searches
+        found: Dict[int, str] = {}
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            candidates = ARXIV_CANDIDATE.finditer(lowered)
+        else:
+            candidates = ARXIV_CANDIDATE_IGNORECASE.finditer(text)
+        for match in candidates:
+            start = match.start()
+            if start >= 2 and text[start - 2:start].lower() == "ar":
+                found[match.start("id")] = match.group("id")
+        for match in SLASH_CANDIDATE.finditer(text):
+            if match.group("id") is not None:
+                if CORR_PREFIX.search(text, max(0, match.start() - 4), match.start()):
+                    found[match.start("id")] = match.group("id")
+                continue
+            prefix = OLD_STYLE_PREFIX.search(text, max(0, match.start() - PREFIX_WINDOW), match.start() + 1)
+            if prefix is not None:
+                found[prefix.start()] = f"{prefix.group('archive').lower()}/{match.group('number')}"
+        for start in sorted(found):
+            self.positions.setdefault(found[start], []).append(self._offset + start)
+
+    def feed(self, text: str) -> None:
+        """
+        Buffers the text and scans the complete lines once SCAN_BLOCK characters are pending,
+        the last partial line waits for the next chunk.
+        """
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size < SCAN_BLOCK:
+            return
+        pending = "".join(self._pending)
+        end = pending.rfind("\n") + 1
+        if end:
+            self._scan(pending[:end])
+            self._offset += end
+            pending = pending[end:]
+        self._pending = [pending]
+        self._pending_size = len(pending)
+
+    def close(self) -> List[str]:
+        """
+        Scans the remaining text and returns the references in order of first occurrence.
+        """
+        pending = "".join(self._pending)
+        self._scan(pending)
+        self._offset += len(pending)
+        self._pending = []
+        self._pending_size = 0
+        return self.references
+
+    @property
+    def references(self) -> List[str]:
+        return list(self.positions)
 
 
 def extract_arxiv_references_from_article(text: str) -> List[str]:
     """
-    Extracts arXiv references in the formats 'arXiv:2001.08361' and 'abs/2001.08361'.
+    Extracts the arXiv references of a text, deduplicated and without version, in order of first occurrence.
+    Handles new-style (arXiv:2001.08361v2, arxiv.org/abs/..., abs/..., 10.48550/arXiv....) and old-style (hep-th/9901001) ids.
     """
     # First version:
     # references = re.findall(r"arXiv:\d{4}\.\d{4,5}", text)
     # references = [reference.split(":")[1] for reference in references]
 
-    # Match both arXiv:XXXX.XXXX and abs/XXXX.XXXX formats
-    references = re.findall(r"(?:arXiv:|abs/)(\d{4}\.\d{4,5})", text)
+    # Second version, which missed old-style ids and returned duplicates:
+    # references = re.findall(r"(?:arXiv:|abs/)(\d{4}\.\d{4,5})", text)
+
+    scanner = ReferenceScanner()
+    scanner.feed(text)
+    return scanner.close()
 
-    return references
+
+def extract_arxiv_references_from_pages(pages: Iterable[str]) -> List[str]:
+    """
+    Same as extract_arxiv_references_from_article on text streamed page by page, e.g. by processPdf.iter_pdf_text.
+    Pages are joined by newlines as in the full text.
+    """
+    scanner = ReferenceScanner()
+    for page in pages:
+        scanner.feed(page + "\n")
+    return scanner.close()
 
 
 if __name__ == "__main__":
@@ -26,4 +139,4 @@ if __name__ == "__main__":
 
     text = extract_text_from_pdf("https://arxiv.org/pdf/1706.03762")
     references = extract_arxiv_references_from_article(text)
-    print(references, len(references))
\ No newline at end of file
+    print(references, len(references))
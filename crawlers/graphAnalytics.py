@@ -0,0 +1,180 @@
+"""
+Offline analytics of the citation graph with NumPy/SciPy sparse matrices: PageRank, citation in/out-degree, weakly
+connected components and k-hop ego-graphs. Works on a crawl's in-memory graph or on an edge file, without Neo4j.
+
+Usage: python graphAnalytics.py <edges.csv | edges.parquet | crawl_state.sqlite> [--seed ARXIV_ID] [--hops K] [--top N]
+"""
+
+
+import argparse
+import csv
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from citationGraph import CitationGraph
+
+
+def write_edge_file(graph: CitationGraph, path: str) -> None:
+    """
+    Writes the citations as a "source,target" CSV file.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["source", "target"])
+        writer.writerows(graph.edges())
+
+
+def read_edge_file(path: str) -> CitationGraph:
+    """
+    Reads a CSV file whose first two columns are the citing and the cited arXiv ids, after a header row,
+    or a Parquet file with source and target columns as written by graphExport (needs pyarrow).
+    """
+    graph = CitationGraph()
+    if path.endswith(".parquet"):
+        from graphExport import read_parquet
+
+        for edge in read_parquet(path, batch_size=10000):
+            graph.add_edge(edge["source"], edge["target"])
+        return graph
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) >= 2:
+                graph.add_edge(row[0], row[1])
+    return graph
+
+
+class GraphMatrix:
+    def __init__(self, graph: Union[CitationGraph, Dict[str, List[str]]]):
+        """
+        Sparse adjacency matrix of a citation graph: adjacency[i, j] = 1 when paper i cites paper j.
+        """
+        if not isinstance(graph, CitationGraph):
+            graph = CitationGraph.from_dict(graph)
+        self.ids = np.array(graph.ids, dtype=object)
+        self.index = graph.index
+        n = len(graph.ids)
+        # The edge arrays of CitationGraph are shared with NumPy without copying
+        sources = np.frombuffer(graph.sources, dtype=np.int32) if graph.num_edges else np.zeros(0, dtype=np.int32)
+        targets = np.frombuffer(graph.targets, dtype=np.int32) if graph.num_edges else np.zeros(0, dtype=np.int32)
+        adjacency = sparse.csr_matrix((np.ones(len(sources), dtype=np.float64), (sources, targets)), shape=(n, n))
+        adjacency.sum_duplicates()
+        adjacency.data[:] = 1.0
+        self.adjacency = adjacency
+        self._transpose = None
+
+    @property
+    def transpose(self) -> sparse.csr_matrix:
+        if self._transpose is None:
+            self._transpose = self.adjacency.T.tocsr()
+        return self._transpose
+
+    def in_degree(self) -> np.ndarray:
+        """
+        Number of crawled papers citing each paper.
+        """
+        return np.asarray(self.adjacency.sum(axis=0)).ravel().astype(np.int64)
+
+    def out_degree(self) -> np.ndarray:
+        """
+        Number of papers each paper cites.
+        """
+        return np.asarray(self.adjacency.sum(axis=1)).ravel().astype(np.int64)
+
+    def pagerank(self, damping: float = 0.85, tol: float = 1e-10, max_iter: int = 100) -> np.ndarray:
+        """
+        PageRank by power iteration. The rank of papers citing nothing is spread uniformly.
+        """
+        n = self.adjacency.shape[0]
+        if n == 0:
+            return np.zeros(0)
+        out_degree = self.out_degree().astype(np.float64)
+        dangling = out_degree == 0
+        inverse_out = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+        ranks = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            previous = ranks
+            ranks = damping * (self.transpose @ (ranks * inverse_out))
+            ranks += (damping * previous[dangling].sum() + 1.0 - damping) / n
+            if np.abs(ranks - previous).sum() < tol:
+                break
+        return ranks
+
+    def weak_components(self) -> Tuple[int, np.ndarray]:
+        """
+        Returns the number of weakly connected components and the component label of each paper.
+        """
+        return connected_components(self.adjacency, directed=True, connection="weak")
+
+    def ego_graph(self, seed: str, hops: int, direction: str = "both") -> Dict[str, int]:
+        """
+        Papers within hops citations of seed, with their distance.
+        direction is "out" (papers cited by seed), "in" (papers citing seed) or "both".
+        """
+        if seed not in self.index:
+            return {}
+        matrices = {"out": [self.adjacency], "in": [self.transpose], "both": [self.adjacency, self.transpose]}[direction]
+        distances = np.full(self.adjacency.shape[0], -1, dtype=np.int64)
+        frontier = np.array([self.index[seed]])
+        distances[frontier] = 0
+        for hop in range(1, hops + 1):
+            reached = np.concatenate([matrix[frontier].indices for matrix in matrices])
+            frontier = np.unique(reached[distances[reached] < 0])
+            if len(frontier) == 0:
+                break
+            distances[frontier] = hop
+        reached = np.flatnonzero(distances >= 0)
+        return dict(zip(self.ids[reached], distances[reached].tolist()))
+
+    def top(self, scores: np.ndarray, count: int = 10) -> List[Tuple[str, float]]:
+        """
+        The count papers with the highest scores.
+        """
+        count = min(count, len(scores))
+        best = np.argpartition(-scores, count - 1)[:count] if count else np.zeros(0, dtype=np.int64)
+        best = best[np.argsort(-scores[best])]
+        return list(zip(self.ids[best], scores[best].tolist()))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="PageRank, citation counts and components of a citation graph.")
+    parser.add_argument("path", help="edge file (CSV or Parquet) or crawl state file (.sqlite)")
+    parser.add_argument("--top", type=int, default=20, help="papers listed per ranking")
+    parser.add_argument("--seed", help="count the papers within --hops citations of this paper")
+    parser.add_argument("--hops", type=int, default=2)
+    args = parser.parse_args(argv)
+    path, top = args.path, args.top
+
+    if path.endswith(".sqlite"):
+        from crawlState import CrawlState
+
+        graph = CitationGraph()
+        state = CrawlState(path)
+        try:
+            for source, target in state.relations():
+                graph.add_edge(source, target)
+        finally:
+            state.close()
+    else:
+        graph = read_edge_file(path)
+    print(graph)
+
+    matrix = GraphMatrix(graph)
+    print("Top PageRank:")
+    for arxiv_id, score in matrix.top(matrix.pagerank(), top):
+        print(f"  {arxiv_id}  {score:.6f}")
+    print("Most cited:")
+    for arxiv_id, count in matrix.top(matrix.in_degree(), top):
+        print(f"  {arxiv_id}  {int(count)}")
+    component_count, labels = matrix.weak_components()
+    sizes = np.bincount(labels) if len(labels) else np.zeros(0, dtype=np.int64)
+    print(f"{component_count} weakly connected components, largest has {sizes.max() if len(sizes) else 0} papers")
+    if args.seed:
+        ego = matrix.ego_graph(args.seed, args.hops)
+        print(f"{len(ego)} papers within {args.hops} hops of {args.seed}")
+
+
+if __name__ == "__main__":
+    main()
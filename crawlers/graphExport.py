@@ -0,0 +1,211 @@
+"""
+Streaming export of the citation graph from Neo4j to node and edge files, and bulk import of those files.
+CSV files use the header format of `neo4j-admin database import`, Parquet files need the optional pyarrow package.
+
+Usage: python graphExport.py export <directory> [--format csv|parquet] [--page-size N]
+       python graphExport.py import <directory> [--format csv|parquet] [--batch-size N]
+"""
+
+
+import argparse
+import csv
+import logging
+import os
+from typing import Dict, Iterator, List, Tuple
+from graphWriter import GraphWriter, get_driver
+from crawlConfig import get_config
+from graphSchema import ensure_schema
+
+
+logger = logging.getLogger(__name__)
+
+
+FORMATS = ("csv", "parquet")
+
+NODES_HEADER = ["paper_index:ID(Paper)", "title", "authors:string[]", "publication_year:int", ":LABEL"]
+EDGES_HEADER = [":START_ID(Paper)", ":END_ID(Paper)", ":TYPE"]
+ARRAY_DELIMITER = ";"  # Default array delimiter of neo4j-admin
+
+# Pages are read in paper_index order, which is an index scan on the uniqueness constraint
+PAGE_QUERY = """
+MATCH (p:Paper) WHERE p.paper_index > $after
+WITH p ORDER BY p.paper_index LIMIT $limit
+OPTIONAL MATCH (p)-[:CITES]->(cited:Paper)
+RETURN p.paper_index AS paper_index, p.title AS title, p.authors AS authors,
+       p.publication_year AS publication_year, collect(cited.paper_index) AS references
+ORDER BY paper_index
+"""
+
+
+def file_paths(directory: str, file_format: str) -> Tuple[str, str]:
+    return os.path.join(directory, f"nodes.{file_format}"), os.path.join(directory, f"edges.{file_format}")
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("The parquet format needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+class CsvSink:
+    def __init__(self, directory: str):
+        nodes_path, edges_path = file_paths(directory, "csv")
+        self.files = [open(nodes_path, "w", newline=""), open(edges_path, "w", newline="")]
+        self.nodes, self.edges = (csv.writer(f) for f in self.files)
+        self.nodes.writerow(NODES_HEADER)
+        self.edges.writerow(EDGES_HEADER)
+
+    def write(self, papers: List[Dict], edges: List[Tuple[str, str]]) -> None:
+        self.nodes.writerows(
+            [
+                paper["paper_index"],
+                paper["title"] or "",
+                ARRAY_DELIMITER.join(paper["authors"] or []),
+                "" if paper["publication_year"] is None else paper["publication_year"],
+                "Paper",
+            ]
+            for paper in papers
+        )
+        self.edges.writerows([source, target, "CITES"] for source, target in edges)
+
+    def close(self) -> None:
+        for f in self.files:
+            f.close()
+
+
+class ParquetSink:
+    def __init__(self, directory: str):
+        pyarrow = _import_pyarrow()
+        self.pyarrow = pyarrow
+        self.nodes_schema = pyarrow.schema([
+            ("paper_index", pyarrow.string()),
+            ("title", pyarrow.string()),
+            ("authors", pyarrow.list_(pyarrow.string())),
+            ("publication_year", pyarrow.int64()),
+        ])
+        self.edges_schema = pyarrow.schema([("source", pyarrow.string()), ("target", pyarrow.string())])
+        nodes_path, edges_path = file_paths(directory, "parquet")
+        self.nodes = pyarrow.parquet.ParquetWriter(nodes_path, self.nodes_schema)
+        self.edges = pyarrow.parquet.ParquetWriter(edges_path, self.edges_schema)
+
+    def write(self, papers: List[Dict], edges: List[Tuple[str, str]]) -> None:
+        columns = {name: [paper[name] for paper in papers] for name in self.nodes_schema.names}
+        self.nodes.write_table(self.pyarrow.table(columns, schema=self.nodes_schema))
+        if edges:
+            sources, targets = zip(*edges)
+            self.edges.write_table(
+                self.pyarrow.table({"source": list(sources), "target": list(targets)}, schema=self.edges_schema)
+            )
+
+    def close(self) -> None:
+        self.nodes.close()
+        self.edges.close()
+
+
+def export_graph(directory: str, file_format: str = "csv", page_size: int = 10000) -> Tuple[int, int]:
+    """
+    Streams every paper and citation to directory, reading page_size papers per query so memory stays bounded.
+    Returns the number of papers and citations exported.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format {file_format}, expected one of {FORMATS}")
+    os.makedirs(directory, exist_ok=True)
+    driver = get_driver()
+    database = get_config().neo4j_database
+    # Legacy id/REFERENCES data is migrated first, so it is exported too
+    ensure_schema(driver, database)
+
+    sink = CsvSink(directory) if file_format == "csv" else ParquetSink(directory)
+    paper_count, edge_count, after = 0, 0, ""
+    try:
+        with driver.session(database=database or None) as session:
+            while True:
+                records = session.execute_read(
+                    lambda tx: [record.data() for record in tx.run(PAGE_QUERY, after=after, limit=page_size)]
+                )
+                if not records:
+                    break
+                edges = [(record["paper_index"], reference) for record in records for reference in record["references"]]
+                sink.write(records, edges)
+                paper_count += len(records)
+                edge_count += len(edges)
+                after = records[-1]["paper_index"]
+                logger.info("Exported %d papers, %d citations", paper_count, edge_count)
+    finally:
+        sink.close()
+    return paper_count, edge_count
+
+
+def _read_csv(path: str) -> Iterator[List[str]]:
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        yield from reader
+
+
+def read_parquet(path: str, batch_size: int) -> Iterator[Dict]:
+    """
+    Yields the rows of a Parquet file as dicts, reading batch_size rows at a time.
+    """
+    pyarrow = _import_pyarrow()
+    for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def import_graph(directory: str, file_format: str = "csv", batch_size: int = 10000) -> None:
+    """
+    Loads node and edge files written by export_graph, batch_size rows per UNWIND transaction.
+    All papers are written before the citations, so the citations always find both of their papers.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format {file_format}, expected one of {FORMATS}")
+    nodes_path, edges_path = file_paths(directory, file_format)
+
+    with GraphWriter(batch_size=batch_size, flush_interval=float("inf")) as writer:
+        if file_format == "csv":
+            for paper_index, title, authors, publication_year, *_ in _read_csv(nodes_path):
+                writer.add_paper(
+                    paper_index,
+                    title=title or None,
+                    authors=authors.split(ARRAY_DELIMITER) if authors else [],
+                    publication_year=int(publication_year) if publication_year else None,
+                )
+            writer.flush()
+            for source, target, *_ in _read_csv(edges_path):
+                writer.add_relation(source, target)
+        else:
+            for paper in read_parquet(nodes_path, batch_size):
+                writer.add_paper(
+                    paper["paper_index"],
+                    title=paper["title"],
+                    authors=paper["authors"] or [],
+                    publication_year=paper["publication_year"],
+                )
+            writer.flush()
+            for edge in read_parquet(edges_path, batch_size):
+                writer.add_relation(edge["source"], edge["target"])
+
+
+if __name__ == "__main__":
+    from crawlMetrics import configure_logging
+
+    parser = argparse.ArgumentParser(description="Exports the citation graph from Neo4j to files, or imports them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("export", help="write the papers and citations to directory")
+    command.add_argument("directory")
+    command.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    command.add_argument("--page-size", type=int, default=10000)
+    command = commands.add_parser("import", help="load the files of an export into Neo4j")
+    command.add_argument("directory")
+    command.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    command.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+    configure_logging()
+    if args.command == "export":
+        papers, citations = export_graph(args.directory, args.format, args.page_size)
+        print(f"Exported {papers} papers and {citations} citations to {args.directory}")
+    else:
+        import_graph(args.directory, args.format, args.batch_size)
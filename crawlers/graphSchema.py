@@ -0,0 +1,167 @@
+"""
+Single Neo4j schema of the citation graph: (:Paper {paper_index})-[:CITES]->(:Paper), where paper_index is the arXiv
+id without its version. This file creates the constraints and indexes idempotently and migrates the data written
+with the legacy (:Paper {id})-[:REFERENCES]->(:Paper) schema or with versioned paper indexes. The migration scans
+every Paper node, so the version it brought the data to is recorded on a (:SchemaVersion) node and it only runs again
+for a newer SCHEMA_VERSION, or explicitly with `python graphSchema.py --migrate`.
+"""
+
+
+import argparse
+import logging
+import threading
+from typing import Optional, Set
+from utils import strip_version
+
+
+logger = logging.getLogger(__name__)
+
+
+PAPER_KEY = "paper_index"
+CITATION_TYPE = "CITES"
+# Version of the data layout, to increase when a new migration is added to migrate_legacy_schema
+SCHEMA_VERSION = 1
+
+SCHEMA_QUERIES = [
+    # The uniqueness constraint is backed by a range index, so MERGE/MATCH on paper_index are index lookups
+    "CREATE CONSTRAINT paper_index_unique IF NOT EXISTS FOR (p:Paper) REQUIRE p.paper_index IS UNIQUE",
+    # Only used to find the nodes of the legacy schema quickly during the migration
+    "CREATE INDEX paper_legacy_id IF NOT EXISTS FOR (p:Paper) ON (p.id)",
+]
+
+SCHEMA_VERSION_QUERY = """
+OPTIONAL MATCH (v:SchemaVersion {name: $name})
+RETURN v.version AS version
+"""
+
+SET_SCHEMA_VERSION_QUERY = """
+MERGE (v:SchemaVersion {name: $name})
+SET v.version = $version
+"""
+
+LEGACY_NODES_QUERY = """
+MATCH (p:Paper)
+WHERE p.id IS NOT NULL AND p.paper_index IS NULL
+RETURN elementId(p) AS element_id, p.id AS key
+LIMIT $limit
+"""
+
+VERSIONED_NODES_QUERY = """
+MATCH (p:Paper)
+WHERE p.paper_index =~ '.*v[0-9]+'
+RETURN elementId(p) AS element_id, p.paper_index AS key
+LIMIT $limit
+"""
+
+# Moves the properties and citations of each legacy node onto the node of its normalized paper index
+FOLD_NODES_QUERY = """
+UNWIND $rows AS row
+MATCH (old:Paper) WHERE elementId(old) = row.element_id
+MERGE (p:Paper {paper_index: row.paper_index})
+SET p.title = coalesce(p.title, old.title),
+    p.authors = coalesce(p.authors, old.authors),
+    p.publication_year = coalesce(p.publication_year, old.publication_year)
+WITH old, p
+CALL {
+    WITH old, p
+    MATCH (old)-[:CITES|REFERENCES]->(target:Paper)
+    WHERE target <> old AND target <> p
+    MERGE (p)-[:CITES]->(target)
+}
+CALL {
+    WITH old, p
+    MATCH (source:Paper)-[:CITES|REFERENCES]->(old)
+    WHERE source <> old AND source <> p
+    MERGE (source)-[:CITES]->(p)
+}
+DETACH DELETE old
+"""
+
+LEGACY_RELATIONS_QUERY = """
+MATCH (p1:Paper)-[r:REFERENCES]->(p2:Paper)
+WITH p1, p2, r LIMIT $limit
+MERGE (p1)-[:CITES]->(p2)
+DELETE r
+RETURN count(*) AS count
+"""
+
+# Databases whose schema is known to be up to date in this process
+_ready_databases: Set[str] = set()
+_schema_lock = threading.Lock()
+
+
+def normalize_paper_index(arxiv_id: str) -> str:
+    """
+    Key of a paper in the graph: its arXiv id without version.
+    """
+    return strip_version(arxiv_id)
+
+
+def _fold_nodes(session, select_query: str, batch_size: int) -> int:
+    folded = 0
+    while True:
+        records = session.execute_read(lambda tx: list(tx.run(select_query, limit=batch_size)))
+        if not records:
+            return folded
+        rows = [
+            {"element_id": record["element_id"], "paper_index": normalize_paper_index(record["key"])}
+            for record in records
+        ]
+        session.execute_write(lambda tx: tx.run(FOLD_NODES_QUERY, rows=rows).consume())
+        folded += len(rows)
+
+
+def migrate_legacy_schema(session, batch_size: int = 1000) -> int:
+    """
+    Rewrites legacy id/REFERENCES data and versioned paper indexes into the current schema, in batches.
+    Returns the number of migrated nodes and relationships. Running it on migrated data does nothing.
+    """
+    migrated = _fold_nodes(session, LEGACY_NODES_QUERY, batch_size)
+    migrated += _fold_nodes(session, VERSIONED_NODES_QUERY, batch_size)
+    while True:
+        count = session.execute_write(lambda tx: tx.run(LEGACY_RELATIONS_QUERY, limit=batch_size).single()["count"])
+        if count == 0:
+            break
+        migrated += count
+    if migrated:
+        logger.info("Migrated %d legacy nodes and relationships to the %s/%s schema", migrated, PAPER_KEY, CITATION_TYPE)
+    return migrated
+
+
+def schema_version(session) -> int:
+    """
+    Version the data of the database was migrated to, 0 if it never was.
+    """
+    record = session.execute_read(lambda tx: tx.run(SCHEMA_VERSION_QUERY, name=PAPER_KEY).single())
+    return record["version"] or 0
+
+
+def ensure_schema(driver, database: Optional[str] = "", migrate: bool = True, force: bool = False) -> None:
+    """
+    Creates the constraints and indexes if they do not exist, and migrates legacy data unless the database
+    already records the current SCHEMA_VERSION (force migrates anyway).
+    Only does the work once per process and database, it is safe to call before every write.
+    """
+    database = database or ""
+    with _schema_lock:
+        if database in _ready_databases and not force:
+            return
+        with driver.session(database=database or None) as session:
+            for query in SCHEMA_QUERIES:
+                session.run(query).consume()
+            if migrate and (force or schema_version(session) < SCHEMA_VERSION):
+                migrate_legacy_schema(session)
+                session.execute_write(
+                    lambda tx: tx.run(SET_SCHEMA_VERSION_QUERY, name=PAPER_KEY, version=SCHEMA_VERSION).consume()
+                )
+        _ready_databases.add(database)
+
+
+if __name__ == "__main__":
+    from graphWriter import get_driver
+    from crawlConfig import get_config
+
+    parser = argparse.ArgumentParser(description="Creates the schema of the citation graph and migrates legacy data.")
+    parser.add_argument("--migrate", action="store_true", help="migrate even if the database records the current version")
+    args = parser.parse_args()
+    ensure_schema(get_driver(), get_config().neo4j_database, force=args.migrate)
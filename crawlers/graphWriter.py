@@ -0,0 +1,230 @@
+"""
+This file owns the Neo4j driver shared by the crawlers and a writer that buffers papers and citation relations
+and writes them in batched UNWIND transactions. The neo4j package is imported and the driver created on first use,
+with the settings of crawlConfig.
+"""
+
+
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from graphSchema import ensure_schema, normalize_paper_index
+from crawlConfig import get_config
+from crawlMetrics import get_metrics
+
+if TYPE_CHECKING:
+    from neo4j import Driver
+
+
+logger = logging.getLogger(__name__)
+
+PAPERS_QUERY = """
+UNWIND $rows AS row
+MERGE (p:Paper {paper_index: row.key})
+SET p += row.properties
+"""
+
+RELATIONS_QUERY = """
+UNWIND $rows AS row
+MATCH (p1:Paper {paper_index: row.source})
+MATCH (p2:Paper {paper_index: row.target})
+MERGE (p1)-[:CITES]->(p2)
+"""
+
+REMOVE_RELATIONS_QUERY = """
+UNWIND $rows AS row
+MATCH (:Paper {paper_index: row.source})-[c:CITES]->(:Paper {paper_index: row.target})
+DELETE c
+"""
+
+# Sources (seeds, methods) are merged with those recorded by earlier jobs
+PAPER_SOURCES_QUERY = """
+UNWIND $rows AS row
+MATCH (p:Paper {paper_index: row.key})
+SET p.sources = [source IN coalesce(p.sources, []) WHERE NOT source IN row.sources] + row.sources
+"""
+
+RELATION_SOURCES_QUERY = """
+UNWIND $rows AS row
+MATCH (:Paper {paper_index: row.source})-[c:CITES]->(:Paper {paper_index: row.target})
+SET c.sources = [source IN coalesce(c.sources, []) WHERE NOT source IN row.sources] + row.sources
+"""
+
+_driver: Optional["Driver"] = None
+_driver_lock = threading.Lock()
+
+
+def get_driver() -> "Driver":
+    """
+    Returns the pooled driver shared by the whole process, created on first use.
+    """
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            from neo4j import GraphDatabase
+
+            config = get_config()
+            _driver = GraphDatabase.driver(
+                config.neo4j_uri,
+                auth=(config.neo4j_user, config.neo4j_password),
+                max_connection_pool_size=config.neo4j_max_connections,
+            )
+        return _driver
+
+
+def close_driver() -> None:
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+class GraphWriter:
+    def __init__(
+        self,
+        batch_size: int = 1000,
+        flush_interval: float = 5.0,
+        database: Optional[str] = None,
+    ):
+        """
+        Buffers papers and relations and writes them once batch_size rows are pending
+        or flush_interval seconds have passed since the last flush.
+        Papers are keyed by their version-less arXiv id, see graphSchema.
+        database defaults to the one of the configuration, see crawlConfig.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.database = (database if database is not None else get_config().neo4j_database) or None
+
+        self.papers: Dict[str, Dict[str, Any]] = {}
+        self.relations: List[Dict[str, str]] = []
+        self.removed_relations: List[Dict[str, str]] = []
+        self.paper_sources: List[Dict[str, Any]] = []
+        self.relation_sources: List[Dict[str, Any]] = []
+        self.rows_written = 0
+        self.write_seconds = 0.0
+        self.last_flush = time.monotonic()
+        self._lock = threading.RLock()
+
+    def add_paper(self, paper_index: str, **properties: Any) -> None:
+        """
+        Buffers a paper, properties are set on the node (e.g. title, authors, publication_year).
+        """
+        with self._lock:
+            self.papers.setdefault(normalize_paper_index(paper_index), {}).update(properties)
+            self._maybe_flush()
+            get_metrics().set_gauge("writer_buffered_rows", self.pending())
+
+    def add_relation(self, source: str, target: str) -> None:
+        """
+        Buffers a citation from source to target. Both papers must be written before or in the same flush.
+        """
+        with self._lock:
+            self.relations.append({"source": normalize_paper_index(source), "target": normalize_paper_index(target)})
+            self._maybe_flush()
+            get_metrics().set_gauge("writer_buffered_rows", self.pending())
+
+    def remove_relation(self, source: str, target: str) -> None:
+        """
+        Buffers the deletion of a citation, e.g. dropped by a new version of the citing paper.
+        """
+        with self._lock:
+            self.removed_relations.append(
+                {"source": normalize_paper_index(source), "target": normalize_paper_index(target)}
+            )
+            self._maybe_flush()
+            get_metrics().set_gauge("writer_buffered_rows", self.pending())
+
+    def add_sources(self, paper_index: str, sources: List[str]) -> None:
+        """
+        Buffers the sources (e.g. seed papers or methods) that reached a paper, added to its sources property.
+        The paper must be written before or in the same flush.
+        """
+        with self._lock:
+            self.paper_sources.append({"key": normalize_paper_index(paper_index), "sources": sources})
+            self._maybe_flush()
+            get_metrics().set_gauge("writer_buffered_rows", self.pending())
+
+    def add_relation_sources(self, source: str, target: str, sources: List[str]) -> None:
+        """
+        Buffers the sources that reached a citation, added to the sources property of the relationship.
+        """
+        with self._lock:
+            self.relation_sources.append(
+                {"source": normalize_paper_index(source), "target": normalize_paper_index(target), "sources": sources}
+            )
+            self._maybe_flush()
+            get_metrics().set_gauge("writer_buffered_rows", self.pending())
+
+    def pending(self) -> int:
+        return (
+            len(self.papers) + len(self.relations) + len(self.removed_relations)
+            + len(self.paper_sources) + len(self.relation_sources)
+        )
+
+    def _maybe_flush(self) -> None:
+        if self.pending() >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except Exception as e:
+                # The rows stay buffered and are retried by the next flush
+                logger.warning("Failed to flush the graph writer: %s", e)
+
+    def _write(self, session, query: str, rows: List[Dict[str, Any]], kind: str) -> None:
+        metrics = get_metrics()
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            with metrics.timer("db_write", kind=kind):
+                session.execute_write(lambda tx: tx.run(query, rows=batch).consume())
+            self.rows_written += len(batch)
+            metrics.increment("db_rows", len(batch), kind=kind)
+
+    def _session(self):
+        driver = get_driver()
+        ensure_schema(driver, self.database)
+        return driver.session(database=self.database)
+
+    def flush(self) -> None:
+        """
+        Writes all buffered papers, then all buffered relations, then deletes the removed relations,
+        then adds the sources of papers and relations.
+        """
+        with self._lock:
+            self.last_flush = time.monotonic()
+            if not self.pending():
+                return
+            papers = [{"key": key, "properties": properties} for key, properties in self.papers.items()]
+
+            # Buffers are only cleared once written: MERGE makes replaying a failed flush harmless
+            start = time.monotonic()
+            with self._session() as session:
+                self._write(session, PAPERS_QUERY, papers, "papers")
+                self._write(session, RELATIONS_QUERY, self.relations, "relations")
+                self._write(session, REMOVE_RELATIONS_QUERY, self.removed_relations, "removed_relations")
+                self._write(session, PAPER_SOURCES_QUERY, self.paper_sources, "paper_sources")
+                self._write(session, RELATION_SOURCES_QUERY, self.relation_sources, "relation_sources")
+            self.write_seconds += time.monotonic() - start
+            self.papers, self.relations, self.removed_relations = {}, [], []
+            self.paper_sources, self.relation_sources = [], []
+            self.last_flush = time.monotonic()
+
+    def rows_per_second(self) -> float:
+        return self.rows_written / self.write_seconds if self.write_seconds > 0 else 0.0
+
+    def close(self) -> None:
+        """
+        Flushes the remaining rows. The shared driver stays open for other writers, see close_driver.
+        """
+        self.flush()
+        logger.info("Graph writer: %s", self)
+
+    def __enter__(self) -> "GraphWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __str__(self) -> str:
+        return f"{self.rows_written} rows written, {self.rows_per_second():.0f} rows/s"
@@ -0,0 +1,276 @@
+"""
+HTTP client shared by the crawlers: pooled keep-alive connections, a token-bucket rate limit per host, retries with
+jittered exponential backoff honoring Retry-After on 429/503, and per-host latency and error counters.
+"""
+
+
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from urllib.parse import urlparse
+from crawlMetrics import get_metrics
+
+if TYPE_CHECKING:
+    import requests
+
+
+logger = logging.getLogger(__name__)
+
+
+# Requests per second and burst size per host. arXiv asks API clients for at most one request every three seconds.
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "export.arxiv.org": (1 / 3, 1),
+    "arxiv.org": (4.0, 4),
+    "paperswithcode.com": (5.0, 5),
+}
+DEFAULT_RATE_LIMIT = (5.0, 5)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        """
+        Allows rate requests per second on average, with bursts of up to burst requests.
+        The rate adapts: it is halved when the server throttles and recovers gradually on success.
+        """
+        self.rate = rate
+        self.max_rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Blocks until a token is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttle(self, seconds: float) -> None:
+        """
+        Halves the rate and drains the bucket so that no request leaves before seconds have passed, e.g. after a 429.
+        """
+        with self._lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = min(self.tokens, -seconds * self.rate)
+            self.updated = time.monotonic()
+
+    def recover(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def resize(self, rate: float, burst: int) -> None:
+        """
+        Changes the nominal rate and burst, keeping the current throttling in proportion.
+        """
+        with self._lock:
+            self.rate = self.rate * rate / self.max_rate
+            self.max_rate = rate
+            self.burst = burst
+            self.tokens = min(self.tokens, burst)
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latency_seconds = 0.0
+
+    def __str__(self) -> str:
+        mean_latency = self.latency_seconds / self.requests if self.requests else 0.0
+        return (
+            f"{self.requests} requests, {self.errors} errors, {self.retries} retries, "
+            f"{self.bytes / 1024 / 1024:.1f} MB, {mean_latency * 1000:.0f} ms mean latency"
+        )
+
+
+def retry_after_seconds(response: "requests.Response") -> Optional[float]:
+    """
+    Parses the Retry-After header, given either in seconds or as an HTTP date.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    def __init__(
+        self,
+        rate_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+        retries: int = 4,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        timeout: float = 30.0,
+        pool_size: int = 16,
+    ):
+        """
+        rate_limits maps a host to (requests per second, burst), retries is the number of retries after the first attempt.
+        The processes crawling together each use a share of the rate limits, see set_share.
+        requests is imported by the first client created, not by the modules importing this one.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.share = 1.0
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.stats: Dict[str, HostStats] = {}
+        self._lock = threading.Lock()
+
+    def _limits(self, host: str) -> Tuple[float, int]:
+        rate, burst = self.rate_limits.get(host, DEFAULT_RATE_LIMIT)
+        return rate * self.share, max(1, int(burst * self.share))
+
+    def set_share(self, share: float) -> None:
+        """
+        Limits this client to share of the rate limit of every host, e.g. 1 / K for each of K processes crawling
+        together, so that the hosts see the rates of DEFAULT_RATE_LIMITS whatever the number of processes.
+        """
+        with self._lock:
+            if share == self.share:
+                return
+            self.share = share
+            for host, bucket in self.buckets.items():
+                bucket.resize(*self._limits(host))
+
+    def _host(self, url: str) -> Tuple[TokenBucket, HostStats]:
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(*self._limits(host))
+                self.stats[host] = HostStats()
+            return self.buckets[host], self.stats[host]
+
+    def _backoff_seconds(self, attempt: int) -> float:
+        # Full jitter, so that parallel workers do not retry in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def get(self, url: str, **kwargs) -> "requests.Response":
+        """
+        Rate-limited GET with retries. Returns the last response, whatever its status,
+        and raises requests.exceptions.RequestException if the last attempt failed on the network.
+        With stream=True the body is not read, and the caller must close the response.
+        """
+        import requests
+
+        bucket, stats = self._host(url)
+        host = urlparse(url).hostname or ""
+        metrics = get_metrics()
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            with metrics.timer("http_wait", host=host):
+                bucket.acquire()
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, **kwargs)
+            except requests.exceptions.RequestException:
+                elapsed = time.monotonic() - start
+                with self._lock:
+                    stats.requests += 1
+                    stats.errors += 1
+                    stats.latency_seconds += elapsed
+                metrics.observe("http_fetch", elapsed, host=host)
+                metrics.increment("http_requests", host=host, status="error")
+                if attempt >= self.retries:
+                    raise
+                wait = self._backoff_seconds(attempt)
+            else:
+                # Streamed bodies are counted by their reader, e.g. processPdf.download_pdf_to_file
+                size = 0 if kwargs.get("stream") else len(response.content)
+                elapsed = time.monotonic() - start
+                with self._lock:
+                    stats.requests += 1
+                    stats.latency_seconds += elapsed
+                    if kwargs.get("stream"):
+                        stats.bytes += int(response.headers.get("Content-Length") or 0)
+                    else:
+                        stats.bytes += size
+                    if response.status_code >= 400:
+                        stats.errors += 1
+                metrics.observe("http_fetch", elapsed, host=host)
+                metrics.increment("http_requests", host=host, status=response.status_code)
+                metrics.increment("http_response_bytes", size, host=host)
+                if response.status_code not in RETRY_STATUSES:
+                    bucket.recover()
+                    return response
+                if attempt >= self.retries:
+                    return response
+                response.close()
+
+                wait = retry_after_seconds(response)
+                if wait is None:
+                    wait = self._backoff_seconds(attempt)
+                else:
+                    wait = min(wait, self.max_backoff) + random.uniform(0, self.backoff)
+                if response.status_code in (429, 503):
+                    # The server asks every worker to slow down, not just this one
+                    bucket.throttle(wait)
+                logger.warning("%s answered %s, retrying in %.1fs", url, response.status_code, wait)
+
+            with self._lock:
+                stats.retries += 1
+            metrics.increment("http_retries", host=host)
+            time.sleep(wait)
+            attempt += 1
+
+    def __str__(self) -> str:
+        with self._lock:
+            return "\n".join(f"{host}: {stats}" for host, stats in self.stats.items())
+
+
+_client: Optional[HttpClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """
+    Returns the client shared by the whole process, so rate limits and connections are shared by every crawler.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def set_client(client: HttpClient) -> None:
+    """
+    Replaces the shared client, e.g. by one with other rate limits.
+    """
+    global _client
+    with _client_lock:
+        _client = client
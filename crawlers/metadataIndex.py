@@ -0,0 +1,186 @@
+"""
+Local index of arXiv metadata built from the public metadata snapshot (the JSON-lines dump published on Kaggle,
+arxiv-metadata-oai-snapshot.json), so the crawlers can look papers up without calling the arXiv API.
+
+Usage: python metadataIndex.py build <snapshot.json[.gz]> [index path]
+       python metadataIndex.py get <arxiv id> [<arxiv id> ...]
+"""
+
+
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from utils import strip_version
+from crawlConfig import get_config
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (
+    arxiv_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    published TEXT NOT NULL,
+    link TEXT NOT NULL,
+    updated TEXT NOT NULL DEFAULT ''
+) WITHOUT ROWID
+"""
+
+COLUMNS = "arxiv_id, title, authors, published, link, updated"
+INSERT_QUERY = f"INSERT OR REPLACE INTO metadata ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)"
+
+
+def snapshot_row(record: dict) -> Tuple[str, str, str, str, str, str]:
+    """
+    Converts a snapshot record to an index row, in the format of the arXiv API (see fetchArticleMetadata.parse_entry):
+    authors as "First Last", published and updated as the ISO dates of the first and last versions, link to the abs
+    page of the last version.
+    """
+    authors = [
+        " ".join(part for part in (first, last, suffix) if part)
+        for last, first, suffix, *_ in record.get("authors_parsed") or []
+    ]
+    versions = record.get("versions") or []
+    published, updated = "0000-00-00T00:00:00Z", ""
+    if versions:
+        published = parsedate_to_datetime(versions[0]["created"]).strftime("%Y-%m-%dT%H:%M:%SZ")
+        updated = parsedate_to_datetime(versions[-1]["created"]).strftime("%Y-%m-%dT%H:%M:%SZ")
+    version = versions[-1]["version"] if versions else ""
+    return (
+        record["id"],
+        record.get("title", "Unknown Title").strip(),
+        json.dumps(authors),
+        published,
+        f"http://arxiv.org/abs/{record['id']}{version}",
+        updated,
+    )
+
+
+def read_snapshot(path: str) -> Iterator[dict]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class MetadataIndex:
+    def __init__(self, path: Optional[str] = None):
+        path = path or get_config().metadata_index_path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(SCHEMA)
+        # Indexes built before updated was stored get an empty one until they are rebuilt
+        if "updated" not in {row[1] for row in self.connection.execute("PRAGMA table_info(metadata)")}:
+            self.connection.execute("ALTER TABLE metadata ADD COLUMN updated TEXT NOT NULL DEFAULT ''")
+            self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def build(self, records: Iterable[dict], batch_size: int = 50000) -> int:
+        """
+        Adds snapshot records to the index, replacing papers already indexed. Returns the number of records.
+        """
+        count = 0
+        batch: List[Tuple[str, str, str, str, str, str]] = []
+        with self._lock:
+            # The index can be rebuilt from the dump, durability is not needed while loading it
+            self.connection.execute("PRAGMA synchronous=OFF")
+            self.connection.execute("PRAGMA journal_mode=OFF")
+            for record in records:
+                batch.append(snapshot_row(record))
+                if len(batch) >= batch_size:
+                    self.connection.executemany(INSERT_QUERY, batch)
+                    count += len(batch)
+                    batch = []
+                    logger.info("Indexed %d papers", count)
+            self.connection.executemany(INSERT_QUERY, batch)
+            count += len(batch)
+            self.connection.commit()
+        return count
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, dict]:
+        """
+        Returns the metadata of the indexed papers among ids, keyed by the ids as given, in the dict shape of
+        fetch_arxiv_metadata. Versioned ids are looked up without their version.
+        """
+        keys = {arxiv_id: strip_version(arxiv_id) for arxiv_id in ids}
+        unique_keys = list(set(keys.values()))
+        rows = {}
+        with self._lock:
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for arxiv_id, title, authors, published, link, updated in self.connection.execute(
+                    f"SELECT {COLUMNS} FROM metadata WHERE arxiv_id IN ({placeholders})", batch
+                ):
+                    rows[arxiv_id] = {
+                        "title": title, "authors": json.loads(authors), "published": published, "updated": updated,
+                        "link": link,
+                    }
+            found = {arxiv_id: rows[key] for arxiv_id, key in keys.items() if key in rows}
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, arxiv_id: str) -> Optional[dict]:
+        return self.get_many([arxiv_id]).get(arxiv_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.connection.execute("SELECT count(*) FROM metadata").fetchone()[0]
+
+    def __str__(self) -> str:
+        return f"metadata index: {self.hits} hits, {self.misses} misses"
+
+
+_default_index: Optional[MetadataIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_index() -> Optional[MetadataIndex]:
+    """
+    Returns the index at ARXIV_METADATA_INDEX, or None if no index has been built.
+    """
+    global _default_index
+    with _default_index_lock:
+        path = get_config().metadata_index_path
+        if _default_index is None and os.path.exists(path):
+            _default_index = MetadataIndex(path)
+        return _default_index
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Local index of the arXiv metadata snapshot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("build", help="index a metadata snapshot")
+    command.add_argument("snapshot", help="arxiv-metadata-oai-snapshot.json, optionally gzipped")
+    command.add_argument("index", nargs="?", help="index file (default: ARXIV_METADATA_INDEX)")
+    command = commands.add_parser("get", help="print the indexed metadata of papers")
+    command.add_argument("arxiv_ids", nargs="+", metavar="arxiv_id")
+    args = parser.parse_args()
+    if args.command == "build":
+        from crawlMetrics import configure_logging
+
+        configure_logging()
+        index = MetadataIndex(args.index)
+        print(f"Indexed {index.build(read_snapshot(args.snapshot))} papers in {index.path}")
+    else:
+        index = get_default_index()
+        if index is None:
+            sys.exit(f"No index at {get_config().metadata_index_path}, build one first")
+        for arxiv_id, metadata in index.get_many(args.arxiv_ids).items():
+            print(arxiv_id, metadata)
@@ -0,0 +1,50 @@
+"""
+SQLite cache of the arXiv id of PapersWithCode papers, so that reruns do not download the paper pages again.
+"""
+
+
+import os
+import sqlite3
+import threading
+from typing import Optional
+from crawlConfig import get_config
+
+
+# Stored for papers that have no arXiv version, so they are not resolved again either
+NO_ARXIV_ID = ""
+
+
+class PaperIdCache:
+    def __init__(self, path: Optional[str] = None):
+        path = path or get_config().paper_id_cache_path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS paper_ids (paper_url TEXT PRIMARY KEY, arxiv_id TEXT NOT NULL)")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, paper_url: str) -> Optional[str]:
+        """
+        Returns the cached arXiv id, NO_ARXIV_ID for papers known to have none, or None if the paper was never resolved.
+        """
+        with self._lock:
+            row = self.connection.execute("SELECT arxiv_id FROM paper_ids WHERE paper_url = ?", (paper_url,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, paper_url: str, arxiv_id: Optional[str]) -> None:
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO paper_ids (paper_url, arxiv_id) VALUES (?, ?)",
+                (paper_url, arxiv_id or NO_ARXIV_ID),
+            )
+            self.connection.commit()
+
+    def __str__(self) -> str:
+        return f"paper id cache: {self.hits} hits, {self.misses} misses"
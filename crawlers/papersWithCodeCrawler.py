@@ -3,31 +3,61 @@ This file contains functions that retrieve all the arXiv papers corresponding to
 """
 
 
-from typing import Set, List, Dict
-import requests
+from typing import Set, List, Dict, Iterable, Iterator, Optional
+import json
+import logging
+import math
 import re
-from bs4 import BeautifulSoup 
-from getReferencesArticles import extract_arxiv_references_from_article
-from processPdf import extract_text_from_pdf
-from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed, ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pdfCache import get_default_cache
+from extractionPipeline import stream_article_references
+from httpClient import get_client
+from paperIdCache import PaperIdCache
+from citationGraph import CitationGraph
+from crawlMetrics import MetricsReporter
+from responseCache import get_default_response_cache
+from fetchArticleMetadata import MAX_BATCH_SIZE, fetch_arxiv_metadata_batch
+from utils import arxiv_version, strip_version
+from crawlConfig import get_config
+
+
+logger = logging.getLogger(__name__)
+
+API_PATH = "/api/internal/papers/"
+ARXIV_URL_PATTERN = re.compile(r"arxiv\.org/(?:abs|pdf)/([a-z\-]+(?:\.[A-Z]{2})?/\d{7}|\d{4}\.\d{4,5})(v\d+)?")
 
 
 def retrieve_arxiv_id(paper_url: str) -> str|None:
     """
     Retrieve the arXiv id of a given paper from the PapersWithCode website. 
     """
-    html = requests.get(f'https://paperswithcode.com{paper_url}')
+    html = get_client().get(f'{get_config().paperswithcode_url}{paper_url}')
+    html.raise_for_status()
     arxiv_id = re.findall(r"https:\/\/arxiv\.org\/pdf\/[a-zA-Z0-9\-]+(?:\.[a-zA-Z0-9\-]+)*\.pdf", html.text)
-    return arxiv_id[0].split("/")[-1].strip(".pdf") if arxiv_id else None
+    return arxiv_id[0].split("/")[-1].removesuffix(".pdf") if arxiv_id else None
+
+
+def arxiv_id_from_api_fields(paper: dict) -> Optional[str]:
+    """
+    Read the arXiv id of a paper from the fields of the API response, without downloading its page.
+    """
+    if paper.get("arxiv_id"):
+        return paper["arxiv_id"]
+    for field in ("url_abs", "url_pdf", "paper_url_abs", "paper_url_pdf"):
+        match = ARXIV_URL_PATTERN.search(paper.get(field) or "")
+        if match:
+            return match.group(1) + (match.group(2) or "")
+    return None
 
 
 def get_method_id_for_api(method_name: str) -> int|None:
     """
     Retrieve the id of a method from the PapersWithCode API
     """
-    html = requests.get(f"https://paperswithcode.com/method/{method_name}")
-    soup = BeautifulSoup(html.text, 'html.parser')
+    from bs4 import BeautifulSoup
+
+    _, html, _ = get_default_response_cache().fetch(f"{get_config().paperswithcode_url}/method/{method_name}")
+    soup = BeautifulSoup(html.decode("utf-8", "replace"), 'html.parser')
     
     # Extract the script tag content
     script_tags = soup.find_all('script')
@@ -42,104 +72,232 @@ def get_method_id_for_api(method_name: str) -> int|None:
                 break
 
     if not method_id:
-        print("Method ID not found in the HTML.")
+        logger.warning("Method ID not found in the HTML of %s", method_name)
     
-    print(f"Extracted Method ID: {method_id}")
+    logger.info("Extracted Method ID: %s", method_id)
 
     return int(method_id) if method_id else None
 
 
+def fetch_api_page(method_id: int, page: int) -> dict:
+    """
+    Fetch one page of the papers of a method from the PapersWithCode API.
+    Pages fetched by previous runs are requested conditionally, see responseCache.
+    """
+    status, body, _ = get_default_response_cache().fetch(
+        get_config().paperswithcode_url + API_PATH, params={"format": "json", "papermethod__method_id": str(method_id), "page": page}
+    )
+    if status >= 400:
+        import requests
+
+        raise requests.HTTPError(f"{status} error fetching page {page} of method {method_id}")
+    return json.loads(body)
+
+
+class IncompleteListing(Exception):
+    pass
+
+
+def iter_api_papers(method_id: int, executor: ThreadPoolExecutor) -> Iterator[dict]:
+    """
+    Yield the papers of a method from the PapersWithCode API.
+    The number of pages is derived from the first page, the other pages are fetched concurrently.
+    A page that failed is fetched once more after the others, then IncompleteListing is raised rather than
+    leaving its papers out of the method.
+    """
+    data = fetch_api_page(method_id, 1)
+    logger.info("%d papers found", data['count'])
+    yield from data['results']
+
+    page_size = len(data['results'])
+    if data['next'] is None or page_size == 0:
+        return
+    page_count = math.ceil(data['count'] / page_size)
+    pages = range(2, page_count + 1)
+    futures = [executor.submit(fetch_api_page, method_id, page) for page in pages]
+    failed_pages = []
+    for page, future in zip(pages, futures):
+        try:
+            yield from future.result()['results']
+        except Exception as e:
+            logger.warning("Failed to fetch page %d of method %s, retrying it last: %s", page, method_id, e)
+            failed_pages.append(page)
+    for page in failed_pages:
+        try:
+            results = fetch_api_page(method_id, page)['results']
+        except Exception as e:
+            raise IncompleteListing(f"Page {page} of the papers of method {method_id} could not be fetched: {e}") from e
+        yield from results
+
+
 def get_paper_urls_from_api_response(method_id: int) -> Set[str]:
     """
-    Retrieve the arXiv ids of the papers corresponding to a method from the PapersWithCode API
+    Retrieve the urls of the papers corresponding to a method from the PapersWithCode API
     """
-    endpoint = f"https://paperswithcode.com/api/internal/papers/?format=json&papermethod__method_id={str(method_id)}"
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        paper_urls = {paper['url'] for paper in iter_api_papers(method_id, executor)}
 
-    response = requests.get(endpoint)
-    response.raise_for_status()  # Raise an error for HTTP response codes >= 400
-    
-    data = response.json()
-    paper_urls = set()
-
-    print(f"{data['count']} papers found" )
-    page_number = 1
-    while True: # Loop through all the pages of the API response
-        print(f"Page {page_number}")
-        for paper in data['results']:
-            paper_urls.add(paper['url'])
-            
-        if data['next'] is None:
-            break
-        else:
-            data = requests.get(data['next']).json()
-            page_number += 1
-
-    print('Paper URLs length:', len(paper_urls))
+    logger.info("Paper URLs length: %d", len(paper_urls))
     return paper_urls
 
 
+def iter_method_arxiv_ids(
+    method_id: int, id_cache: Optional[PaperIdCache] = None, max_workers: int = 8
+) -> Iterator[str]:
+    """
+    Yield the arXiv ids of the papers of a method as soon as they are known.
+    Ids come from the API fields when available, then from the cache of previous runs,
+    and otherwise from the paper pages, downloaded concurrently.
+    """
+    id_cache = id_cache or PaperIdCache()
+    yielded: Set[str] = set()
+    pending: Dict[Future, str] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def resolved(results: Set[Future]) -> Iterator[str]:
+            for future in results:
+                paper_url = pending.pop(future)
+                try:
+                    arxiv_id = future.result()
+                except Exception as e:
+                    logger.warning("Failed to resolve the arXiv id of %s: %s", paper_url, e)
+                    continue
+                id_cache.put(paper_url, arxiv_id)
+                if arxiv_id and arxiv_id not in yielded:
+                    yielded.add(arxiv_id)
+                    yield arxiv_id
+
+        for paper in iter_api_papers(method_id, executor):
+            arxiv_id = arxiv_id_from_api_fields(paper)
+            if arxiv_id is None:
+                arxiv_id = id_cache.get(paper['url'])
+            if arxiv_id is None:
+                pending[executor.submit(retrieve_arxiv_id, paper['url'])] = paper['url']
+            elif arxiv_id and arxiv_id not in yielded:
+                yielded.add(arxiv_id)
+                yield arxiv_id
+            # Hand over the resolutions finished in the meantime
+            done = {future for future in pending if future.done()}
+            yield from resolved(done)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            yield from resolved(done)
+
+    logger.info("%s", id_cache)
+
+
 def scrape_paper_ids_from_method_page(method_name: str) -> List[str]:
     """
     Scrape the arXiv ids of the papers corresponding to a method from the PapersWithCode website
     """
     method_id = get_method_id_for_api(method_name)
-    paper_ids: List[str] = []
     if method_id is None:
-        print('Unable to get method id required for API call')
-        return paper_ids
-    paper_urls = get_paper_urls_from_api_response(method_id)
-    for url in paper_urls:
-        paper_id = retrieve_arxiv_id(url)
-        if paper_id:
-            paper_ids.append(paper_id)
-    return paper_ids
+        logger.warning("Unable to get method id required for API call")
+        return []
+    return list(iter_method_arxiv_ids(method_id))
     
 
+def latest_versions(arxiv_ids: Iterator[str], batch_size: int = MAX_BATCH_SIZE) -> Iterator[str]:
+    """
+    Yield the ids with the version of their current arXiv metadata, looked up in batches of batch_size.
+    Ids whose version is unknown are yielded unchanged. The API is asked directly, the metadata index may be older.
+    """
+    batch: List[str] = []
+    for arxiv_id in arxiv_ids:
+        batch.append(arxiv_id)
+        if len(batch) < batch_size:
+            continue
+        yield from _versioned(batch)
+        batch = []
+    yield from _versioned(batch)
+
+
+def _versioned(arxiv_ids: List[str]) -> Iterator[str]:
+    if not arxiv_ids:
+        return
+    metadata = fetch_arxiv_metadata_batch(arxiv_ids, use_index=False)
+    for arxiv_id in arxiv_ids:
+        version = arxiv_version(metadata[arxiv_id]["link"]) if arxiv_id in metadata else None
+        yield strip_version(arxiv_id) + version if version else arxiv_id
+
+
 # Main function
-def compute_method_graph(method_name: str) -> Dict[str, List[str]]:
+def compute_method_citation_graph(method_name: str, extraction_mode: str = "fast", refresh: bool = False) -> CitationGraph:
+    """
+    Compute the citation graph of the papers corresponding to a method from the PapersWithCode website
+    extraction_mode is one of processPdf.EXTRACTION_MODES.
+    With refresh, papers are extracted by the id of their current version, so a rerun only downloads and parses
+    the new papers and new versions, the others being served by the cache.
+    """
+    return compute_method_citation_graphs([method_name], extraction_mode, refresh)[method_name]
+
+
+def compute_method_citation_graphs(
+    method_names: Iterable[str], extraction_mode: str = "fast", refresh: bool = False
+) -> Dict[str, CitationGraph]:
+    """
+    Compute the citation graphs of several methods in one pass, see compute_method_citation_graph.
+    A paper listed by several methods is downloaded and parsed once, each graph keeps the citations between
+    the papers of its method. Raises IncompleteListing if a page of the papers of a method cannot be fetched,
+    rather than computing a graph of part of them; the papers parsed so far are cached for the next run.
+    """
+    graphs = {method_name: CitationGraph() for method_name in method_names}
+    cache = get_default_cache()
+    from tqdm import tqdm
+
+    def discovered_ids() -> Iterator[str]:
+        seen: Set[str] = set()
+        for method_name, graph in graphs.items():
+            method_id = get_method_id_for_api(method_name)
+            if method_id is None:
+                logger.warning("Unable to get method id required for API call of %s", method_name)
+                continue
+            for paper_id in iter_method_arxiv_ids(method_id):
+                graph.add_node(paper_id)
+                if strip_version(paper_id) not in seen:
+                    seen.add(strip_version(paper_id))
+                    yield paper_id
+
+    paper_ids = discovered_ids()
+    if refresh:
+        paper_ids = latest_versions(paper_ids)
+
+    # PDFs are downloaded by threads and parsed on every core while the papers are still being enumerated
+    references_by_id: Dict[str, List[str]] = {}
+    with MetricsReporter():
+        results = stream_article_references(paper_ids, cache, mode=extraction_mode)
+        for paper_id, references, error in tqdm(results):
+            if error is not None:
+                logger.warning("Error processing paper %s: %s", paper_id, error)
+                continue
+            references_by_id[strip_version(paper_id)] = references
+
+    # References can only be restricted to a method's papers once they are all known
+    for graph in graphs.values():
+        for paper_id in graph.keys():
+            if paper_id in references_by_id:
+                graph.add_references(paper_id, references_by_id[paper_id], known_only=True)
+        logger.info("%s", graph)
+
+    logger.info("%s", cache)
+    logger.info("%s", get_default_response_cache())
+    logger.info("%s", get_client())
+    return graphs
+
+
+def compute_method_graph(method_name: str, extraction_mode: str = "fast", refresh: bool = False) -> Dict[str, List[str]]:
     """
     Compute the graph of papers corresponding to a method from the PapersWithCode website
+    extraction_mode is one of processPdf.EXTRACTION_MODES, see compute_method_citation_graph for refresh.
     """
-    method_id = get_method_id_for_api(method_name)
-    if method_id is None:
-        print('Unable to get method id required for API call')
-        return {}
-    paper_urls = get_paper_urls_from_api_response(method_id)
-    paper_ids: List[str] = [paper_id for paper_id in (retrieve_arxiv_id(paper) for paper in paper_urls) if paper_id is not None]
-    graph: Dict[str, List[str]] = dict.fromkeys(paper_ids, [])
-
-    def process_paper(paper_id: str) -> List[str]:
-        text = extract_text_from_pdf(f"http://arxiv.org/pdf/{paper_id}")
-        references = extract_arxiv_references_from_article(text)
-        return [ref for ref in references if ref in paper_ids]
-
-    # # Parallelize attempt with threads
-    # with ThreadPoolExecutor(max_workers=4) as executor:
-    #     future_to_paper_id = {executor.submit(process_paper, paper_id): paper_id for paper_id in graph}
-    #     for future in tqdm(as_completed(future_to_paper_id), total=len(graph)):
-    #         paper_id = future_to_paper_id[future]
-    #         try:
-    #             graph[paper_id] = future.result()
-    #         except Exception as e:
-    #             print(f"Error processing paper {paper_id}: {e}")
-
-    # # Parallelize attempt with processes
-    # with ProcessPoolExecutor(max_workers=4) as executor:
-    #     future_to_paper_id = {executor.submit(process_paper, paper_id): paper_id for paper_id in graph}
-    #     for future in tqdm(as_completed(future_to_paper_id), total=len(graph)):
-    #         paper_id = future_to_paper_id[future]
-    #         try:
-    #             graph[paper_id] = future.result()
-    #         except Exception as e:
-    #             print(f"Error processing paper {paper_id}: {e}")
-
-
-    for paper_id in tqdm(graph):
-        graph[paper_id] = process_paper(paper_id)
-
-    return graph
+    return compute_method_citation_graph(method_name, extraction_mode, refresh).to_dict()
+
 
 if __name__ == "__main__":
+    from crawlMetrics import configure_logging
+
+    configure_logging()
     # papers_with_code_url = "https://paperswithcode.com/paper/finite-scalar-quantization-vq-vae-made-simple"
     # print(retrieve_arxiv_id(papers_with_code_url))
     # print(get_paper_urls_from_api_response(468))
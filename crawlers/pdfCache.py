@@ -0,0 +1,275 @@
+"""
+On-disk cache of downloaded arXiv PDFs, their extracted text and their reference lists, so that reruns of the
+crawlers skip the download and PDF parsing stages for papers they have already seen.
+"""
+
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+from processPdf import download_pdf_to_file, iter_pdf_text
+from getReferencesArticles import extract_arxiv_references_from_article, extract_arxiv_references_from_pages
+from crawlMetrics import get_metrics
+from crawlConfig import get_config
+
+
+# Bump when the reference extractor changes so cached reference lists are recomputed from the text
+REFERENCES_FORMAT = 2
+
+# Temporary files not written to for this long were left by a crashed writer, see PdfCache.remove_stale_temp_files
+STALE_TEMP_SECONDS = 3600
+
+KINDS = {
+    "pdf": ".pdf",
+    "text": ".txt",
+    "references": f".refs-v{REFERENCES_FORMAT}.json",
+}
+
+
+class PdfCache:
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Opens (or creates) a cache directory bounded to max_bytes with least-recently-used eviction,
+        by default PDF_CACHE_DIR bounded to PDF_CACHE_MAX_MB, see crawlConfig.
+        Entries are keyed by arXiv id including its version, e.g. 1706.03762v7, or the bare id for the latest version.
+        """
+        config = get_config()
+        cache_dir = cache_dir or config.pdf_cache_dir
+        max_bytes = max_bytes if max_bytes is not None else config.pdf_cache_max_mb * 1024 * 1024
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits: Dict[str, int] = {kind: 0 for kind in KINDS}
+        self.misses: Dict[str, int] = {kind: 0 for kind in KINDS}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.remove_stale_temp_files()
+        # Rebuild the LRU order from the access times left by previous runs
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        files = [entry for entry in os.scandir(cache_dir) if entry.is_file() and not entry.name.endswith(".tmp")]
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            self._entries[entry.name] = entry.stat().st_size
+        self.total_bytes = sum(self._entries.values())
+
+    def remove_stale_temp_files(self, max_age: float = STALE_TEMP_SECONDS) -> int:
+        """
+        Deletes the temporary files of writers that crashed, which are outside the size bound, and returns their number.
+        Files written to within max_age seconds may belong to a live writer of another process and are kept.
+        """
+        removed = 0
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if entry.name.endswith(".tmp") and now - entry.stat().st_mtime > max_age:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass  # Renamed or removed by its writer meanwhile
+        return removed
+
+    def _filename(self, arxiv_id: str, kind: str) -> str:
+        # Old-style ids such as hep-th/9901001 contain a slash
+        return arxiv_id.replace("/", "_") + KINDS[kind]
+
+    def _lookup(self, arxiv_id: str, kind: str) -> Optional[str]:
+        """
+        Returns the path of an entry and marks it as recently used, or None on a miss.
+        """
+        filename = self._filename(arxiv_id, kind)
+        path = os.path.join(self.cache_dir, filename)
+        with self._lock:
+            hit = filename in self._entries
+            if hit:
+                self._entries.move_to_end(filename)
+                self.hits[kind] += 1
+            else:
+                self.misses[kind] += 1
+        get_metrics().increment("cache_lookups", kind=kind, result="hit" if hit else "miss")
+        if not hit:
+            return None
+        try:
+            os.utime(path)  # Persist the access for the next run's LRU order
+            return path
+        except OSError:
+            self._forget(filename, kind)
+            return None
+
+    def _forget(self, filename: str, kind: str) -> None:
+        # The file vanished (evicted by another process or deleted by hand): count a miss instead
+        with self._lock:
+            self.total_bytes -= self._entries.pop(filename, 0)
+            self.hits[kind] -= 1
+            self.misses[kind] += 1
+
+    def _read(self, arxiv_id: str, kind: str) -> Optional[bytes]:
+        path = self._lookup(arxiv_id, kind)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            self._forget(os.path.basename(path), kind)
+            return None
+
+    def temp_path(self, arxiv_id: str, kind: str = "pdf") -> str:
+        """
+        A fresh path in the cache directory to write an entry to before it is added with put_pdf_file.
+        """
+        # Thread ids are only unique within a process, and several processes share the cache
+        writer = f"{os.getpid()}-{threading.get_ident()}"
+        return os.path.join(self.cache_dir, f"{self._filename(arxiv_id, kind)}.{writer}.tmp")
+
+    def _write(self, arxiv_id: str, kind: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        tmp_path = self.temp_path(arxiv_id, kind)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        self._add_file(arxiv_id, kind, tmp_path)
+
+    def _add_file(self, arxiv_id: str, kind: str, tmp_path: str) -> None:
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return
+        filename = self._filename(arxiv_id, kind)
+        os.replace(tmp_path, os.path.join(self.cache_dir, filename))  # Atomic, so a crash never leaves a truncated entry
+
+        with self._lock:
+            self.total_bytes -= self._entries.pop(filename, 0)
+            self._entries[filename] = size
+            self.total_bytes += size
+            evicted = []
+            while self.total_bytes > self.max_bytes and self._entries:
+                old_filename, size = self._entries.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(old_filename)
+        for old_filename in evicted:
+            try:
+                os.remove(os.path.join(self.cache_dir, old_filename))
+            except OSError:
+                pass
+
+    def get_pdf(self, arxiv_id: str) -> Optional[bytes]:
+        return self._read(arxiv_id, "pdf")
+
+    def put_pdf(self, arxiv_id: str, data: bytes) -> None:
+        self._write(arxiv_id, "pdf", data)
+
+    def get_pdf_path(self, arxiv_id: str) -> Optional[str]:
+        """
+        Path of a cached PDF, to parse it without reading it into memory.
+        """
+        return self._lookup(arxiv_id, "pdf")
+
+    def put_pdf_file(self, arxiv_id: str, tmp_path: str) -> None:
+        """
+        Moves a downloaded PDF, written to temp_path(arxiv_id), into the cache. It is deleted if it is too large.
+        """
+        self._add_file(arxiv_id, "pdf", tmp_path)
+
+    def get_text(self, arxiv_id: str) -> Optional[str]:
+        data = self._read(arxiv_id, "text")
+        return data.decode("utf-8") if data is not None else None
+
+    def put_text(self, arxiv_id: str, text: str) -> None:
+        self._write(arxiv_id, "text", text.encode("utf-8"))
+
+    def get_references(self, arxiv_id: str) -> Optional[List[str]]:
+        data = self._read(arxiv_id, "references")
+        return json.loads(data) if data is not None else None
+
+    def put_references(self, arxiv_id: str, references: List[str]) -> None:
+        self._write(arxiv_id, "references", json.dumps(references).encode("utf-8"))
+
+    def hit_rate(self) -> float:
+        lookups = sum(self.hits.values()) + sum(self.misses.values())
+        return sum(self.hits.values()) / lookups if lookups else 0.0
+
+    def __str__(self) -> str:
+        counts = ", ".join(f"{kind} {self.hits[kind]}/{self.hits[kind] + self.misses[kind]}" for kind in KINDS)
+        return f"cache hits: {counts} ({self.hit_rate():.0%}), {self.total_bytes / 1024 / 1024:.1f} MB used"
+
+
+_default_cache: Optional[PdfCache] = None
+
+
+def get_default_cache() -> PdfCache:
+    """
+    Returns the cache shared by the crawlers of this process.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PdfCache()
+    return _default_cache
+
+
+def fetch_pdf_file(
+    arxiv_id: str, cache: PdfCache, download: Callable[[str, BinaryIO], int] = download_pdf_to_file
+) -> Tuple[str, bool]:
+    """
+    Returns (path, downloaded): the cached PDF, or a fresh download streamed to a temporary file of the cache.
+    A downloaded file must be handed to cache.put_pdf_file once parsed.
+    """
+    path = cache.get_pdf_path(arxiv_id)
+    if path is not None:
+        return path, False
+    tmp_path = cache.temp_path(arxiv_id)
+    try:
+        with open(tmp_path, "wb") as f:
+            download(f"{get_config().arxiv_pdf_url}/{arxiv_id}", f)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, True
+
+
+def get_cached_article_references(
+    arxiv_id: str,
+    cache: Optional[PdfCache] = None,
+    download: Callable[[str, BinaryIO], int] = download_pdf_to_file,
+    mode: str = "fast",
+) -> List[str]:
+    """
+    Returns the arXiv references of a paper, only downloading and parsing the stages missing from the cache.
+    mode is the PDF extraction mode of processPdf, only the text of "full" extractions is cached.
+    """
+    cache = cache or get_default_cache()
+
+    references = cache.get_references(arxiv_id)
+    if references is not None:
+        return references
+
+    text = cache.get_text(arxiv_id)
+    if text is not None:
+        references = extract_arxiv_references_from_article(text)
+    else:
+        path, downloaded = fetch_pdf_file(arxiv_id, cache, download)
+        try:
+            if mode == "full":
+                text = "\n".join(iter_pdf_text(path, mode)) + "\n"
+                cache.put_text(arxiv_id, text)
+                references = extract_arxiv_references_from_article(text)
+            else:
+                references = extract_arxiv_references_from_pages(iter_pdf_text(path, mode))
+        finally:
+            if downloaded:
+                cache.put_pdf_file(arxiv_id, path)
+
+    cache.put_references(arxiv_id, references)
+    return references
+
+
+if __name__ == "__main__":
+    from crawlMetrics import configure_logging
+
+    configure_logging()
+    cache = get_default_cache()
+    print(get_cached_article_references("1706.03762", cache))
+    print(get_cached_article_references("1706.03762", cache))
+    print(cache)
@@ -0,0 +1,245 @@
+"""
+This file owns the PostgreSQL connection pool of the crawlers and a sink loading the arXiv metadata of the crawled papers
+into the articles table (sql/create_table.sql). Rows are buffered, streamed with COPY FROM STDIN into a temporary
+staging table and upserted into articles on its unique arxiv_id index (sql/add_arxiv_id_index.sql), so a batch of
+papers costs a few statements instead of one INSERT per paper. psycopg2 is imported and the pool created on first use,
+with the settings of crawlConfig.
+"""
+
+
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+from crawlConfig import get_config
+from crawlMetrics import get_metrics
+from crawlState import CrawlState
+from utils import strip_version
+
+if TYPE_CHECKING:
+    from psycopg2.pool import ThreadedConnectionPool
+
+
+logger = logging.getLogger(__name__)
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sql")
+ARTICLE_PDF_URL = "https://arxiv.org/pdf/{}.pdf"
+COLUMNS = ("title", "authors", "year", "arxiv_id", "pdf_url")
+# Unquoted empty CSV fields are NULL, except in these columns where they are empty strings, e.g. a paper without authors
+TEXT_COLUMNS = ("title", "authors", "arxiv_id", "pdf_url")
+# Any constant shared by the processes migrating the same database
+SCHEMA_LOCK_ID = 4172025
+
+STAGING_QUERY = """
+CREATE TEMP TABLE articles_staging (title TEXT, authors TEXT, year INT, arxiv_id TEXT, pdf_url TEXT) ON COMMIT DROP
+"""
+
+COPY_QUERY = (
+    f"COPY articles_staging ({', '.join(COLUMNS)}) FROM STDIN "
+    f"WITH (FORMAT csv, FORCE_NOT_NULL ({', '.join(TEXT_COLUMNS)}))"
+)
+
+# Unchanged rows are left alone, so reloading a crawl does not rewrite the table
+UPSERT_QUERY = """
+INSERT INTO articles (title, authors, year, arxiv_id, pdf_url)
+SELECT title, authors, year, arxiv_id, pdf_url FROM articles_staging
+ON CONFLICT (arxiv_id) DO UPDATE
+SET title = EXCLUDED.title, authors = EXCLUDED.authors, year = EXCLUDED.year, pdf_url = EXCLUDED.pdf_url
+WHERE (articles.title, articles.authors, articles.year, articles.pdf_url)
+    IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.authors, EXCLUDED.year, EXCLUDED.pdf_url)
+"""
+
+_pool: Optional["ThreadedConnectionPool"] = None
+_pool_lock = threading.Lock()
+_schema_ready = False
+
+
+def get_pool() -> "ThreadedConnectionPool":
+    """
+    Returns the connection pool shared by the whole process, created on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from psycopg2.pool import ThreadedConnectionPool
+
+            config = get_config()
+            _pool = ThreadedConnectionPool(1, config.postgres_max_connections, config.postgres_dsn)
+        return _pool
+
+
+def close_pool() -> None:
+    global _pool, _schema_ready
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _schema_ready = False
+
+
+def read_sql(name: str) -> str:
+    with open(os.path.join(SQL_DIR, name)) as f:
+        return f.read()
+
+
+def ensure_schema(connection) -> None:
+    """
+    Creates the articles table and runs the arxiv_id index migration if they are missing, once per process.
+    Concurrent processes are serialized by an advisory lock.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with connection, connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+        cursor.execute("SELECT to_regclass('articles'), to_regclass('articles_arxiv_id')")
+        table, index = cursor.fetchone()
+        if table is None:
+            logger.info("Creating the articles table")
+            cursor.execute(read_sql("create_table.sql"))
+        if index is None:
+            logger.info("Adding the unique arxiv_id index to articles")
+            cursor.execute(read_sql("add_arxiv_id_index.sql"))
+    _schema_ready = True
+
+
+def _text(value: str) -> str:
+    # PostgreSQL text cannot hold NUL characters, one would fail the whole COPY
+    return value.replace("\x00", "")
+
+
+def article_row(arxiv_id: str, metadata: dict) -> Tuple:
+    """
+    Formats the arXiv metadata of a paper (see fetchArticleMetadata) as a row of the articles table,
+    keyed by its version-less arXiv id like the Paper nodes.
+    """
+    arxiv_id = strip_version(arxiv_id)
+    year = int(metadata.get("published", "0000")[:4] or 0)
+    return (
+        _text(metadata.get("title", "Unknown Title")),
+        _text(", ".join(metadata.get("authors", []))),
+        year or None,
+        arxiv_id,
+        ARTICLE_PDF_URL.format(arxiv_id),
+    )
+
+
+def to_csv(rows: List[Tuple]) -> io.StringIO:
+    """
+    Serializes rows for COPY in CSV format, None being written as an empty unquoted field, i.e. NULL in the columns
+    outside TEXT_COLUMNS.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+class PostgresSink:
+    def __init__(self, batch_size: int = 10000):
+        """
+        Buffers the articles and loads them once batch_size rows are pending, or on flush.
+        An article added several times before a flush is loaded once, with its last metadata.
+        """
+        self.batch_size = batch_size
+        self.articles: Dict[str, Tuple] = {}
+        self.rows_written = 0
+        self.write_seconds = 0.0
+        self._lock = threading.RLock()
+
+    def add_article(self, arxiv_id: str, metadata: dict) -> None:
+        with self._lock:
+            row = article_row(arxiv_id, metadata)
+            self.articles[row[3]] = row
+            if len(self.articles) >= self.batch_size:
+                try:
+                    self.flush()
+                except Exception as e:
+                    # The rows stay buffered and are retried by the next flush
+                    logger.warning("Failed to flush the PostgreSQL sink: %s", e)
+
+    def pending(self) -> int:
+        return len(self.articles)
+
+    def _write(self, cursor, rows: List[Tuple]) -> None:
+        metrics = get_metrics()
+        cursor.execute(STAGING_QUERY)
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            with metrics.timer("db_write", kind="articles"):
+                cursor.copy_expert(COPY_QUERY, to_csv(batch))
+                cursor.execute(UPSERT_QUERY)
+                cursor.execute("TRUNCATE articles_staging")
+            metrics.increment("db_rows", len(batch), kind="articles")
+
+    def flush(self) -> None:
+        """
+        Loads all buffered articles in one transaction.
+        """
+        with self._lock:
+            if not self.articles:
+                return
+            rows = list(self.articles.values())
+            pool = get_pool()
+            connection = pool.getconn()
+            start = time.monotonic()
+            try:
+                ensure_schema(connection)
+                with connection, connection.cursor() as cursor:
+                    self._write(cursor, rows)
+            finally:
+                # Broken connections are dropped from the pool
+                pool.putconn(connection, close=bool(connection.closed))
+            self.write_seconds += time.monotonic() - start
+            self.rows_written += len(rows)
+            self.articles = {}
+
+    def rows_per_second(self) -> float:
+        return self.rows_written / self.write_seconds if self.write_seconds > 0 else 0.0
+
+    def close(self) -> None:
+        """
+        Flushes the remaining rows. The shared pool stays open for other sinks, see close_pool.
+        """
+        self.flush()
+        logger.info("PostgreSQL sink: %s", self)
+
+    def __enter__(self) -> "PostgresSink":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __str__(self) -> str:
+        return f"{self.rows_written} articles written, {self.rows_per_second():.0f} rows/s"
+
+
+def load_articles(articles: Iterable[Tuple[str, dict]], batch_size: int = 10000) -> int:
+    """
+    Loads (arXiv id, metadata) pairs into the articles table and returns their number.
+    """
+    count = 0
+    with PostgresSink(batch_size) as sink:
+        for arxiv_id, metadata in articles:
+            sink.add_article(arxiv_id, metadata)
+            count += 1
+    return count
+
+
+def load_crawl_state(state: CrawlState, batch_size: int = 10000) -> int:
+    """
+    Loads the metadata of the papers written by a crawl, read from its state file, see crawlState.
+    """
+    return load_articles(state.iter_written(page_size=batch_size), batch_size)
+
+
+if __name__ == "__main__":
+    import sys
+    from crawlMetrics import configure_logging
+
+    configure_logging()
+    crawl_state = CrawlState(sys.argv[1] if len(sys.argv) > 1 else os.path.join(".cache", "crawls", "1805.08355.sqlite"))
+    print(f"{load_crawl_state(crawl_state)} articles loaded")
@@ -1,46 +1,135 @@
 """
-This is a crawler that starts from a given article on arXiv and recursively crawls its references until a maximum 
+This is a crawler that starts from a given article on arXiv and crawls its references breadth-first until a maximum
 depth is reached, whilst saving all metadata and citation relationships to the Neo4j database.
+With a priority, the frontier is crawled best-first instead (e.g. most cited by the crawled papers first) until a budget
+of papers, downloaded bytes or time is spent.
+A refresh rerun of a finished crawl only re-extracts the papers with a new arXiv version and applies the resulting
+node and citation changes to the database.
+The metadata of the written papers can also be loaded into the PostgreSQL articles table, see postgresSink.
 """
 
 
-from processPdf import extract_text_from_pdf
-from getReferencesArticles import extract_arxiv_references_from_article
-from fetchArticleMetadata import fetch_arxiv_metadata
-from saveToGraphDb import add_paper_to_db, add_relation_to_db
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import takewhile
+from typing import BinaryIO, Dict, List, Optional, Set
+from processPdf import download_pdf_to_file
+from pdfCache import PdfCache, get_default_cache
+from extractionPipeline import stream_article_references
+from fetchArticleMetadata import fetch_arxiv_metadata_batch, is_newer_version, MAX_BATCH_SIZE
+from metadataIndex import MetadataIndex
+from graphWriter import GraphWriter
+from postgresSink import PostgresSink
+from crawlConcurrency import CrawlBudget, HostLimiter, ThroughputCounter
+from crawlState import CrawlState
+from citationGraph import CitationGraph
+from visitedSet import VisitedSet
+from httpClient import get_client
+from crawlMetrics import MetricsReporter, configure_logging, get_metrics
+from utils import arxiv_version
+from crawlConfig import get_config
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
 
 
 class RecursiveCrawler:
-    def __init__(self, initial_id: str, max_depth: int):
+    def __init__(
+        self,
+        initial_id: str,
+        max_depth: int,
+        max_workers: int = 8,
+        host_limits: Optional[Dict[str, int]] = None,
+        cache: Optional[PdfCache] = None,
+        parse_workers: Optional[int] = None,
+        extraction_mode: str = "fast",
+        writer: Optional[GraphWriter] = None,
+        state_path: Optional[str] = None,
+        priority: Optional[str] = None,
+        budget: Optional[CrawlBudget] = None,
+        batch_size: Optional[int] = None,
+        level_chunk_size: int = 10000,
+        metadata_index: Optional[MetadataIndex] = None,
+        state: Optional[CrawlState] = None,
+        refresh: bool = False,
+        article_sink: Optional[PostgresSink] = None,
+    ):
         """
         Initializes the crawler with starting article ID, max depth, and a set of visited papers.
+        max_workers is the size of the thread pool, host_limits caps the requests in flight per host.
+        cache stores downloaded PDFs, their text and references across runs.
+        parse_workers is the size of the PDF parsing process pool (defaults to the number of cores).
+        extraction_mode is one of processPdf.EXTRACTION_MODES.
+        writer buffers the papers and relations written to Neo4j.
+        state_path is the SQLite file holding the crawl progress, one per initial article by default.
+        priority is one of crawlState.PRIORITIES to crawl best-first in batches of batch_size papers
+        (default 4 * max_workers) instead of level by level. budget bounds the crawl in both modes.
+        level_chunk_size caps the papers of a level held in memory, larger levels are crawled in chunks.
+        metadata_index is the local arXiv metadata looked up before the API, see metadataIndex (default index if None).
+        state replaces the state file at state_path, e.g. a crawlCoordinator.SharedCrawlState shared with other workers.
+        refresh checks the papers written by previous runs for new versions before crawling, see refresh_versions.
+        article_sink also receives the metadata of the papers written to Neo4j, e.g. a postgresSink.PostgresSink.
+        """
+        self.initial_id = initial_id
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.host_limiter = HostLimiter(host_limits)
+        self.throughput = ThroughputCounter()
+        self.cache = cache or get_default_cache()
+        self.parse_workers = parse_workers
+        self.extraction_mode = extraction_mode
+        self.writer = writer or GraphWriter()
+        if state is None:
+            if state_path is None:
+                state_dir = get_config().crawl_state_dir
+                os.makedirs(state_dir, exist_ok=True)
+                state_path = os.path.join(state_dir, f"{initial_id.replace('/', '_')}.sqlite")
+            state = CrawlState(state_path)
+        self.state = state
+        self.visited_ids = VisitedSet(self.state)
+        self.failed_ids: Set[str] = set()
+        self.priority = priority
+        self.budget = budget or CrawlBudget()
+        self.batch_size = batch_size or 4 * max_workers
+        self.level_chunk_size = level_chunk_size
+        self.metadata_index = metadata_index
+        self.refresh = refresh
+        self.article_sink = article_sink
+
+    def download_pdf(self, pdf_url: str, f: BinaryIO) -> int:
+        """
+        Streams a PDF to the file f, respecting the host cap.
         """
-        self.initial_id = initial_id  
-        self.max_depth = max_depth  
-        self.visited_ids = set() 
+        logger.debug("Downloading PDF %s", pdf_url)
+        with self.host_limiter.limit(pdf_url):
+            size = download_pdf_to_file(pdf_url, f)
+        self.budget.record_bytes(size)
+        return size
 
-    def get_article_references(self, article_id: str) -> list:
+    def fetch_metadata(self, article_ids: List[str], use_index: bool = True) -> Dict[str, dict]:
         """
-        Extracts references from the ArXiv PDF.
+        Fetches the arXiv metadata of a batch of papers from the local index, or the API while respecting its host cap.
+        Without use_index, only the API is asked.
         """
-        pdf_url = f"http://arxiv.org/pdf/{article_id}.pdf"
-        print(f"Downloading PDF for {article_id}...")
-        text = extract_text_from_pdf(pdf_url)
-        references = extract_arxiv_references_from_article(text)
-        print(f"Extracted references for {article_id}: {references}")
-        return references
-    
+        logger.debug("Fetching metadata for %d articles", len(article_ids))
+        with self.host_limiter.limit(get_config().arxiv_api_url):
+            return fetch_arxiv_metadata_batch(article_ids, index=self.metadata_index, use_index=use_index)
+
     def format_metadata_for_db(self, metadata: dict, article_id: str) -> dict:
         """
-        Formats metadata to match the arguments required by add_paper_to_db.
+        Formats metadata to match the properties of a Paper node.
         """
         title = metadata.get("title", "Unknown Title")
         authors = metadata.get("authors", [])
-        publication_year = int(metadata.get("published", "0000").split("-")[0])  
-        paper_index = article_id  
-        
-        print(f"Formatted metadata for {article_id}: title={title}, authors={authors}, year={publication_year}, paper_index={paper_index}")
-        
+        publication_year = int(metadata.get("published", "0000").split("-")[0])
+        paper_index = article_id
+
+        logger.debug(
+            "Formatted metadata for %s: title=%s, authors=%s, year=%s, paper_index=%s",
+            article_id, title, authors, publication_year, paper_index,
+        )
+
         return {
             "title": title,
             "authors": authors,
@@ -48,56 +137,268 @@ class RecursiveCrawler:
             "paper_index": paper_index
         }
 
-    def crawl_article(self, article_id: str, depth: int):
+    def process_article(self, article_id: str, depth: int, metadata: dict) -> None:
         """
-        Recursively crawls an article, adding it to the graph and exploring its references.
+        Queues one article for the database. Runs in a worker thread.
         """
-        if depth > self.max_depth:
-            print(f"Reached maximum depth for {article_id}")
-            return
-    
-        if article_id in self.visited_ids:
-            print(f"Already visited {article_id}, skipping...")
+        logger.debug("Crawling article %s at depth %d", article_id, depth)
+
+        # Format the metadata
+        formatted_metadata = self.format_metadata_for_db(metadata, article_id)
+
+        # Add paper to database
+        logger.debug("Saving paper to database: %s", formatted_metadata)
+        self.writer.add_paper(
+            formatted_metadata["paper_index"],
+            title=formatted_metadata["title"],
+            authors=formatted_metadata["authors"],
+            publication_year=formatted_metadata["publication_year"]
+        )
+
+    def refresh_versions(self, batch_size: int = MAX_BATCH_SIZE) -> int:
+        """
+        Fetches the current metadata of the papers written by previous runs with batched API calls, bypassing the
+        metadata index whose snapshot predates the new versions, and queues the ones with a new version for extraction, and for writing if their node properties changed.
+        Papers are extracted by versioned id, so only new versions are downloaded and parsed. Returns their number.
+        """
+        checked, changed, rewritten = 0, 0, 0
+        written = self.state.iter_written(batch_size)
+        while True:
+            batch = [paper for _, paper in zip(range(batch_size), written)]
+            if not batch:
+                break
+            try:
+                latest = self.fetch_metadata([article_id for article_id, _ in batch], use_index=False)
+            except Exception as e:
+                logger.warning("Error fetching metadata for %d articles, not refreshed: %s", len(batch), e)
+                continue
+            new_versions: Dict[str, dict] = {}
+            rewrite: Set[str] = set()
+            for article_id, metadata in batch:
+                current = latest.get(article_id)
+                if current is None or not is_newer_version(metadata, current):
+                    continue
+                new_versions[article_id] = current
+                if self.format_metadata_for_db(current, article_id) != self.format_metadata_for_db(metadata, article_id):
+                    rewrite.add(article_id)
+            self.state.requeue_changed(new_versions, rewrite)
+            checked += len(batch)
+            changed += len(new_versions)
+            rewritten += len(rewrite)
+        self.state.checkpoint()
+        get_metrics().increment("papers_refreshed", changed)
+        logger.info("Refresh: %d of %d papers have a new version, %d with new metadata", changed, checked, rewritten)
+        return changed
+
+    def save_level(self, level: List[str], progress: Dict[str, dict], executor: ThreadPoolExecutor) -> None:
+        """
+        Fetches the missing metadata of a level (or batch) and writes its papers that are not in the database yet.
+        """
+        missing_metadata = [level_id for level_id in level if progress[level_id]["metadata"] is None]
+        if missing_metadata:
+            # Resolve the metadata of the whole level in batched API calls
+            try:
+                metadata = self.fetch_metadata(missing_metadata)
+                self.state.set_metadata(metadata)
+                for level_id in missing_metadata:
+                    if level_id in metadata:
+                        progress[level_id]["metadata"] = metadata[level_id]
+                    else:
+                        self.state.record_failure(level_id, Exception("No metadata returned"))
+                        self.failed_ids.add(level_id)
+            except Exception as e:
+                logger.warning("Error fetching metadata for %d articles: %s", len(missing_metadata), e)
+                for level_id in missing_metadata:
+                    self.state.record_failure(level_id, e)
+                    self.failed_ids.add(level_id)
+
+        to_write = [
+            level_id for level_id in level
+            if progress[level_id]["metadata"] is not None and not progress[level_id]["written"]
+        ]
+        futures = {
+            executor.submit(self.process_article, level_id, progress[level_id]["depth"], progress[level_id]["metadata"]): level_id
+            for level_id in to_write
+        }
+        queued_ids: List[str] = []
+        for future in as_completed(futures):
+            level_id = futures[future]
+            try:
+                future.result()
+                queued_ids.append(level_id)
+            except Exception as e:
+                logger.warning("Error processing %s: %s", level_id, e)
+                self.state.record_failure(level_id, e)
+                self.failed_ids.add(level_id)
+
+        try:
+            self.writer.flush()
+        except Exception as e:
+            logger.warning("Error writing %d articles to the database: %s", len(queued_ids), e)
+            for level_id in queued_ids:
+                self.state.record_failure(level_id, e)
+                self.failed_ids.add(level_id)
             return
+        self.state.mark_written(queued_ids)
+        for level_id in queued_ids:
+            progress[level_id]["written"] = True
+        self.throughput.record(len(queued_ids))
+        self.budget.record_papers(len(queued_ids))
+        get_metrics().increment("papers_written", len(queued_ids))
+        if self.article_sink is not None:
+            self.save_articles(queued_ids, progress)
 
-        # Mark the article as visited **before** any recursion
-        self.visited_ids.add(article_id)
-        
-        print(f"Crawling article {article_id} at depth {depth}...")
+    def save_articles(self, article_ids: List[str], progress: Dict[str, dict]) -> None:
+        """
+        Loads the metadata of the papers just written into the article sink. The graph stays the reference:
+        a failed load is only logged, its rows stay buffered and are retried by the next flush.
+        """
+        for article_id in article_ids:
+            self.article_sink.add_article(article_id, progress[article_id]["metadata"])
+        try:
+            self.article_sink.flush()
+        except Exception as e:
+            logger.warning("Error loading %d articles into the article sink: %s", len(article_ids), e)
 
+    def extract_level_references(self, level: List[str], progress: Dict[str, dict], parse_executor: ProcessPoolExecutor) -> None:
+        """
+        Extracts the references of the written papers of a level (or batch) above the maximum depth
+        and adds the new ones to the frontier. No new download is started once the time or bytes budget is spent,
+        the papers left are extracted by the next run.
+        """
+        to_extract = [
+            level_id for level_id in level
+            if progress[level_id]["written"] and progress[level_id]["references"] is None
+            and progress[level_id]["depth"] < self.max_depth
+        ]
+        # Extracted by versioned id when known: cache entries of a version never go stale, see PdfCache
+        versioned_ids = {}
+        for level_id in to_extract:
+            version = arxiv_version(progress[level_id]["metadata"].get("link", ""))
+            versioned_ids[level_id + version if version and not arxiv_version(level_id) else level_id] = level_id
+        results = stream_article_references(
+            takewhile(lambda _: not self.budget.exhausted(count_papers=False), list(versioned_ids)),
+            self.cache,
+            download_workers=self.max_workers,
+            download=self.download_pdf,
+            parse_executor=parse_executor,
+            mode=self.extraction_mode,
+        )
+        for versioned_id, references, error in results:
+            article_id = versioned_ids[versioned_id]
+            if error is not None:
+                logger.warning("Error extracting references of %s: %s", article_id, error)
+                self.state.record_failure(article_id, error)
+                self.failed_ids.add(article_id)
+                continue
+            logger.debug("Extracted references for %s: %s", article_id, references)
+            self.state.set_references(article_id, references)
+            self.visited_ids.add(references, progress[article_id]["depth"] + 1)
+
+    def save_relations(self) -> None:
+        """
+        Writes the citation relationships whose two papers are in the database, and deletes the removed ones.
+        Relations are read, written and marked one page at a time, so memory does not grow with the crawl.
+        """
         try:
-            # Get metadata for the paper
-            metadata = fetch_arxiv_metadata(f"id:{article_id}")
-            print(f"Fetched metadata for {article_id}: {metadata}")
-        
-            # Format the metadata
-            formatted_metadata = self.format_metadata_for_db(metadata, article_id)
-            print(f"Formatted metadata: {formatted_metadata}")
-        
-            # Add paper to database
-            print(f"Saving paper to database: {formatted_metadata}")
-            add_paper_to_db(
-                title=formatted_metadata["title"],
-                authors=formatted_metadata["authors"],
-                paper_index=formatted_metadata["paper_index"],
-                publication_year=formatted_metadata["publication_year"]
-            )
-
-            # Get references from the PDF
-            if depth < self.max_depth:  
-                references = self.get_article_references(article_id)
-                print(f"References for {article_id}: {references}")
-            
-                # Add relationships and recursively crawl references
-                for ref_id in references:
-                    print(f"Adding relationship: {article_id} -> {ref_id}")
-                    add_relation_to_db(article_id, ref_id)
-                    self.crawl_article(ref_id, depth + 1)
-                    
+            for relations in self.state.pending_relations():
+                for article_id, ref_id in relations:
+                    logger.debug("Adding relationship: %s -> %s", article_id, ref_id)
+                    self.writer.add_relation(article_id, ref_id)
+                self.writer.flush()
+                self.state.mark_relations_written(relations)
+            for removed in self.state.removed_relations():
+                for article_id, ref_id in removed:
+                    logger.debug("Removing relationship: %s -> %s", article_id, ref_id)
+                    self.writer.remove_relation(article_id, ref_id)
+                self.writer.flush()
+                self.state.delete_relations(removed)
         except Exception as e:
-            print(f"Error processing {article_id}: {e}")
+            logger.warning("Error writing relationships, will retry on the next level: %s", e)
+
+    def citation_graph(self) -> CitationGraph:
+        """
+        Returns the citations found so far by this crawl, for offline analysis with graphAnalytics.
+        """
+        graph = CitationGraph()
+        graph.add_node(self.initial_id)
+        for article_id, ref_id in self.state.relations():
+            graph.add_edge(article_id, ref_id)
+        return graph
+
+    def crawl_article(self, article_id: str, depth: int = 0):
+        """
+        Crawls an article and its references breadth-first, one depth level at a time, or best-first by priority.
+        All the articles of a level or batch are processed concurrently by the worker pool.
+        Progress is checkpointed to the state file, so a restarted crawl resumes where it stopped.
+        Per-stage metrics are summarized in the log and written to CRAWL_METRICS_FILE periodically, see crawlMetrics.
+        """
+        self.visited_ids.add([article_id], depth)
+        self.crawl()
+
+    def crawl(self) -> None:
+        """
+        Crawls the frontier of the state until it is complete or the budget is spent, see crawl_article.
+        """
+        if self.refresh:
+            self.refresh_versions()
+        logger.info("Starting crawl: %s", self.state.summary(self.max_depth))
+        metrics = get_metrics()
+
+        with MetricsReporter(metrics), ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                ProcessPoolExecutor(max_workers=self.parse_workers) as parse_executor:
+            while True:
+                exhausted = self.budget.exhausted()
+                if exhausted:
+                    logger.info("Stopping crawl, budget spent: %s", exhausted)
+                    break
+                metrics.set_gauge("frontier_size", self.state.count_unfinished(self.max_depth))
+                # Papers that failed in this run are left to the next run
+                if self.priority is None:
+                    # A chunk never holds more papers than the budget has left
+                    limit = self.level_chunk_size
+                    if self.budget.remaining_papers() is not None:
+                        limit = min(limit, self.budget.remaining_papers())
+                    depth, level = self.state.next_level(self.max_depth, self.failed_ids, limit)
+                    description = f"depth {depth}"
+                else:
+                    size = self.batch_size
+                    if self.budget.remaining_papers() is not None:
+                        size = min(size, self.budget.remaining_papers())
+                    level = self.state.next_batch(self.priority, size, self.max_depth, self.failed_ids)
+                    description = f"{self.priority} batch"
+                if not level:
+                    break
+                logger.info("Crawling %d articles at %s", len(level), description)
+
+                progress = self.state.get_progress(level)
+                self.save_level(level, progress, executor)
+                self.extract_level_references(level, progress, parse_executor)
+                self.save_relations()
+                self.state.checkpoint()
+                logger.info(
+                    "Finished %s: %s, %s, %s", description, self.throughput, self.budget, self.state.summary(self.max_depth)
+                )
+
+            # Papers written last, e.g. by other workers sharing the state, complete relations of earlier levels
+            self.save_relations()
+            self.writer.close()
+            if self.article_sink is not None:
+                try:
+                    self.article_sink.close()
+                except Exception as e:
+                    logger.warning(
+                        "Error loading the last %d articles into the article sink: %s", self.article_sink.pending(), e
+                    )
+            self.state.checkpoint()
+            metrics.set_gauge("frontier_size", self.state.count_unfinished(self.max_depth))
+        logger.info("Crawl finished: %s, %s, %s", self.throughput, self.cache, self.visited_ids)
+        logger.info("%s", get_client())
+        if self.failed_ids:
+            logger.warning("%d articles failed and will be retried on the next run", len(self.failed_ids))
 
 
 if __name__ == "__main__":
+    configure_logging()
     crawler = RecursiveCrawler(initial_id="1805.08355", max_depth=2)
-    crawler.crawl_article(crawler.initial_id, 0)
\ No newline at end of file
+    crawler.crawl_article(crawler.initial_id, 0)
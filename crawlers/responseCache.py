@@ -0,0 +1,111 @@
+"""
+SQLite cache of HTTP responses with their validators (ETag, Last-Modified) and a content hash, so that reruns of the
+crawlers fetch listing pages with conditional GETs and can tell whether a page changed since the previous run.
+"""
+
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+from urllib.parse import urlencode
+from httpClient import get_client
+from crawlMetrics import get_metrics
+from crawlConfig import get_config
+
+
+class ResponseCache:
+    def __init__(self, path: Optional[str] = None):
+        path = path or get_config().response_cache_path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT NOT NULL,
+                body BLOB NOT NULL,
+                fetched REAL NOT NULL
+            )
+        """)
+        self.results = {"not_modified": 0, "unchanged": 0, "changed": 0}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Tuple[Optional[str], Optional[str], str, bytes]]:
+        """
+        Returns the stored (etag, last_modified, content_hash, body) of a url, or None if it was never fetched.
+        """
+        with self._lock:
+            return self.connection.execute(
+                "SELECT etag, last_modified, content_hash, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], content_hash: str, body: bytes) -> None:
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, content_hash, body, fetched) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, body, time.time()),
+            )
+            self.connection.commit()
+
+    def fetch(self, url: str, params: Optional[dict] = None) -> Tuple[int, bytes, bool]:
+        """
+        GETs a url with the shared HTTP client, conditionally if it was fetched before.
+        Returns (status, body, changed): a 304 returns the stored body as a 200, and changed is False when the body
+        is the stored one, by the validators or by its content hash for servers that send none.
+        Responses other than 200 are returned as they are and not stored.
+        """
+        key = f"{url}?{urlencode(params)}" if params else url
+        stored = self.get(key)
+        headers = {}
+        if stored is not None:
+            etag, last_modified, _, _ = stored
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = get_client().get(url, params=params, headers=headers)
+        if response.status_code == 304 and stored is not None:
+            self._record("not_modified")
+            return 200, stored[3], False
+        if response.status_code != 200:
+            return response.status_code, response.content, True
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        changed = stored is None or stored[2] != content_hash
+        self._record("changed" if changed else "unchanged")
+        self.put(key, response.headers.get("ETag"), response.headers.get("Last-Modified"), content_hash, response.content)
+        return 200, response.content, changed
+
+    def _record(self, result: str) -> None:
+        with self._lock:
+            self.results[result] += 1
+        get_metrics().increment("conditional_requests", result=result)
+
+    def __str__(self) -> str:
+        return (
+            f"response cache: {self.results['not_modified']} not modified, {self.results['unchanged']} unchanged, "
+            f"{self.results['changed']} changed"
+        )
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_response_cache() -> ResponseCache:
+    """
+    Returns the response cache shared by the crawlers of this process.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
@@ -1,63 +1,27 @@
 """
 This file contains functions that save paper ids and its references to a Neo4j graph database.
+Papers and references use the same schema as the metadata crawler, see graphSchema.
 """
 
 
-from typing import List, Dict
-from neo4j import GraphDatabase
-from dotenv import load_dotenv
-import os
+from typing import List, Dict, Union
+from citationGraph import CitationGraph
+from graphWriter import GraphWriter, get_driver
+from crawlConfig import get_config
 
 
-
-load_dotenv()
-
-NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
-NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "")  
-
-print(NEO4J_USER)
-
-driver = GraphDatabase.driver(
-    NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD)    
-)
-
-
-def add_graph_to_db(graph: Dict[str, List[str]]) -> None:
+def add_graph_to_db(graph: Union[Dict[str, List[str]], CitationGraph]) -> None:
     """
     Write the whole graph to the database.
     """
-    db_setup_query = "CREATE CONSTRAINT FOR (p:Paper) REQUIRE p.id IS UNIQUE"
-    add_paper_query = "MERGE (p:Paper {id: $paper_id})"
-    add_relationship_query = """
-        MATCH (p1:Paper {id: $paper_id}), (p2:Paper {id: $reference_id})
-        MERGE (p1)-[:REFERENCES]->(p2)
-    """
-
-    with driver.session(database=NEO4J_DATABASE) as session:
-        # Ensure paper_id is unique
-        session.execute_write(lambda tx: tx.run(db_setup_query))
-
-        # Create a node for each paper
+    # The writer ensures paper indexes are unique, then creates the papers and the relationships in batches
+    with GraphWriter() as writer:
         for paper_id in graph.keys():
-            session.execute_write(
-                lambda tx: tx.run(
-                    add_paper_query,
-                    paper_id=paper_id
-                )
-            )
-        # Add the relationships
+            writer.add_paper(paper_id)
         for paper_id, references in graph.items():
             for reference_id in references:
-                session.execute_write(
-                    lambda tx: tx.run(
-                        add_relationship_query,
-                        paper_id=paper_id,
-                        reference_id=reference_id
-                    )
-                )
-          
+                writer.add_relation(paper_id, reference_id)
+
 
 def count_papers() -> int:
     """
@@ -68,7 +32,7 @@ def count_papers() -> int:
     RETURN count(p) as count
     """
 
-    with driver.session(database=NEO4J_DATABASE) as session:
+    with get_driver().session(database=get_config().neo4j_database or None) as session:
        return session.execute_read(
             lambda tx: tx.run(query).single()["count"]
         )
@@ -1,23 +1,13 @@
 """
-This file contains functions to save papers metadata to a Neo4j graph database.
+This file contains functions to save papers metadata to a Neo4j graph database, one paper or relation at a time.
+Use graphWriter.GraphWriter to write many of them in batches.
 """
 
 
 from typing import List
-from neo4j import GraphDatabase
-from dotenv import load_dotenv
-import os
-
-
-
-load_dotenv()
-
-NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
-NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
-NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
-
-# Create the driver
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+from graphWriter import get_driver
+from graphSchema import ensure_schema, normalize_paper_index
+from crawlConfig import get_config
 
 
 def add_paper_to_db(
@@ -33,15 +23,17 @@ def add_paper_to_db(
         p.publication_year = $publication_year
     """
 
-    with driver.session() as session:
-        session.write_transaction(
+    database = get_config().neo4j_database
+    ensure_schema(get_driver(), database)
+    with get_driver().session(database=database or None) as session:
+        session.execute_write(
             lambda tx: tx.run(
                 query,
                 title=title,
-                paper_index=paper_index,
+                paper_index=normalize_paper_index(paper_index),
                 authors=authors,
                 publication_year=publication_year,
-            )
+            ).consume()
         )
 
 
@@ -64,11 +56,15 @@ def add_relation_to_db(paper_index1: str, paper_index2: str) -> None:
     MERGE (p1)-[:CITES]->(p2)
     """
 
-    with driver.session() as session:
-        session.write_transaction(
+    database = get_config().neo4j_database
+    ensure_schema(get_driver(), database)
+    with get_driver().session(database=database or None) as session:
+        session.execute_write(
             lambda tx: tx.run(
-                query, paper_index1=paper_index1, paper_index2=paper_index2
-            )
+                query,
+                paper_index1=normalize_paper_index(paper_index1),
+                paper_index2=normalize_paper_index(paper_index2),
+            ).consume()
         )
 
 
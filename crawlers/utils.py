@@ -1,12 +1,45 @@
+import re
+from typing import Optional
+
+
+def strip_version(arxiv_id: str) -> str:
+    """
+    Removes the version suffix of an arXiv id, e.g. 1706.03762v7 -> 1706.03762.
+    """
+    return re.sub(r"v\d+$", "", arxiv_id.strip())
+
+
+def arxiv_version(arxiv_id: str) -> Optional[str]:
+    """
+    Version suffix of an arXiv id or abs link, e.g. http://arxiv.org/abs/1706.03762v7 -> v7. None if it has none.
+    """
+    match = re.search(r"v\d+$", arxiv_id.strip())
+    return match.group(0) if match else None
+
+
+def arxiv_id_year(arxiv_id: str) -> Optional[int]:
+    """
+    Submission year encoded in an arXiv id: 1706.03762 -> 2017, hep-th/9901001 -> 1999. None if it is not an arXiv id.
+    """
+    match = re.search(r"(?:^|/)(\d{2})(\d{2})[.\d]", arxiv_id.strip())
+    if match is None:
+        return None
+    year = int(match.group(1))
+    # Old-style ids start in 1991, new-style ids in 2007
+    return 1900 + year if year >= 91 else 2000 + year
+
+
 def convert_metadata_for_neo4j(metadata):
     """
     Convert metadata from arXiv to a format suitable for Neo4j.
+    Accepts both the "published" key returned by fetch_arxiv_metadata(_batch) and "publication_date".
     """
+    publication_date = metadata.get("published", metadata.get("publication_date", "0000"))
     return {
         "title": metadata["title"],
         "authors": metadata["authors"],
-        "publication_year": int(metadata["publication_date"].split("-")[0]),
-        "paper_index": metadata["link"].split("/")[-1],
+        "publication_year": int(publication_date.split("-")[0]),
+        "paper_index": strip_version(metadata["link"].split("/abs/")[-1]),
     }
 
 
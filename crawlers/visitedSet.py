@@ -0,0 +1,85 @@
+"""
+Visited set for crawls of millions of papers: a Bloom filter in memory in front of the exact set of papers stored in
+the crawl state. Most lookups of new papers are answered by the filter alone, and memory stays about a byte per paper.
+"""
+
+
+import hashlib
+import math
+from typing import Iterable, List
+from crawlState import CrawlState
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """
+        Bit array sized so that false positives stay below error_rate up to capacity items.
+        """
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> List[int]:
+        # Double hashing: the k positions are derived from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class VisitedSet:
+    def __init__(self, state: CrawlState, capacity: int = 1_000_000, error_rate: float = 0.01):
+        """
+        The exact set is the papers table of state, the filter is rebuilt from it with twice the capacity
+        whenever it fills up, so the false positive rate holds however large the crawl gets.
+        """
+        self.state = state
+        self.error_rate = error_rate
+        self._build(max(capacity, 2 * state.count_papers()))
+
+    def _build(self, capacity: int) -> None:
+        self.bloom = BloomFilter(capacity, self.error_rate)
+        self.count = 0
+        for arxiv_id in self.state.iter_ids():
+            self.bloom.add(arxiv_id)
+            self.count += 1
+
+    def __contains__(self, arxiv_id: str) -> bool:
+        return arxiv_id in self.bloom and bool(self.state.known_ids([arxiv_id]))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def filter_new(self, arxiv_ids: Iterable[str]) -> List[str]:
+        """
+        Returns the papers never seen before, once each and in order. Only filter hits are checked in SQLite.
+        """
+        unique_ids = list(dict.fromkeys(arxiv_ids))
+        known = self.state.known_ids([arxiv_id for arxiv_id in unique_ids if arxiv_id in self.bloom])
+        return [arxiv_id for arxiv_id in unique_ids if arxiv_id not in known]
+
+    def add(self, arxiv_ids: Iterable[str], depth: int) -> List[str]:
+        """
+        Adds the new papers to the frontier at depth and returns them. Known papers found closer move to depth,
+        see CrawlState.add_papers.
+        """
+        unique_ids = list(dict.fromkeys(arxiv_ids))
+        new_ids = self.filter_new(unique_ids)
+        self.state.add_papers(unique_ids, depth)
+        for arxiv_id in new_ids:
+            self.bloom.add(arxiv_id)
+        self.count += len(new_ids)
+        if self.count > self.bloom.capacity:
+            self._build(2 * self.bloom.capacity)
+        return new_ids
+
+    def __str__(self) -> str:
+        return f"visited set: {self.count} papers, {len(self.bloom.bits) / 2**20:.1f} MB filter"
@@ -0,0 +1,8 @@
+-- Makes arxiv_id the key of articles, for the bulk upserts of crawlers/postgresSink.py. Safe to run again.
+-- arXiv titles can be longer than 255 characters
+ALTER TABLE articles ALTER COLUMN title TYPE TEXT;
+
+-- Keeps the most recent row of each arxiv_id inserted more than once
+DELETE FROM articles a USING articles b WHERE a.arxiv_id = b.arxiv_id AND a.id < b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS articles_arxiv_id ON articles (arxiv_id);